@@ -4,9 +4,14 @@ from flask import Flask
 from config import Config
 
 
-def create_app() -> Flask:
-    """Create and configure the Flask application."""
-    app = Flask(__name__, instance_relative_config=True)
+def create_app(instance_path: str | None = None) -> Flask:
+    """Create and configure the Flask application.
+
+    Args:
+        instance_path: Absolute path of the folder for the databases and other
+            files of this instance, `instance/` by default.
+    """
+    app = Flask(__name__, instance_relative_config=True, instance_path=instance_path)
     app.config.from_object(Config)
     app.secret_key = "supersecretkey"  # TODO: Replace with a real secret key
 
@@ -15,6 +20,11 @@ def create_app() -> Flask:
 
     app.config.from_mapping(
         DATABASE=os.path.join(app.instance_path, "flask-chatbot.sqlite"),
+        LIBRARY_INDEX=os.path.join(app.instance_path, "library-index.sqlite"),
+        SIMILARITY_INDEX=os.path.join(app.instance_path, "similarity"),
+        TRACE_STORE=os.path.join(app.instance_path, "traces.sqlite"),
+        PROFILES=os.path.join(app.instance_path, "profiles"),
+        JOBS=os.path.join(app.instance_path, "jobs.sqlite"),
     )
 
     # Configure logging
@@ -22,11 +32,16 @@ def create_app() -> Flask:
         level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s]: %(message)s"
     )
 
-    from . import database
+    from . import clients, connections, database, maintenance
 
     database.init_app(app)
+    connections.init_app(app)
+    clients.init_app(app)
+    maintenance.init_app(app)
 
+    from .debug_routes import bp as debug_bp
     from .routes import bp as routes_bp
 
     app.register_blueprint(routes_bp)
+    app.register_blueprint(debug_bp)
     return app
@@ -1,11 +1,15 @@
-import json
 import logging
 import os
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pprint import pformat
-from typing import Iterable, List, TypeAlias
+from typing import Any, Iterable, List, Literal
 
-from openai import OpenAI
+import openai
+from openai import NOT_GIVEN, OpenAI
 from openai.types.responses import (
     EasyInputMessageParam,
     FunctionToolParam,
@@ -20,138 +24,124 @@ from openai.types.responses import (
 )
 from openai.types.responses.response_input_param import FunctionCallOutput
 
+from app import tools, tracing
+from app.chat_types import (
+    ChatResponse,
+    ChatStreamResponse,
+    ToolCallResponse,
+    ToolProgressResponse,
+    TurnCancelled,
+)
+from app.connections import get_openai_http_client
+from app.jobs import Job, JobQueue
+from app.model_router import FINAL_STAGE, TOOL_STAGE, ModelRouter, Stage
+from app.resilience import Dependency, error_output
 from app.spotify_client import SpotifyClient
+from config import Config
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # enable DEBUG only for this module
 
 
-# passed to each call of `get_chat_completion`.
-@dataclass
-class ChatResponse:
-    # The conversation history.
-    conversation_history: ResponseInputParam
+def _is_retryable(e: BaseException) -> bool:
+    return isinstance(
+        e,
+        (
+            openai.APIConnectionError,  # includes `APITimeoutError`
+            openai.RateLimitError,
+            openai.InternalServerError,
+        ),
+    )
+
+
+def _retry_after(e: BaseException) -> float | None:
+    if isinstance(e, openai.APIStatusError):
+        value = e.response.headers.get("retry-after")
+        if value and value.isdigit():
+            return float(value)
+    return None
+
+
+openai_dependency = Dependency(
+    "OpenAI", is_retryable=_is_retryable, retry_after=_retry_after
+)
+
+
+class LatencyBudgetExceeded(Exception):
+    """Raised when a model took longer than its route's latency budget."""
+
+
+class TurnDeadlineExceeded(Exception):
+    """Raised when a model didn't answer before the deadline of its turn."""
+
+
+@dataclass(frozen=True)
+class TurnBudget:
+    """Bounds a single chat turn, so that a model that keeps calling tools
+    can't hold a worker indefinitely.
+    """
+
+    max_tool_rounds: int = 8
+    # Seconds after which no further tool calls are made. Tool and model
+    # calls running then are stopped.
+    deadline: float = 120.0
+    # Seconds the model then has to answer with what it has.
+    answer_timeout: float = 30.0
 
-    # The response to display in the UI. Can be an error.
-    response: str
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "TurnBudget":
+        return cls(
+            config["CHAT_MAX_TOOL_ROUNDS"],
+            config["CHAT_TURN_DEADLINE"],
+            config["CHAT_ANSWER_TIMEOUT"],
+        )
 
 
-@dataclass
-class ToolCallResponse:
-    function_name: str
-    arguments: str
+def _budget_message(rounds_left: int, seconds_left: float) -> EasyInputMessageParam:
+    return {
+        "role": "system",
+        "content": (
+            f"Budget for this turn: at most {rounds_left} more rounds of tool "
+            f"calls and {seconds_left:.0f} seconds. If that is not enough, "
+            "answer with what you have and tell the user what is missing."
+        ),
+    }
 
 
-ChatStreamResponse: TypeAlias = ChatResponse | ToolCallResponse
+def _budget_exhausted_message() -> EasyInputMessageParam:
+    return {
+        "role": "system",
+        "content": (
+            "The budget for tool calls in this turn is used up. Answer the user "
+            "now with the information gathered so far, and tell them what is "
+            "missing."
+        ),
+    }
 
 
 class ChatClient:
     """A wrapper for the OpenAI API client."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        router: ModelRouter | None = None,
+        budget: TurnBudget | None = None,
+        jobs: JobQueue | None = None,
+    ):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set.")
-        self.client = OpenAI(api_key=api_key)
-        self.tools = []
-        self.tools: List[FunctionToolParam] = [
-            {
-                "type": "function",
-                "name": "get_my_playlists",
-                "description": "Returns a list of the user's Spotify playlists",
-                "parameters": {
-                    "type": "object",
-                    "properties": {},
-                    "required": [],
-                    "additionalProperties": False,
-                },
-                "strict": True,
-            },
-            {
-                "type": "function",
-                "name": "get_playlist_contents",
-                "description": "Returns a list of songs in a playlist",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "playlist_id": {
-                            "type": "string",
-                            "description": (
-                                "The ID of the playlist. "
-                                "This ID must have been previously retrieved by a call "
-                                "to get_my_playlists."
-                            ),
-                        },
-                    },
-                    "required": ["playlist_id"],
-                    "additionalProperties": False,
-                },
-                "strict": True,
-            },
-            {
-                "type": "function",
-                "name": "get_liked_songs",
-                "description": "Returns a list of the user's liked songs from Spotify.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {},
-                    "required": [],
-                    "additionalProperties": False,
-                },
-                "strict": True,
-            },
-            {
-                "type": "function",
-                "name": "create_playlist",
-                "description": "Creates a new playlist on Spotify.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "name": {
-                            "type": "string",
-                            "description": "The name of the playlist.",
-                        },
-                        "description": {
-                            "type": "string",
-                            "description": "The description of the playlist.",
-                        },
-                        "track_uris": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "A list of Spotify track URIs to add to the playlist.",
-                        },
-                    },
-                    "required": ["name", "description", "track_uris"],
-                    "additionalProperties": False,
-                },
-                "strict": True,
-            },
-            {
-                "type": "function",
-                "name": "search_songs",
-                "description": "Searches for songs on Spotify by title and artist.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "title": {
-                            "type": "string",
-                            "description": "The title of the song.",
-                        },
-                        "artist": {
-                            "type": "string",
-                            "description": "The artist of the song.",
-                        },
-                        "limit": {
-                            "type": "integer",
-                            "description": "The maximum number of songs to return.",
-                        },
-                    },
-                    "required": ["title", "artist", "limit"],
-                    "additionalProperties": False,
-                },
-                "strict": True,
-            },
-        ]
+        # Retries are handled by `openai_dependency`, not by the SDK itself.
+        self.client = OpenAI(
+            api_key=api_key, max_retries=0, http_client=get_openai_http_client()
+        )
+        self.router = router or ModelRouter.from_config(vars(Config))
+        self.budget = budget or TurnBudget.from_config(vars(Config))
+        # Limits the tools with a `job` policy; without it, they run like the
+        # others.
+        self.jobs = jobs
+        self.tools: List[FunctionToolParam] = tools.registry.schemas  # type: ignore[assignment]
+        self._executor = ThreadPoolExecutor(thread_name_prefix="tool-call")
 
     def handle_non_tool_outputs(
         self,
@@ -180,44 +170,99 @@ class ChatClient:
 
     def perform_function_call(
         self,
+        spotify_client: SpotifyClient,
         name: str,
         call_id: str,
         arguments: str,
+        on_progress: Callable[[ToolProgressResponse], None] | None = None,
+        check_cancelled: Callable[[], None] | None = None,
+        deadline: float | None = None,
     ) -> FunctionCallOutput:
-        if name == "get_my_playlists":
-            output = self.spotify_client.get_user_playlists()
-        elif name == "get_liked_songs":
-            output = self.spotify_client.get_liked_songs()
-        elif name == "get_playlist_contents":
-            args = json.loads(arguments)
-            playlist_id = args["playlist_id"]
-            output = self.spotify_client.get_playlist_contents(playlist_id)
-        elif name == "create_playlist":
-            args = json.loads(arguments)
-            name = args["name"]
-            description = args["description"]
-            track_uris = args["track_uris"]
-            logger.info(f"Creating playlist '{name}' with {len(track_uris)} tracks.")
-            output = self.spotify_client.create_playlist(name, description, track_uris)
-        elif name == "search_songs":
-            args = json.loads(arguments)
-            title = args["title"]
-            artist = args["artist"]
-            limit = args.get("limit", 5)
-            output = self.spotify_client.search_songs(title, artist, limit)
-        else:
-            output = {"error": f"Undefined function: '{name}'"}
+        """Runs a tool call and returns its output, or the error it failed
+        with. `deadline`, a `time.monotonic()` value, bounds the tool's timeout.
+        """
+        try:
+            with tracing.span(f"tool.{name}", call_id=call_id, arguments=arguments):
+                tool = tools.registry.get(name)
+                if tool is None:
+                    output = {"error": f"Undefined function: '{name}'"}
+                elif tool.policy.job and self.jobs:
+                    output = self.run_as_job(
+                        spotify_client,
+                        name,
+                        arguments,
+                        on_progress,
+                        check_cancelled,
+                        deadline,
+                    )
+                else:
+                    output = tools.registry.call(
+                        name,
+                        spotify_client,
+                        arguments,
+                        scope=spotify_client.user_id,
+                        deadline=deadline,
+                    )
+        except TurnCancelled:
+            raise
+        except Exception as e:
+            # Report the failure to the model instead of ending the turn, so it
+            # can tell the user or try something else.
+            logger.exception(f"Tool call '{name}' failed")
+            output = error_output(e)
         return {
             "type": "function_call_output",
             "call_id": call_id,
             "output": str(output),
         }
 
+    def run_as_job(
+        self,
+        spotify_client: SpotifyClient,
+        name: str,
+        arguments: str,
+        on_progress: Callable[[ToolProgressResponse], None] | None = None,
+        check_cancelled: Callable[[], None] | None = None,
+        deadline: float | None = None,
+    ) -> Any:
+        """Runs a tool call as a job, passing on its progress. The job stops
+        waiting in line once the turn is cancelled or past `deadline`.
+        """
+        assert self.jobs is not None
+        user_id = spotify_client.user_id
+
+        def check_waiting() -> None:
+            if check_cancelled:
+                check_cancelled()
+            if deadline is not None and time.monotonic() > deadline:
+                raise ToolTimeoutError(name, self.budget.deadline)
+
+        def report(job: Job) -> None:
+            if on_progress:
+                on_progress(
+                    ToolProgressResponse(name, job.id, job.progress, job.message)
+                )
+
+        return self.jobs.run(
+            name,
+            lambda: tools.registry.call(
+                name, spotify_client, arguments, scope=user_id, deadline=deadline
+            ),
+            owner=user_id,
+            on_progress=report,
+            check_cancelled=check_waiting,
+        )
+
     def process_tool_calls(
         self,
         outputs: List[ResponseOutputItem],
         conversation_history: ResponseInputParam,
+        spotify_client: SpotifyClient,
+        check_cancelled: Callable[[], None] | None = None,
+        on_progress: Callable[[ToolProgressResponse], None] | None = None,
+        deadline: float | None = None,
     ):
+        function_calls: list[ResponseFunctionToolCallParam] = []
         for output in outputs:
             match output:
                 case ResponseFunctionToolCall(
@@ -231,26 +276,135 @@ class ChatClient:
                     }
                     if id:
                         function_call["id"] = id
-                    function_call_result: FunctionCallOutput = (
-                        self.perform_function_call(name, call_id, arguments)
-                    )
-                    # Only save function call if result was successfully obtained,
-                    # otherwise we'll have a corrupted conversation context.
-                    conversation_history.append(function_call)
-                    conversation_history.append(function_call_result)
+                    function_calls.append(function_call)
                 case _:
                     logger.info(
                         f"Skipping unexpected output of type {type(output).__name__}: {pformat(output)}"
                     )
 
+        # Tools that are safe to run in parallel are started right away, the
+        # others run one after another on this thread.
+        results: dict[str, Future[FunctionCallOutput]] = {}
+        for function_call in function_calls:
+            tool = tools.registry.get(function_call["name"])
+            if tool and tool.policy.parallel_safe and len(function_calls) > 1:
+                results[function_call["call_id"]] = self._executor.submit(
+                    tracing.propagate(self.perform_function_call),
+                    spotify_client,
+                    function_call["name"],
+                    function_call["call_id"],
+                    function_call["arguments"],
+                    on_progress,
+                    check_cancelled,
+                    deadline,
+                )
+        try:
+            for function_call in function_calls:
+                call_id = function_call["call_id"]
+                if check_cancelled:
+                    check_cancelled()
+                if call_id in results:
+                    function_call_result = results[call_id].result()
+                else:
+                    function_call_result = self.perform_function_call(
+                        spotify_client,
+                        function_call["name"],
+                        call_id,
+                        function_call["arguments"],
+                        on_progress,
+                        check_cancelled,
+                        deadline,
+                    )
+                # A call that was interrupted by the cancellation has no
+                # meaningful result.
+                if check_cancelled:
+                    check_cancelled()
+                # Only save function call if result was successfully obtained,
+                # otherwise we'll have a corrupted conversation context.
+                conversation_history.append(function_call)
+                conversation_history.append(function_call_result)
+        except TurnCancelled:
+            for future in results.values():
+                future.cancel()
+            raise
+
         return conversation_history
 
+    def create_response(
+        self,
+        stage: Stage,
+        input: ResponseInputParam,
+        tool_choice: Literal["auto", "none"] = "auto",
+        deadline: float | None = None,
+    ) -> Response:
+        """Calls the model routed for `stage`, switching to the fallback model
+        if the stage's latency budget is exceeded.
+
+        Raises:
+            TurnDeadlineExceeded: If the model didn't answer by `deadline`, a
+                `time.monotonic()` value.
+        """
+        route = self.router.route(stage)
+
+        def create(model: str, budget: float | None = None) -> Response:
+            logger.info(f"Calling API with {model} ({stage} stage)")
+            timeout = budget
+            if deadline is not None:
+                # Also bounds the retries.
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TurnDeadlineExceeded()
+                timeout = remaining if budget is None else min(budget, remaining)
+            try:
+                with tracing.span("responses.create", model=model, stage=stage):
+                    return self.client.responses.create(
+                        model=model,
+                        input=input,
+                        tools=self.tools,
+                        tool_choice=tool_choice,
+                        timeout=timeout or NOT_GIVEN,
+                    )
+            except openai.APITimeoutError:
+                if timeout is None:
+                    raise
+                # Not failures of the API, so neither retried nor counted by
+                # the circuit breaker.
+                if timeout == budget:
+                    raise LatencyBudgetExceeded() from None
+                raise TurnDeadlineExceeded() from None
+
+        if route.fallback_model is None or route.latency_budget is None:
+            return openai_dependency.call(create, route.model)
+        try:
+            return openai_dependency.call(create, route.model, route.latency_budget)
+        except LatencyBudgetExceeded:
+            logger.warning(
+                f"{route.model} exceeded the {route.latency_budget}s budget, "
+                f"falling back to {route.fallback_model}"
+            )
+            return openai_dependency.call(create, route.fallback_model)
+
     def get_chat_completion(
-        self, conversation_history: ResponseInputParam, spotify_client
+        self,
+        conversation_history: ResponseInputParam,
+        spotify_client: SpotifyClient,
+        cancel: threading.Event | None = None,
+        on_progress: Callable[[ToolProgressResponse], None] | None = None,
     ) -> Iterable[ChatStreamResponse]:
-        """Gets a chat completion from the OpenAI API, handling tool calls."""
+        """Gets a chat completion from the OpenAI API, handling tool calls.
+
+        Once `cancel` is set, the turn stops before the next model or tool call,
+        and running tool calls stop before their next page fetch; writes to
+        Spotify are completed. `on_progress` is called, from any thread, with
+        the progress of jobs.
+        """
 
-        self.spotify_client: SpotifyClient = spotify_client
+        def check_cancelled() -> None:
+            if cancel is not None and cancel.is_set():
+                raise TurnCancelled()
+
+        if cancel is not None:
+            spotify_client.check_cancelled = check_cancelled
 
         system_prompt: EasyInputMessageParam = {
             "role": "system",
@@ -271,6 +425,11 @@ You have the following tools available:
 2) Retrieve the user's liked songs list from Spotify.
 3) Retrieve all the songs from a given playlist.
 4) Retrieve the spotify ID for a given song/artist.
+5) Search the user's playlists and liked songs for a song, artist or album.
+6) Find the songs in the user's library that are most similar to a given song.
+7) Summarize the user's whole library.
+8) Look up release dates, popularity and audio features of songs.
+9) Change the songs of a playlist you created or the user owns.
 
 Rely on your existing knowledge about music to answer the user's questions. Do not use the
 user's playlists to answer general musical questions, or questions about a certain era or
@@ -285,18 +444,56 @@ explicitly confirms that you can do it.
             ],
         }
 
+        deadline = time.monotonic() + self.budget.deadline
+        tool_rounds = 0
+
+        def answer_deadline() -> float:
+            # The answer has `answer_timeout` seconds, even if a write to
+            # Spotify ran past the deadline.
+            return max(deadline, time.monotonic()) + self.budget.answer_timeout
+
         try:
             logger.info(f"Tools: {pformat(self.tools)}")
 
+            # The first round usually answers the user directly.
+            stage: Stage = FINAL_STAGE
             while True:
                 logger.info(f"Conversation history: {pformat(conversation_history)}")
+                rounds_left = self.budget.max_tool_rounds - tool_rounds
+                seconds_left = deadline - time.monotonic()
+                if rounds_left <= 0 or seconds_left <= 0:
+                    logger.warning(
+                        f"Turn budget exhausted after {tool_rounds} tool rounds"
+                    )
+                    check_cancelled()
+                    response = self.create_response(
+                        FINAL_STAGE,
+                        [system_prompt]
+                        + conversation_history
+                        + [_budget_exhausted_message()],
+                        tool_choice="none",
+                        deadline=answer_deadline(),
+                    )
+                    yield self.handle_non_tool_outputs(
+                        response.output, conversation_history
+                    )
+                    return
+
                 logger.info("Calling API")
-                response: Response = self.client.responses.create(
-                    model="gpt-4o-mini",
-                    input=[system_prompt] + conversation_history,
-                    tools=self.tools,
-                    tool_choice="auto",
-                )
+                check_cancelled()
+                try:
+                    response = self.create_response(
+                        stage,
+                        [system_prompt, _budget_message(rounds_left, seconds_left)]
+                        + conversation_history,
+                        deadline=deadline,
+                    )
+                except TurnDeadlineExceeded:
+                    logger.warning("Model did not answer before the turn deadline")
+                    continue
+                # The request itself can't be interrupted, but its result is
+                # dropped if nobody is listening anymore.
+                check_cancelled()
 
                 logger.debug(f"API response:\n{pformat(response)}")
 
@@ -307,6 +504,14 @@ explicitly confirms that you can do it.
                     isinstance(o, ResponseFunctionToolCall) for o in response.output
                 ):
                     logger.info("Hundwyler: No tool calls, returning response")
+                    if stage == TOOL_STAGE and self.router.rewrites_final_answer:
+                        check_cancelled()
+                        response = self.create_response(
+                            FINAL_STAGE,
+                            [system_prompt] + conversation_history,
+                            tool_choice="none",
+                            deadline=answer_deadline(),
+                        )
                     yield self.handle_non_tool_outputs(
                         response.output, conversation_history
                     )
@@ -334,10 +539,19 @@ explicitly confirms that you can do it.
                                         )
 
                 conversation_history = self.process_tool_calls(
-                    response.output, conversation_history
+                    response.output,
+                    conversation_history,
+                    spotify_client,
+                    check_cancelled,
+                    on_progress,
+                    deadline,
                 )
+                stage = TOOL_STAGE
+                tool_rounds += 1
                 # Loop
 
+        except TurnCancelled:
+            logger.info("Chat turn cancelled")
         except Exception:
             logger.error("Exception occurred", exc_info=True)
             return ChatResponse(
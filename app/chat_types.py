@@ -0,0 +1,65 @@
+"""Types streamed by `ChatClient.get_chat_completion`, and conversation helpers.
+
+They live apart from `app.chat_client` so that the routes can use them without
+importing the OpenAI SDK.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, TypeAlias
+
+if TYPE_CHECKING:
+    from openai.types.responses import ResponseInputParam
+
+
+class TurnCancelled(Exception):
+    """Raised inside a chat turn whose client has gone away."""
+
+
+# passed to each call of `get_chat_completion`.
+@dataclass
+class ChatResponse:
+    # The conversation history.
+    conversation_history: "ResponseInputParam"
+
+    # The response to display in the UI. Can be an error.
+    response: str
+
+
+@dataclass
+class ToolCallResponse:
+    function_name: str
+    arguments: str
+
+
+@dataclass
+class ToolProgressResponse:
+    """Progress of a tool call running as a job."""
+
+    function_name: str
+    job_id: str
+    # From 0 to 1.
+    progress: float
+    message: str
+
+
+ChatStreamResponse: TypeAlias = ChatResponse | ToolCallResponse | ToolProgressResponse
+
+
+def consistent_history(
+    conversation_history: "ResponseInputParam",
+) -> "ResponseInputParam":
+    """Returns a copy of the history without function calls that have no
+    output yet, which the API would reject in the next turn.
+    """
+    history = list(conversation_history)
+    answered = {
+        item["call_id"]
+        for item in history
+        if item.get("type") == "function_call_output"  # type: ignore[union-attr]
+    }
+    return [
+        item
+        for item in history
+        if item.get("type") != "function_call"  # type: ignore[union-attr]
+        or item["call_id"] in answered  # type: ignore[typeddict-item]
+    ]
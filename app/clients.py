@@ -0,0 +1,220 @@
+"""App-scoped, lazily constructed API clients.
+
+Importing the OpenAI SDK and building `ChatClient` is the most expensive part
+of startup, and commands like `flask init-db` don't need it at all. The client
+is therefore only built on first use (or by `warm_up`) and then shared by all
+requests of the app.
+"""
+
+import atexit
+import logging
+import threading
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from flask import Flask, current_app
+
+from app import connections
+
+if TYPE_CHECKING:
+    from app.chat_client import ChatClient
+    from app.conversation_store import ConversationStore
+    from app.jobs import JobQueue
+    from app.library_cache import LibraryCache, LibraryPrefetcher
+    from app.library_index import LibraryIndex
+    from app.similarity import SimilarityIndex
+    from app.tracing import TraceStore
+    from app.track_resolver import TrackResolver
+    from app.write_behind import ConversationWriter
+
+logger = logging.getLogger(__name__)
+
+# Reentrant, as building one client may build another.
+_lock = threading.RLock()
+
+
+def _get_or_create[T](app: Flask, name: str, factory: Callable[[], T]) -> T:
+    value = app.extensions.get(name)
+    if value is None:
+        with _lock:
+            value = app.extensions.get(name)
+            if value is None:
+                value = app.extensions[name] = factory()
+    return value
+
+
+def _current_app() -> Flask:
+    return current_app._get_current_object()  # type: ignore[attr-defined]
+
+
+def get_chat_client() -> "ChatClient":
+    """Returns the app's `ChatClient`, building it on first use."""
+    return _get_chat_client(_current_app())
+
+
+def _get_chat_client(app: Flask) -> "ChatClient":
+    def build() -> "ChatClient":
+        from app.chat_client import ChatClient, TurnBudget
+        from app.model_router import ModelRouter
+
+        return ChatClient(
+            router=ModelRouter.from_config(app.config),
+            budget=TurnBudget.from_config(app.config),
+            jobs=_get_job_queue(app),
+        )
+
+    return _get_or_create(app, "chat_client", build)
+
+
+def get_job_queue() -> "JobQueue":
+    """Returns the app's job queue."""
+    return _get_job_queue(_current_app())
+
+
+def _get_job_queue(app: Flask) -> "JobQueue":
+    def build() -> "JobQueue":
+        from app.jobs import JobQueue
+
+        return JobQueue(
+            app.config["JOBS"],
+            per_kind=app.config["JOB_CONCURRENCY"],
+            per_owner=app.config["JOB_CONCURRENCY_PER_USER"],
+        )
+
+    return _get_or_create(app, "job_queue", build)
+
+
+def get_library_index() -> "LibraryIndex":
+    """Returns the app's library index, opening it on first use."""
+    app = _current_app()
+
+    def build() -> "LibraryIndex":
+        from app.library_index import LibraryIndex
+
+        return LibraryIndex(
+            app.config["LIBRARY_INDEX"], max_age=app.config["LIBRARY_INDEX_MAX_AGE"]
+        )
+
+    return _get_or_create(app, "library_index", build)
+
+
+def get_similarity_index() -> "SimilarityIndex":
+    """Returns the app's similarity index, opening it on first use."""
+    app = _current_app()
+
+    def build() -> "SimilarityIndex":
+        from app.similarity import SimilarityIndex
+
+        return SimilarityIndex(app.config["SIMILARITY_INDEX"])
+
+    return _get_or_create(app, "similarity_index", build)
+
+
+def get_library_cache() -> "LibraryCache":
+    """Returns the app's in-memory library cache."""
+    app = _current_app()
+
+    def build() -> "LibraryCache":
+        from app.library_cache import LibraryCache
+
+        return LibraryCache(ttl=app.config["LIBRARY_CACHE_TTL"])
+
+    return _get_or_create(app, "library_cache", build)
+
+
+def get_prefetcher() -> "LibraryPrefetcher":
+    """Returns the app's background library prefetcher."""
+    app = _current_app()
+
+    def build() -> "LibraryPrefetcher":
+        from app.library_cache import LibraryPrefetcher
+
+        return LibraryPrefetcher(
+            get_library_cache(), idle_timeout=app.config["PREFETCH_IDLE_TIMEOUT"]
+        )
+
+    return _get_or_create(app, "prefetcher", build)
+
+
+def get_track_resolver() -> "TrackResolver":
+    """Returns the app's resolver of previously seen tracks."""
+    app = _current_app()
+
+    def build() -> "TrackResolver":
+        from app.track_resolver import TrackResolver
+
+        return TrackResolver(threshold=app.config["TRACK_RESOLVER_THRESHOLD"])
+
+    return _get_or_create(app, "track_resolver", build)
+
+
+def get_trace_store() -> "TraceStore | None":
+    """Returns the app's trace store, or None if tracing is disabled."""
+    app = _current_app()
+    if not app.config["TRACING"]:
+        return None
+
+    def build() -> "TraceStore":
+        from app.tracing import TraceStore
+
+        return TraceStore(app.config["TRACE_STORE"])
+
+    return _get_or_create(app, "trace_store", build)
+
+
+def get_conversation_store() -> "ConversationStore":
+    """Returns the app's conversation store, as chosen by
+    `CONVERSATION_STORE`.
+    """
+    app = _current_app()
+
+    def build() -> "ConversationStore":
+        from app.conversation_store import (
+            InMemoryConversationStore,
+            SQLiteConversationStore,
+        )
+
+        match app.config["CONVERSATION_STORE"]:
+            case "sqlite":
+                return SQLiteConversationStore(app.config["DATABASE"])
+            case "memory":
+                return InMemoryConversationStore()
+            case backend:
+                raise ValueError(f"Unknown conversation store: {backend}")
+
+    return _get_or_create(app, "conversation_store", build)
+
+
+def get_conversation_writer() -> "ConversationWriter":
+    """Returns the app's background writer of conversations."""
+    app = _current_app()
+
+    def build() -> "ConversationWriter":
+        from app.write_behind import ConversationWriter
+
+        writer = ConversationWriter(
+            get_conversation_store(),
+            interval=app.config["CONVERSATION_WRITE_INTERVAL"],
+        )
+        atexit.register(writer.close)
+        return writer
+
+    return _get_or_create(app, "conversation_writer", build)
+
+
+def warm_up(app: Flask) -> None:
+    """Builds the clients and opens their connections ahead of the first
+    request.
+    """
+    try:
+        _get_chat_client(app)
+    except ValueError as e:
+        logger.warning(f"Could not build chat client: {e}")
+    connections.warm_up()
+
+
+def init_app(app: Flask) -> None:
+    if app.config["WARM_UP_CONNECTIONS"]:
+        threading.Thread(
+            target=warm_up, args=(app,), name="warm-up", daemon=True
+        ).start()
@@ -0,0 +1,107 @@
+"""Storage encoding of conversation histories.
+
+Histories used to be stored as `json.dumps` text. Pages decode them on every
+load, so most histories are stored as compact JSON, which parses as fast as
+the old text. Histories of at least `COMPRESS_MIN_SIZE` bytes, which are
+dominated by tool outputs that repeat the same keys and phrases in every
+turn, are compressed with zlib and the preset dictionary `PRESET`:
+
+    format (1 byte) | dictionary id (4 bytes, big endian) | zlib data
+
+The dictionary id is the CRC-32 of `PRESET`. Values starting with `[`, and
+the JSON text stored by earlier versions, are decoded as JSON.
+
+Decompressing about doubles the time to decode a history, so only the long
+histories, where the size matters most, pay for it, see
+`benchmarks/history_codec.py`.
+"""
+
+import json
+import struct
+import zlib
+
+FORMAT_ZLIB = 1
+
+COMPRESS_MIN_SIZE = 16 * 1024
+
+_HEADER = struct.Struct(">BI")
+
+# Fragments of the items in every history, most frequent last: zlib encodes
+# matches close to the data in fewer bits.
+_PRESET_FRAGMENTS = [
+    "Refusal message: ",
+    '"id":"fc_',
+    "{'error': '",
+    "', 'playlist_id': '",
+    "', 'description': '",
+    "', 'tracks': ",
+    '{"type":"function_call","name":"get_my_playlists","call_id":"call_',
+    '{"type":"function_call","name":"get_playlist_contents","call_id":"call_',
+    '{"type":"function_call","name":"get_liked_songs","call_id":"call_',
+    '{"type":"function_call","name":"create_playlist","call_id":"call_',
+    '{"type":"function_call","name":"search_my_library","call_id":"call_',
+    '{"type":"function_call","name":"find_similar_in_library","call_id":"call_',
+    '{"type":"function_call","name":"search_songs","call_id":"call_',
+    '"arguments":"{}"',
+    '"arguments":"{\\"title\\":\\"',
+    '\\",\\"artist\\":\\"',
+    '\\",\\"limit\\":',
+    '{"type":"function_call_output","call_id":"call_',
+    "\"output\":\"[{'name': '",
+    "', 'similarity': ",
+    "'}, {'name': '",
+    "', 'album': '",
+    "', 'track_id': '",
+    "', 'artist': '",
+    '{"role":"assistant","content":"',
+    '{"role":"user","content":"',
+]
+PRESET = "".join(_PRESET_FRAGMENTS).encode()
+
+PRESET_ID = zlib.crc32(PRESET)
+
+
+def dumps(history: list) -> bytes:
+    """Returns the history as compact JSON."""
+    return json.dumps(history, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class HistoryCodec:
+    """Encodes histories as compact JSON, compressed if they are long."""
+
+    def __init__(self, min_size: int = COMPRESS_MIN_SIZE, level: int = 1):
+        """
+        Args:
+            min_size: Size in bytes of the JSON from which histories are
+                compressed.
+            level: zlib compression level. Decompressing takes about as long
+                at every level, and level 1 compresses fastest.
+        """
+        self.min_size = min_size
+        self.level = level
+
+    def encode(self, history: list) -> bytes:
+        data = dumps(history)
+        if len(data) < self.min_size:
+            return data
+        compressor = zlib.compressobj(self.level, zdict=PRESET)
+        data = compressor.compress(data) + compressor.flush()
+        return _HEADER.pack(FORMAT_ZLIB, PRESET_ID) + data
+
+    def decode(self, value: str | bytes) -> list:
+        """Decodes a stored history.
+
+        Raises:
+            ValueError: If the value is in an unknown format.
+        """
+        if isinstance(value, str) or value[:1] == b"[":
+            return json.loads(value)
+        if value[:1] != bytes([FORMAT_ZLIB]):
+            raise ValueError(f"Unknown history format: {value[:1]!r}")
+        _, key = _HEADER.unpack_from(value)
+        if key != PRESET_ID:
+            raise ValueError(f"Unknown history dictionary: {key:08x}")
+        decompressor = zlib.decompressobj(zdict=PRESET)
+        return json.loads(
+            decompressor.decompress(value[_HEADER.size :]) + decompressor.flush()
+        )
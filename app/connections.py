@@ -0,0 +1,113 @@
+"""Process-wide pooled HTTP connections to the Spotify and OpenAI APIs.
+
+Every request used to build its own `spotipy.Spotify` client with a fresh
+`requests.Session`, paying a TCP+TLS handshake for each chat turn. Instead, all
+clients share the connection pools below; per-user authentication is added to
+each request by the user's auth manager.
+"""
+
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from flask import Flask
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+logger = logging.getLogger(__name__)
+
+SPOTIFY_WARM_UP_URLS = ["https://api.spotify.com/", "https://accounts.spotify.com/"]
+OPENAI_WARM_UP_URL = "https://api.openai.com/v1/"
+
+_lock = threading.Lock()
+_spotify_session: "requests.Session | None" = None
+_openai_http_client: "httpx.Client | None" = None
+_spotify_pool_maxsize = 32
+_openai_max_connections = 32
+
+
+def _build_spotify_session(pool_maxsize: int) -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class _SharedSession(requests.Session):
+        """A session that survives the clients using it.
+
+        `spotipy.Spotify.__del__` closes its session, which would drop all pooled
+        connections whenever a per-request client is garbage collected.
+        """
+
+        def close(self) -> None:
+            pass
+
+    session = _SharedSession()
+    # Retries are handled by `spotify_dependency`, not by urllib3.
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _build_openai_http_client(max_connections: int) -> "httpx.Client":
+    import httpx
+    import openai
+
+    return openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0,
+        )
+    )
+
+
+def get_spotify_session() -> "requests.Session":
+    """Returns the shared session for all Spotify API and accounts requests."""
+    global _spotify_session
+    with _lock:
+        if _spotify_session is None:
+            _spotify_session = _build_spotify_session(_spotify_pool_maxsize)
+        return _spotify_session
+
+
+def get_openai_http_client() -> "httpx.Client":
+    """Returns the shared HTTP client for OpenAI API requests."""
+    global _openai_http_client
+    with _lock:
+        if _openai_http_client is None:
+            _openai_http_client = _build_openai_http_client(_openai_max_connections)
+        return _openai_http_client
+
+
+def warm_up() -> None:
+    """Opens pooled connections to the APIs, so that the first chat turn
+    doesn't pay for the handshakes.
+    """
+    import httpx
+    import requests
+
+    session = get_spotify_session()
+    for url in SPOTIFY_WARM_UP_URLS:
+        try:
+            session.head(url, timeout=5)
+        except requests.RequestException as e:
+            logger.warning(f"Could not warm up connection to {url}: {e}")
+
+    try:
+        get_openai_http_client().head(OPENAI_WARM_UP_URL, timeout=5)
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not warm up connection to {OPENAI_WARM_UP_URL}: {e}")
+    logger.info("Warmed up API connections")
+
+
+def init_app(app: Flask) -> None:
+    """Sizes the connection pools from the app config.
+
+    The pools themselves are only built on first use, so that app startup and
+    CLI commands don't pay for importing the HTTP client libraries.
+    """
+    global _spotify_pool_maxsize, _openai_max_connections
+    _spotify_pool_maxsize = app.config["SPOTIFY_POOL_MAXSIZE"]
+    _openai_max_connections = app.config["OPENAI_MAX_CONNECTIONS"]
@@ -0,0 +1,290 @@
+"""Storage backends for conversation histories.
+
+`app/database.py` and the conversation writer only use the
+`ConversationStore` interface, so backends can be benchmarked and swapped
+with `CONVERSATION_STORE` without touching the routes:
+
+- `sqlite`: `SQLiteConversationStore`, the app database. For production.
+- `memory`: `InMemoryConversationStore`. Fast, but lost on restart and not
+  shared between processes, so only for tests and single-process development.
+
+Every backend must pass the shared tests in `tests/test_conversation_store.py`,
+and `benchmarks/conversation_store.py` compares them.
+"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Mapping
+
+from app.codec import HistoryCodec
+
+
+class ConversationStore(ABC):
+    """Conversation histories by id, optionally owned by a user."""
+
+    @abstractmethod
+    def create(
+        self, conversation_id: str, history: list, user_id: str | None = None
+    ) -> None:
+        """Creates a conversation, replacing any with the same id."""
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> list | None:
+        """Returns the history of a conversation, or None if it doesn't exist."""
+
+    @abstractmethod
+    def get_many(self, conversation_ids: Iterable[str]) -> dict[str, list]:
+        """Returns the histories of the conversations that exist, by id."""
+
+    @abstractmethod
+    def update_many(self, histories: Mapping[str, list]) -> None:
+        """Replaces the histories of existing conversations, all at once.
+        Unknown ids are ignored.
+        """
+
+    def update(self, conversation_id: str, history: list) -> None:
+        self.update_many({conversation_id: history})
+
+    @abstractmethod
+    def append(self, conversation_id: str, items: list) -> bool:
+        """Appends items to a history.
+
+        Returns:
+            Whether the conversation exists.
+        """
+
+    @abstractmethod
+    def delete(self, conversation_id: str) -> bool:
+        """Deletes a conversation.
+
+        Returns:
+            Whether the conversation existed.
+        """
+
+    @abstractmethod
+    def list_by_user(self, user_id: str) -> list[str]:
+        """Returns the ids of the user's conversations, oldest first."""
+
+    @abstractmethod
+    def delete_idle(self, cutoff: float) -> int:
+        """Deletes the conversations last created or changed before `cutoff`,
+        a Unix timestamp.
+
+        Returns:
+            The number of conversations deleted.
+        """
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Keeps histories in a dict. Histories are copied on the way in and out,
+    but their items are shared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histories: dict[str, list] = {}
+        self._users: dict[str, str | None] = {}
+        self._updated: dict[str, float] = {}
+
+    def create(
+        self, conversation_id: str, history: list, user_id: str | None = None
+    ) -> None:
+        with self._lock:
+            # A recreated conversation counts as the newest.
+            self._histories.pop(conversation_id, None)
+            self._users.pop(conversation_id, None)
+            self._histories[conversation_id] = list(history)
+            self._users[conversation_id] = user_id
+            self._updated[conversation_id] = time.time()
+
+    def get(self, conversation_id: str) -> list | None:
+        with self._lock:
+            history = self._histories.get(conversation_id)
+            return None if history is None else list(history)
+
+    def get_many(self, conversation_ids: Iterable[str]) -> dict[str, list]:
+        with self._lock:
+            return {
+                conversation_id: list(self._histories[conversation_id])
+                for conversation_id in conversation_ids
+                if conversation_id in self._histories
+            }
+
+    def update_many(self, histories: Mapping[str, list]) -> None:
+        with self._lock:
+            for conversation_id, history in histories.items():
+                if conversation_id in self._histories:
+                    self._histories[conversation_id] = list(history)
+                    self._updated[conversation_id] = time.time()
+
+    def append(self, conversation_id: str, items: list) -> bool:
+        with self._lock:
+            history = self._histories.get(conversation_id)
+            if history is None:
+                return False
+            history.extend(items)
+            self._updated[conversation_id] = time.time()
+            return True
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            self._users.pop(conversation_id, None)
+            self._updated.pop(conversation_id, None)
+            return self._histories.pop(conversation_id, None) is not None
+
+    def list_by_user(self, user_id: str) -> list[str]:
+        with self._lock:
+            # Dicts keep insertion order, which is creation order.
+            return [
+                conversation_id
+                for conversation_id, owner in self._users.items()
+                if owner == user_id
+            ]
+
+    def delete_idle(self, cutoff: float) -> int:
+        with self._lock:
+            idle = [
+                conversation_id
+                for conversation_id, updated in self._updated.items()
+                if updated < cutoff
+            ]
+            for conversation_id in idle:
+                del self._histories[conversation_id]
+                del self._users[conversation_id]
+                del self._updated[conversation_id]
+            return len(idle)
+
+
+# Also used by `flask init-db`, after dropping the table.
+SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS conversation (
+  id TEXT PRIMARY KEY,
+  history BLOB NOT NULL,
+  user_id TEXT,
+  updated_at REAL NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+CREATE INDEX IF NOT EXISTS conversation_user ON conversation (user_id);
+CREATE INDEX IF NOT EXISTS conversation_updated_at ON conversation (updated_at);
+"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Stores histories in the `conversation` table, encoded as described in
+    `app/codec.py`, with a connection per thread. Histories stored as JSON
+    text by earlier versions are still read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            columns = {row[1] for row in db.execute("PRAGMA table_info(conversation)")}
+            # Databases created before conversations had owners or ages.
+            if columns and "user_id" not in columns:
+                db.execute("ALTER TABLE conversation ADD COLUMN user_id TEXT")
+            if columns and "updated_at" not in columns:
+                db.execute("ALTER TABLE conversation ADD COLUMN updated_at REAL")
+                db.execute("UPDATE conversation SET updated_at = strftime('%s', 'now')")
+            db.executescript(SCHEMA)
+        self.codec = HistoryCodec()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            # Only takes effect before WAL writes the header of a new file.
+            db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            db.execute("PRAGMA journal_mode = WAL")
+            self._local.db = db
+        return db
+
+    def create(
+        self, conversation_id: str, history: list, user_id: str | None = None
+    ) -> None:
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO conversation (id, history, user_id, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                (conversation_id, self.codec.encode(history), user_id, time.time()),
+            )
+
+    def get(self, conversation_id: str) -> list | None:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT history FROM conversation WHERE id = ?", (conversation_id,)
+            )
+            .fetchone()
+        )
+        return self.codec.decode(row[0]) if row else None
+
+    def get_many(self, conversation_ids: Iterable[str]) -> dict[str, list]:
+        ids = list(conversation_ids)
+        db = self._connect()
+        histories = {}
+        # SQLite limits the number of parameters of a statement.
+        for i in range(0, len(ids), 500):
+            chunk = ids[i : i + 500]
+            rows = db.execute(
+                "SELECT id, history FROM conversation"
+                f" WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            histories.update(
+                (conversation_id, self.codec.decode(history))
+                for conversation_id, history in rows
+            )
+        return histories
+
+    def update_many(self, histories: Mapping[str, list]) -> None:
+        with self._connect() as db:
+            db.executemany(
+                "UPDATE conversation SET history = ?, updated_at = ? WHERE id = ?",
+                [
+                    (self.codec.encode(history), time.time(), conversation_id)
+                    for conversation_id, history in histories.items()
+                ],
+            )
+
+    def append(self, conversation_id: str, items: list) -> bool:
+        db = self._connect()
+        with db:
+            # Take the write lock before reading, so that appends don't race.
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT history FROM conversation WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            db.execute(
+                "UPDATE conversation SET history = ?, updated_at = ? WHERE id = ?",
+                (
+                    self.codec.encode(self.codec.decode(row[0]) + items),
+                    time.time(),
+                    conversation_id,
+                ),
+            )
+            return True
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._connect() as db:
+            cursor = db.execute(
+                "DELETE FROM conversation WHERE id = ?", (conversation_id,)
+            )
+        return cursor.rowcount > 0
+
+    def list_by_user(self, user_id: str) -> list[str]:
+        rows = self._connect().execute(
+            "SELECT id FROM conversation WHERE user_id = ? ORDER BY rowid", (user_id,)
+        )
+        return [conversation_id for (conversation_id,) in rows]
+
+    def delete_idle(self, cutoff: float) -> int:
+        with self._connect() as db:
+            cursor = db.execute(
+                "DELETE FROM conversation WHERE updated_at < ?", (cutoff,)
+            )
+        return cursor.rowcount
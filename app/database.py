@@ -1,9 +1,11 @@
-import json
 import sqlite3
 
 import click
 from flask import current_app, g
 
+from app import tracing
+from app.clients import get_conversation_store, get_conversation_writer
+
 
 def get_db():
     if "db" not in g:
@@ -21,9 +23,10 @@ def close_db(e=None):
 
 
 def init_db():
+    from app.conversation_store import SCHEMA
+
     db = get_db()
-    with current_app.open_resource("schema.sql") as f:
-        db.executescript(f.read().decode("utf8"))
+    db.executescript("DROP TABLE IF EXISTS conversation;" + SCHEMA)
 
 
 @click.command("init-db")
@@ -33,38 +36,58 @@ def init_db_command():
     click.echo("Initialized the database.")
 
 
+@click.command("gc")
+def gc_command():
+    """Delete stale conversations, token caches, traces and profiles, and
+    vacuum.
+    """
+    from app.maintenance import collect_garbage
+
+    click.echo(str(collect_garbage(current_app._get_current_object())))
+
+
+@click.command("migrate-db")
+def migrate_db_command():
+    """Upgrade a database created by an earlier version."""
+    from app.maintenance import enable_incremental_vacuum
+
+    if enable_incremental_vacuum(current_app.config["DATABASE"]):
+        click.echo("Converted the database to incremental vacuum.")
+    click.echo("The database is up to date.")
+
+
 def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(gc_command)
+    app.cli.add_command(migrate_db_command)
 
 
-def create_conversation(conversation_id, history):
-    db = get_db()
-    db.execute(
-        "INSERT INTO conversation (id, history) VALUES (?, ?)",
-        (conversation_id, json.dumps(history)),
-    )
-    db.commit()
+def create_conversation(conversation_id, history, user_id=None):
+    with tracing.span("db.create_conversation"):
+        get_conversation_store().create(conversation_id, history, user_id)
 
 
 def get_conversation(conversation_id):
-    db = get_db()
-    row = db.execute(
-        "SELECT history FROM conversation WHERE id = ?", (conversation_id,)
-    ).fetchone()
-    return json.loads(row["history"]) if row else None
+    history = get_conversation_writer().pending(conversation_id)
+    if history is not None:
+        return history
+    return get_conversation_store().get(conversation_id)
 
 
 def update_conversation(conversation_id, history):
-    db = get_db()
-    db.execute(
-        "UPDATE conversation SET history = ? WHERE id = ?",
-        (json.dumps(history), conversation_id),
-    )
-    db.commit()
+    """Saves the history in the background, see `app/write_behind.py`."""
+    with tracing.span("db.update_conversation", items=len(history)):
+        get_conversation_writer().write(conversation_id, history)
+
+
+def flush_conversations():
+    """Waits until all updated conversations are committed."""
+    with tracing.span("db.flush_conversations"):
+        return get_conversation_writer().flush()
 
 
 def delete_conversation(conversation_id):
-    db = get_db()
-    db.execute("DELETE FROM conversation WHERE id = ?", (conversation_id,))
-    db.commit()
+    with tracing.span("db.delete_conversation"):
+        get_conversation_writer().discard(conversation_id)
+        get_conversation_store().delete(conversation_id)
@@ -0,0 +1,139 @@
+"""Pages for looking into the behaviour of the running app.
+
+They expose conversation details, so they are only served in debug mode, or
+to requests carrying `DEBUG_ROUTES_TOKEN` in the `X-Debug-Token` header.
+"""
+
+import hmac
+import io
+import os
+import pstats
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    send_from_directory,
+)
+
+from app.clients import get_job_queue, get_trace_store
+
+bp = Blueprint("debug", __name__, url_prefix="/debug")
+
+
+def has_debug_access() -> bool:
+    """Returns whether the current request may see debug information."""
+    if current_app.debug or current_app.testing:
+        return True
+    token = current_app.config["DEBUG_ROUTES_TOKEN"]
+    return bool(token) and hmac.compare_digest(
+        request.headers.get("X-Debug-Token", ""), token
+    )
+
+
+@bp.before_request
+def require_debug_access():
+    if not has_debug_access():
+        abort(404)
+
+
+@bp.route("/traces")
+def traces():
+    """Lists the most recent traces."""
+    store = get_trace_store()
+    if store is None:
+        abort(404)
+    return render_template("traces.html", traces=store.recent())
+
+
+@bp.route("/traces/<trace_id>")
+def trace(trace_id: str):
+    """Shows the spans of a trace as a waterfall, or as JSON with
+    `?format=json`.
+    """
+    store = get_trace_store()
+    spans = store.get(trace_id) if store else []
+    if not spans:
+        abort(404)
+    if request.args.get("format") == "json":
+        return jsonify(spans)
+    return render_template("trace.html", trace_id=trace_id, spans=_waterfall(spans))
+
+
+@bp.route("/jobs")
+def jobs():
+    """Lists the most recent jobs as JSON, or one with `?id=`."""
+    queue = get_job_queue()
+    if job_id := request.args.get("id"):
+        job = queue.get(job_id)
+        if job is None:
+            abort(404)
+        return jsonify(job)
+    return jsonify(queue.recent())
+
+
+@bp.route("/profiles")
+def profiles():
+    """Lists the stored profiles, newest first."""
+    directory = current_app.config["PROFILES"]
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    rows = []
+    for name in sorted(names, reverse=True):
+        if not name.endswith(".prof"):
+            continue
+        created_ms, endpoint, conversation_id = name.removesuffix(".prof").split("_", 2)
+        rows.append(
+            {
+                "name": name,
+                "created": int(created_ms) / 1000,
+                "endpoint": endpoint,
+                "conversation_id": conversation_id,
+                "size": os.path.getsize(os.path.join(directory, name)),
+            }
+        )
+    return render_template("profiles.html", profiles=rows)
+
+
+@bp.route("/profiles/<name>")
+def profile(name: str):
+    """Downloads a profile in `pstats` format, or shows its top functions by
+    cumulative time with `?format=text`.
+    """
+    directory = current_app.config["PROFILES"]
+    if request.args.get("format") != "text":
+        return send_from_directory(directory, name, as_attachment=True)
+    path = os.path.join(directory, os.path.basename(name))
+    if not os.path.isfile(path):
+        abort(404)
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(50)
+    return Response(out.getvalue(), mimetype="text/plain")
+
+
+def _waterfall(spans: list[dict]) -> list[dict]:
+    """Adds each span's depth in the tree, and its offset and width as
+    percentages of the whole trace.
+    """
+    start = min(s["start"] for s in spans)
+    end = max(s["start"] + s["duration"] for s in spans)
+    total = max(end - start, 1e-6)
+    depths: dict[str, int] = {}
+    rows = []
+    for s in spans:
+        depth = depths.get(s["parent_id"], -1) + 1
+        depths[s["span_id"]] = depth
+        rows.append(
+            dict(
+                s,
+                depth=depth,
+                offset_ms=(s["start"] - start) * 1000,
+                duration_ms=s["duration"] * 1000,
+                left=(s["start"] - start) / total * 100,
+                width=max(s["duration"] / total * 100, 0.2),
+            )
+        )
+    return rows
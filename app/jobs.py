@@ -0,0 +1,240 @@
+"""Jobs: long-running tools with limited concurrency and reported progress.
+
+Creating a playlist of hundreds of tracks or reading a whole library ran like
+any other tool, so any number of bulk Spotify requests could run at once and
+the client saw nothing until they were done. Tools whose policy sets `job` are
+instead run through a `JobQueue`. It lets at most `per_kind` jobs of each tool
+run at once, and at most `per_owner` of them for the same user. A library
+summary thus doesn't hold up playlist writes, and one user's jobs leave room
+for others. Jobs over those limits wait in line. The tools call `report_progress`, which is passed
+on to the client as the job runs.
+
+A job runs on the thread of the tool call that submitted it, which waits for
+its result anyway; no thread is added per job. A job's reads stop when its
+turn is cancelled, but its writes to Spotify are completed. The `job` table
+records each job's status, progress and result, for `/debug/jobs`.
+"""
+
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+  id TEXT PRIMARY KEY,
+  tool TEXT NOT NULL,
+  owner TEXT,
+  status TEXT NOT NULL,
+  progress REAL NOT NULL DEFAULT 0,
+  message TEXT,
+  result TEXT,
+  created_at REAL NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_updated_at ON job (updated_at);
+"""
+
+
+class Job:
+    """A running job."""
+
+    def __init__(
+        self,
+        tool: str,
+        owner: str | None,
+        on_progress: Callable[["Job"], None] | None = None,
+    ):
+        self.id = str(uuid.uuid4())
+        self.tool = tool
+        self.owner = owner
+        self.progress = 0.0
+        self.message = ""
+        self.on_progress = on_progress
+
+
+# The job running on this thread, and its queue.
+_current: contextvars.ContextVar[tuple["JobQueue", Job] | None] = (
+    contextvars.ContextVar("current_job", default=None)
+)
+
+
+def report_progress(done: int, total: int, message: str = "") -> None:
+    """Reports the progress of the job running on this thread. Does nothing
+    outside of jobs.
+
+    Args:
+        done: Units of work done, e.g. tracks added.
+        total: Units of work in all.
+        message: What is being done, for the user.
+    """
+    current = _current.get()
+    if current is not None:
+        jobs, job = current
+        jobs._set_progress(job, done / total if total else 1.0, message)
+
+
+class JobQueue:
+    """Runs jobs within their concurrency limits and records them in the
+    SQLite database at `path`.
+    """
+
+    def __init__(self, path: str, per_kind: int = 2, per_owner: int = 1):
+        self.path = path
+        self.per_kind = per_kind
+        self.per_owner = per_owner
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+        # Running jobs by (tool, None) and by (tool, owner).
+        self._running: Counter[tuple[str, str | None]] = Counter()
+        self._changed = threading.Condition()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode = WAL")
+            self._local.db = db
+        return db
+
+    def _record(self, job: Job, status: str, result: str | None = None) -> None:
+        try:
+            with self._connect() as db:
+                db.execute(
+                    "UPDATE job SET status = ?, progress = ?, message = ?,"
+                    " result = coalesce(?, result), updated_at = ? WHERE id = ?",
+                    (status, job.progress, job.message, result, time.time(), job.id),
+                )
+        except sqlite3.Error:
+            logger.exception(f"Could not record job {job.id} as {status}")
+
+    def run(
+        self,
+        tool: str,
+        fn: Callable[[], Any],
+        owner: str | None = None,
+        on_progress: Callable[[Job], None] | None = None,
+        check_cancelled: Callable[[], None] | None = None,
+        poll_interval: float = 0.5,
+    ) -> Any:
+        """Runs `fn` as a job on this thread, once the limits allow it.
+
+        Args:
+            tool: The name of the tool the job runs, which is its kind.
+            fn: Runs the tool and returns its output.
+            owner: Whose job it is, e.g. the Spotify user ID.
+            on_progress: Called with the job whenever it reports progress.
+            check_cancelled: Called at least every `poll_interval` seconds
+                while the job waits in line; raises to give up waiting.
+
+        Returns:
+            The result of `fn`.
+
+        Raises:
+            Exception: The exception `fn` raised.
+        """
+        job = Job(tool, owner, on_progress)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO job (id, tool, owner, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, tool, owner, QUEUED, now, now),
+            )
+        slots = [(tool, None)] + ([(tool, owner)] if owner else [])
+        try:
+            self._acquire(job, slots, check_cancelled, poll_interval)
+        except BaseException as e:
+            self._record(job, FAILED, repr(e))
+            raise
+        token = _current.set((self, job))
+        try:
+            self._record(job, RUNNING)
+            result = fn()
+        except BaseException as e:
+            # The caller reports the error.
+            logger.warning(f"Job {job.id} ({tool}) failed: {e!r}")
+            self._record(job, FAILED, repr(e))
+            raise
+        else:
+            job.progress = 1.0
+            self._record(job, DONE, str(result))
+            return result
+        finally:
+            _current.reset(token)
+            self._release(slots)
+
+    def _acquire(
+        self,
+        job: Job,
+        slots: list[tuple[str, str | None]],
+        check_cancelled: Callable[[], None] | None,
+        poll_interval: float,
+    ) -> None:
+        def full(slot: tuple[str, str | None]) -> bool:
+            limit = self.per_kind if slot[1] is None else self.per_owner
+            return self._running[slot] >= limit
+
+        with self._changed:
+            logged = False
+            while any(full(slot) for slot in slots):
+                if not logged:
+                    logger.info(f"Job {job.id} ({job.tool}) waiting in line")
+                    logged = True
+                self._changed.wait(poll_interval)
+                if check_cancelled:
+                    check_cancelled()
+            self._running.update(slots)
+
+    def _release(self, slots: list[tuple[str, str | None]]) -> None:
+        with self._changed:
+            self._running.subtract(slots)
+            # Drops the counts of owners without running jobs.
+            self._running = +self._running
+            self._changed.notify_all()
+
+    def _set_progress(self, job: Job, progress: float, message: str) -> None:
+        job.progress = progress
+        job.message = message
+        if job.on_progress:
+            job.on_progress(job)
+        self._record(job, RUNNING)
+
+    def get(self, job_id: str) -> dict | None:
+        row = (
+            self._connect()
+            .execute("SELECT * FROM job WHERE id = ?", (job_id,))
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def recent(self, limit: int = 100) -> list[dict]:
+        """Returns the most recently submitted jobs, newest first."""
+        rows = self._connect().execute(
+            "SELECT * FROM job ORDER BY created_at DESC LIMIT ?", (limit,)
+        )
+        return [dict(row) for row in rows]
+
+    def delete_old(self, cutoff: float) -> int:
+        """Deletes the jobs last changed before `cutoff`, a Unix timestamp.
+
+        Returns:
+            The number of jobs deleted.
+        """
+        with self._connect() as db:
+            cursor = db.execute("DELETE FROM job WHERE updated_at < ?", (cutoff,))
+        return cursor.rowcount
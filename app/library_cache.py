@@ -0,0 +1,158 @@
+"""In-memory cache of the user's library, filled speculatively after login.
+
+The first `get_my_playlists` or `get_liked_songs` call of a session used to
+wait for a full cold fetch. After the user connects Spotify (or opens the page
+with a valid token), `LibraryPrefetcher` fetches both in the background, so
+that `SpotifyClient` can answer the first library question from memory.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from app.spotify_client import SpotifyClient
+
+logger = logging.getLogger(__name__)
+
+PLAYLISTS = "playlists"
+LIKED_SONGS = "liked_songs"
+
+
+class LibraryCache:
+    """Per-user library data, valid for `ttl` seconds after it was fetched.
+
+    Only the `max_users` most recently active users are kept, and users whose
+    data expired are dropped as others are added, so that the libraries of
+    users who left don't stay in memory.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+        max_users: int = 100,
+    ):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._clock = clock
+        self._lock = threading.Lock()
+        # User -> resource -> (fetched at, value), least recently used first.
+        self._users: OrderedDict[str, dict[str, tuple[float, Any]]] = OrderedDict()
+
+    def get(self, user_id: str, resource: str) -> Any:
+        with self._lock:
+            entries = self._users.get(user_id)
+            if not entries or resource not in entries:
+                return None
+            fetched_at, value = entries[resource]
+            if self._clock() - fetched_at > self.ttl:
+                del entries[resource]
+                return None
+            self._users.move_to_end(user_id)
+            return value
+
+    def put(self, user_id: str, resource: str, value: Any) -> None:
+        with self._lock:
+            now = self._clock()
+            self._users.setdefault(user_id, {})[resource] = (now, value)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users or self._expired(
+                next(iter(self._users.values())), now
+            ):
+                self._users.popitem(last=False)
+
+    def _expired(self, entries: dict[str, tuple[float, Any]], now: float) -> bool:
+        return all(now - fetched_at > self.ttl for fetched_at, _ in entries.values())
+
+    def invalidate(self, user_id: str, resource: str) -> None:
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries:
+                entries.pop(resource, None)
+
+    def is_fresh(self, user_id: str) -> bool:
+        return all(
+            self.get(user_id, resource) is not None
+            for resource in (PLAYLISTS, LIKED_SONGS)
+        )
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class LibraryPrefetcher:
+    """Prefetches users' libraries on a small, low-priority thread pool.
+
+    Sessions are identified by an opaque key. A prefetch is abandoned between
+    page fetches once its session has not been `touch`ed for `idle_timeout`
+    seconds, so that users who left don't keep the pool busy.
+    """
+
+    def __init__(
+        self,
+        cache: LibraryCache,
+        idle_timeout: float = 300.0,
+        max_workers: int = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.cache = cache
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_seen: dict[str, float] = {}
+        self._running: dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+
+    def touch(self, key: str) -> None:
+        """Records activity of the session `key` while its prefetch runs."""
+        with self._lock:
+            if key in self._running:
+                self._last_seen[key] = self._clock()
+
+    def is_idle(self, key: str) -> bool:
+        with self._lock:
+            last_seen = self._last_seen.get(key)
+        return last_seen is None or self._clock() - last_seen > self.idle_timeout
+
+    def prefetch(self, key: str, spotify_client: "SpotifyClient") -> Future | None:
+        """Starts prefetching the library of session `key`, unless that is
+        already in progress.
+        """
+        with self._lock:
+            self._last_seen[key] = self._clock()
+            if key in self._running:
+                return None
+            future = self._executor.submit(self._run, key, spotify_client)
+            self._running[key] = future
+        return future
+
+    def _run(self, key: str, spotify_client: "SpotifyClient") -> None:
+        def check_idle() -> None:
+            if self.is_idle(key):
+                raise PrefetchCancelled()
+
+        spotify_client.check_cancelled = check_idle
+        try:
+            if self.cache.is_fresh(spotify_client.user_id):
+                return
+            logger.info("Prefetching library")
+            spotify_client.get_user_playlists()
+            check_idle()
+            spotify_client.get_liked_songs()
+            logger.info("Prefetched library")
+        except PrefetchCancelled:
+            logger.info("Prefetch cancelled, session is idle")
+        except Exception:
+            logger.exception("Prefetch failed")
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+                self._last_seen.pop(key, None)
@@ -0,0 +1,347 @@
+"""Per-user full-text index of the user's Spotify library (SQLite FTS5).
+
+Answering "which of my playlists have Coltrane?" used to take one model round
+trip per playlist. The index holds the playlists and liked songs fetched by
+`SpotifyClient`, so that such questions are answered with a single local query.
+
+The tracks are rows of `library_entry`, indexed by user and source, so that
+reindexing a source or reading a user's tracks only touches that user's rows.
+`library_track` is the full-text index over them.
+"""
+
+import itertools
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+
+from app.tracks import Track, track_table
+
+logger = logging.getLogger(__name__)
+
+LIKED_SONGS = "liked"
+PLAYLIST = "playlist"
+
+INDEX_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS library_source (
+  user_id TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  source_id TEXT NOT NULL,
+  name TEXT,
+  snapshot_id TEXT,
+  indexed_snapshot_id TEXT,
+  indexed_at REAL,
+  PRIMARY KEY (user_id, kind, source_id)
+);
+
+CREATE TABLE IF NOT EXISTS library_sync (
+  user_id TEXT PRIMARY KEY,
+  synced_at REAL NOT NULL
+);
+
+-- One row per track of each source.
+CREATE TABLE IF NOT EXISTS library_entry (
+  id INTEGER PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  source_id TEXT NOT NULL,
+  track_id TEXT,
+  name TEXT,
+  artist TEXT,
+  album TEXT,
+  -- JSON array of the artists' names, see `Track.artists`.
+  artists TEXT
+);
+CREATE INDEX IF NOT EXISTS library_entry_source
+  ON library_entry (user_id, kind, source_id);
+
+-- The full-text index of the entries, kept up to date by the triggers.
+CREATE VIRTUAL TABLE IF NOT EXISTS library_track USING fts5(
+  name,
+  artist,
+  album,
+  content = 'library_entry',
+  content_rowid = 'id',
+  tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS library_entry_insert AFTER INSERT ON library_entry
+BEGIN
+  INSERT INTO library_track (rowid, name, artist, album)
+  VALUES (new.id, new.name, new.artist, new.album);
+END;
+CREATE TRIGGER IF NOT EXISTS library_entry_delete AFTER DELETE ON library_entry
+BEGIN
+  INSERT INTO library_track (library_track, rowid, name, artist, album)
+  VALUES ('delete', old.id, old.name, old.artist, old.album);
+END;
+"""
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _match_expression(query: str) -> str | None:
+    """Turns free text into an FTS5 query matching all words as prefixes."""
+    tokens = _TOKEN.findall(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class LibraryIndex:
+    """Stores and searches the tracks of each user's playlists and liked songs.
+
+    Connections are kept per thread, as tools run on worker threads.
+    """
+
+    def __init__(self, path: str, max_age: float = 3600.0):
+        self.path = path
+        # Seconds after which `needs_sync` reports a user's index as stale.
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._connect() as db:
+            columns = {row[1] for row in db.execute("PRAGMA table_info(library_track)")}
+            # Indexes created when the tracks lived in the full-text table,
+            # where reads and deletes of a user's tracks scanned all users'.
+            # The index is rebuilt from Spotify on the next sync.
+            if "user_id" in columns:
+                db.execute("DROP TABLE library_track")
+                db.execute(
+                    "UPDATE library_source"
+                    " SET indexed_snapshot_id = NULL, indexed_at = NULL"
+                )
+                db.execute("DELETE FROM library_sync")
+            columns = {row[1] for row in db.execute("PRAGMA table_info(library_entry)")}
+            # Entries indexed before the artists were kept apart, which are
+            # indexed again on the next sync.
+            if columns and "artists" not in columns:
+                db.execute("ALTER TABLE library_entry ADD COLUMN artists TEXT")
+                db.execute(
+                    "UPDATE library_source"
+                    " SET indexed_snapshot_id = NULL, indexed_at = NULL"
+                )
+                db.execute("DELETE FROM library_sync")
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            self._local.db = db
+        return db
+
+    def index_playlists(
+        self, user_id: str, playlists: Iterable[tuple[str, str, str | None]]
+    ) -> None:
+        """Records the user's playlists as `(playlist_id, name, snapshot_id)`.
+
+        Playlists that no longer exist are removed from the index.
+        """
+        playlists = list(playlists)
+        with self._connect() as db:
+            db.executemany(
+                """
+                INSERT INTO library_source (user_id, kind, source_id, name, snapshot_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, kind, source_id)
+                DO UPDATE SET name = excluded.name, snapshot_id = excluded.snapshot_id
+                """,
+                [(user_id, PLAYLIST, pid, name, snap) for pid, name, snap in playlists],
+            )
+            current = {pid for pid, _, _ in playlists}
+            stale = [
+                row["source_id"]
+                for row in db.execute(
+                    "SELECT source_id FROM library_source WHERE user_id = ? AND kind = ?",
+                    (user_id, PLAYLIST),
+                )
+                if row["source_id"] not in current
+            ]
+            for source_id in stale:
+                self._delete_source(db, user_id, PLAYLIST, source_id)
+
+    def index_tracks(
+        self,
+        user_id: str,
+        kind: str,
+        source_id: str,
+        tracks: Iterable[Track],
+        name: str | None = None,
+    ) -> None:
+        """Replaces the indexed tracks of one playlist or of the liked songs.
+
+        `tracks` may be a lazy iterator over pages fetched from Spotify. It is
+        consumed in batches, each committed separately, so that the database
+        isn't locked while pages are downloaded. Searches running meanwhile may
+        see a partially indexed source.
+        """
+        db = self._connect()
+        with db:
+            db.execute(
+                "DELETE FROM library_entry WHERE user_id = ? AND kind = ? AND source_id = ?",
+                (user_id, kind, source_id),
+            )
+        for batch in itertools.batched(tracks, INDEX_BATCH_SIZE):
+            with db:
+                db.executemany(
+                    """
+                    INSERT INTO library_entry
+                      (name, artist, album, artists, user_id, kind, source_id, track_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            t.name,
+                            t.artist,
+                            t.album,
+                            json.dumps(t.artists) if t.artists else None,
+                            user_id,
+                            kind,
+                            source_id,
+                            t.track_id,
+                        )
+                        for t in batch
+                    ],
+                )
+        with db:
+            db.execute(
+                """
+                INSERT INTO library_source
+                  (user_id, kind, source_id, name, indexed_snapshot_id, indexed_at)
+                VALUES (?, ?, ?, ?, NULL, ?)
+                ON CONFLICT (user_id, kind, source_id) DO UPDATE SET
+                  name = coalesce(excluded.name, name),
+                  indexed_snapshot_id = snapshot_id,
+                  indexed_at = excluded.indexed_at
+                """,
+                (user_id, kind, source_id, name, time.time()),
+            )
+
+    def set_snapshot(
+        self, user_id: str, kind: str, source_id: str, name: str, snapshot_id: str
+    ) -> None:
+        """Records the current version of a source without indexing its tracks."""
+        with self._connect() as db:
+            db.execute(
+                """
+                INSERT INTO library_source (user_id, kind, source_id, name, snapshot_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, kind, source_id)
+                DO UPDATE SET name = excluded.name, snapshot_id = excluded.snapshot_id
+                """,
+                (user_id, kind, source_id, name, snapshot_id),
+            )
+
+    def stale_sources(self, user_id: str) -> list[tuple[str, str]]:
+        """Returns `(kind, source_id)` of the sources whose indexed tracks are
+        out of date.
+        """
+        rows = self._connect().execute(
+            """
+            SELECT kind, source_id FROM library_source
+            WHERE user_id = ? AND (
+              indexed_at IS NULL OR snapshot_id IS NULL
+              OR indexed_snapshot_id IS NOT snapshot_id
+            )
+            """,
+            (user_id,),
+        )
+        return [(row["kind"], row["source_id"]) for row in rows]
+
+    def needs_sync(self, user_id: str) -> bool:
+        row = (
+            self._connect()
+            .execute("SELECT synced_at FROM library_sync WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        return row is None or time.time() - row["synced_at"] > self.max_age
+
+    def mark_synced(self, user_id: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO library_sync (user_id, synced_at) VALUES (?, ?)",
+                (user_id, time.time()),
+            )
+
+    def expire(self, user_id: str) -> None:
+        """Makes `needs_sync` report the user's index as stale, e.g. after a
+        playlist was changed.
+        """
+        with self._connect() as db:
+            db.execute("DELETE FROM library_sync WHERE user_id = ?", (user_id,))
+
+    def tracks(self, user_id: str) -> Iterator[Track]:
+        """Yields each distinct track of the user's playlists and liked songs."""
+        rows = self._connect().execute(
+            """
+            SELECT track_id, name, artist, album, artists FROM library_entry
+            WHERE user_id = ? AND track_id IS NOT NULL
+            GROUP BY track_id
+            """,
+            (user_id,),
+        )
+        for row in rows:
+            # The shared track also knows its release year.
+            yield track_table.get(row["track_id"]) or Track(
+                row["track_id"],
+                row["name"],
+                row["artist"],
+                row["album"],
+                artists=tuple(json.loads(row["artists"] or "[]")),
+            )
+
+    def search(self, user_id: str, query: str, limit: int = 50) -> list[dict]:
+        """Finds tracks whose name, artist or album match all words of `query`.
+
+        Returns:
+            The best matching tracks, each with the names of the playlists (or
+            "Liked Songs") it appears in.
+        """
+        expression = _match_expression(query)
+        if expression is None:
+            return []
+        rows = self._connect().execute(
+            """
+            SELECT e.track_id, e.name, e.artist, e.album,
+                   json_group_array(DISTINCT coalesce(s.name, e.source_id)) AS sources,
+                   min(library_track.rank) AS best
+            FROM library_track
+            JOIN library_entry e ON e.id = library_track.rowid
+            LEFT JOIN library_source s
+              ON s.user_id = e.user_id AND s.kind = e.kind AND s.source_id = e.source_id
+            WHERE library_track MATCH ? AND e.user_id = ?
+            GROUP BY e.track_id
+            ORDER BY best
+            LIMIT ?
+            """,
+            (expression, user_id, limit),
+        )
+        return [
+            {
+                "name": row["name"],
+                "artist": row["artist"],
+                "album": row["album"],
+                "track_id": row["track_id"],
+                "in": json.loads(row["sources"]),
+            }
+            for row in rows
+        ]
+
+    def _delete_source(
+        self, db: sqlite3.Connection, user_id: str, kind: str, source_id: str
+    ) -> None:
+        db.execute(
+            "DELETE FROM library_entry WHERE user_id = ? AND kind = ? AND source_id = ?",
+            (user_id, kind, source_id),
+        )
+        db.execute(
+            "DELETE FROM library_source WHERE user_id = ? AND kind = ? AND source_id = ?",
+            (user_id, kind, source_id),
+        )
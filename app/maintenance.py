@@ -0,0 +1,185 @@
+"""Garbage collection of stale conversations, Spotify token caches, traces
+and profiles.
+
+Conversations are only deleted by `/clear`, every new browser session creates
+one, and every Spotify login leaves a token cache file behind, so both grow
+without bound. `collect_garbage` deletes conversations that haven't changed
+for `CONVERSATION_MAX_IDLE_DAYS` and token caches that haven't been written
+(spotipy rewrites them on each token refresh) for `SPOTIFY_CACHE_MAX_IDLE_DAYS`,
+then returns the freed pages of the database to the file system. Jobs are
+deleted `JOB_MAX_AGE_DAYS` after they last changed, traces (see
+`app/tracing.py`) `TRACE_MAX_AGE_DAYS` after they started, and request
+profiles (see `app/profiling.py`) `PROFILE_MAX_AGE_DAYS` after they were
+saved.
+
+It runs with `flask gc`, and every `GC_INTERVAL` seconds on a background
+thread of the processes that set it. Databases created before incremental
+vacuum are converted once by `flask migrate-db`, as that rewrites the whole
+file.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from flask import Flask
+
+from app.clients import get_conversation_store, get_job_queue, get_trace_store
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# The value of `PRAGMA auto_vacuum` for incremental vacuum.
+INCREMENTAL = 2
+
+
+@dataclass
+class GCReport:
+    conversations: int = 0
+    token_caches: int = 0
+    jobs: int = 0
+    traces: int = 0
+    profiles: int = 0
+    bytes_reclaimed: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"Deleted {self.conversations} conversations, {self.token_caches}"
+            f" token caches, {self.jobs} jobs, {self.traces} traces and"
+            f" {self.profiles} profiles,"
+            f" reclaimed {self.bytes_reclaimed / 1024:.0f} KiB"
+        )
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def expire_files(directory: str, cutoff: float) -> tuple[int, int]:
+    """Deletes the files in `directory` last written before `cutoff`.
+
+    Returns:
+        The number of files deleted and their total size.
+    """
+    count = size = 0
+    if not os.path.isdir(directory):
+        return count, size
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    # Deleted by a concurrent run.
+                    continue
+                count += 1
+                size += stat.st_size
+    return count, size
+
+
+def vacuum(path: str) -> int:
+    """Returns the free pages of the SQLite database at `path` to the file
+    system.
+
+    Returns:
+        The number of bytes the database shrank by.
+    """
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        if db.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL:
+            logger.warning(
+                f"{path} doesn't use incremental vacuum, run `flask migrate-db`"
+            )
+            return 0
+        # Measures the main file once the WAL is checkpointed, so that neither
+        # the pages moved out of the WAL nor the truncated WAL count.
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        before = _file_size(path)
+        # Frees one page per step, so all rows must be fetched.
+        db.execute("PRAGMA incremental_vacuum").fetchall()
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return before - _file_size(path)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Could not vacuum {path}: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def enable_incremental_vacuum(path: str) -> bool:
+    """Converts the SQLite database at `path`, if created before incremental
+    vacuum, with a full vacuum. This rewrites the database and locks it
+    meanwhile.
+
+    Returns:
+        Whether the database was converted.
+    """
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        if db.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL:
+            return False
+        logger.info(f"Converting {path} to incremental vacuum")
+        # Only takes effect with the full vacuum.
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute("VACUUM")
+        return True
+    finally:
+        db.close()
+
+
+def collect_garbage(app: Flask) -> GCReport:
+    """Deletes stale conversations, token caches, jobs, traces and profiles of
+    `app`.
+    """
+    config = app.config
+    now = time.time()
+    report = GCReport()
+    with app.app_context():
+        report.conversations = get_conversation_store().delete_idle(
+            now - config["CONVERSATION_MAX_IDLE_DAYS"] * DAY
+        )
+        report.jobs = get_job_queue().delete_old(now - config["JOB_MAX_AGE_DAYS"] * DAY)
+        trace_store = get_trace_store()
+        if trace_store is not None:
+            report.traces = trace_store.delete_old(
+                now - config["TRACE_MAX_AGE_DAYS"] * DAY
+            )
+    report.token_caches, size = expire_files(
+        config["SPOTIFY_CACHE_DIR"], now - config["SPOTIFY_CACHE_MAX_IDLE_DAYS"] * DAY
+    )
+    report.bytes_reclaimed += size
+    report.profiles, size = expire_files(
+        config["PROFILES"], now - config["PROFILE_MAX_AGE_DAYS"] * DAY
+    )
+    report.bytes_reclaimed += size
+    if config["CONVERSATION_STORE"] == "sqlite":
+        report.bytes_reclaimed += vacuum(config["DATABASE"])
+    logger.info(str(report))
+    return report
+
+
+def _collect_periodically(app: Flask, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            collect_garbage(app)
+        except Exception:
+            logger.exception("Garbage collection failed")
+
+
+def init_app(app: Flask) -> None:
+    interval = app.config["GC_INTERVAL"]
+    if interval > 0:
+        threading.Thread(
+            target=_collect_periodically,
+            args=(app, interval),
+            name="gc",
+            daemon=True,
+        ).start()
@@ -0,0 +1,62 @@
+"""Chooses the model for each stage of a chat turn.
+
+A turn starts with a call that usually answers the user directly (the model
+is told to only use tools after the user confirms), which the final model
+makes. Once tools were called, the following rounds mostly just pick the next
+tool and its arguments, which a faster model does well. When the tool model
+answers instead, the final model writes the answer the user sees, unless both
+are the same model. The final model also answers when the turn's budget is
+used up and the model may no longer call tools.
+
+A stage's latency budget only applies if a fallback model is configured;
+otherwise there is nothing better to do than to keep waiting.
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Literal
+
+type Stage = Literal["tool", "final"]
+
+TOOL_STAGE: Stage = "tool"
+FINAL_STAGE: Stage = "final"
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    model: str
+    # Seconds to wait for the model before switching to the fallback model, if
+    # there is one.
+    latency_budget: float | None = None
+    fallback_model: str | None = None
+
+
+class ModelRouter:
+    def __init__(self, tool: ModelRoute, final: ModelRoute):
+        self._routes: dict[Stage, ModelRoute] = {TOOL_STAGE: tool, FINAL_STAGE: final}
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "ModelRouter":
+        fallback = config["OPENAI_FALLBACK_MODEL"] or None
+
+        def route(model: str, budget: float) -> ModelRoute:
+            return ModelRoute(model, (budget or None) if fallback else None, fallback)
+
+        return cls(
+            tool=route(
+                config["OPENAI_TOOL_MODEL"], config["OPENAI_TOOL_LATENCY_BUDGET"]
+            ),
+            final=route(
+                config["OPENAI_FINAL_MODEL"], config["OPENAI_FINAL_LATENCY_BUDGET"]
+            ),
+        )
+
+    def route(self, stage: Stage) -> ModelRoute:
+        return self._routes[stage]
+
+    @property
+    def rewrites_final_answer(self) -> bool:
+        """Whether answers of the tool model are written again by the final
+        model.
+        """
+        return self._routes[TOOL_STAGE].model != self._routes[FINAL_STAGE].model
@@ -0,0 +1,207 @@
+"""Minimal edits that turn a playlist's tracks into the desired ones.
+
+`create_playlist` was the only way to change a playlist, so every refinement
+("swap out the last five songs") created a new playlist and added all its
+tracks again. `plan_edits` compares the current tracks with the desired ones
+and plans the fewest requests that change one into the other: removals, then
+moves of the tracks out of order, then insertions of the new tracks. If the
+playlist has duplicates, or the edits take many more requests than replacing
+the tracks outright, the plan replaces them instead.
+
+The tracks of the playlists updated recently are kept with their snapshot id,
+so that the next update only fetches the snapshot id to check that the
+playlist hasn't changed meanwhile.
+"""
+
+import bisect
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+# Maximum number of tracks per request of the Spotify playlist endpoints.
+PLAYLIST_BATCH_SIZE = 100
+
+# Replacing the tracks resets the dates they were added on, so edits are
+# preferred while they take at most this many requests, or no more than
+# replacing.
+MAX_EDIT_REQUESTS = 10
+
+
+def track_uri(value: str) -> str:
+    """Returns the URI of a track given by ID or URI."""
+    return value if value.startswith("spotify:") else f"spotify:track:{value}"
+
+
+@dataclass
+class PlaylistEdits:
+    """The requests that change a playlist, each with at most
+    `PLAYLIST_BATCH_SIZE` tracks.
+    """
+
+    added: int = 0
+    removed: int = 0
+    # Batches of URIs to remove.
+    removals: list[list[str]] = field(default_factory=list)
+    # `(range_start, insert_before, range_length)`, applied in order.
+    moves: list[tuple[int, int, int]] = field(default_factory=list)
+    # `(position, uris)`, applied in order.
+    additions: list[tuple[int, list[str]]] = field(default_factory=list)
+    # Batches of URIs, the first replacing the tracks and the others appended.
+    # Set instead of the incremental edits.
+    replacement: list[list[str]] | None = None
+
+    @property
+    def requests(self) -> int:
+        if self.replacement is not None:
+            return len(self.replacement)
+        return len(self.removals) + len(self.moves) + len(self.additions)
+
+
+def _batches(items: list[str], size: int = PLAYLIST_BATCH_SIZE) -> list[list[str]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _longest_increasing(values: list[int]) -> set[int]:
+    """Returns the values of a longest strictly increasing subsequence."""
+    # tails[k] is the index of the smallest last value of a subsequence of
+    # length k + 1 found so far.
+    tails: list[int] = []
+    tail_values: list[int] = []
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        k = bisect.bisect_left(tail_values, value)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+    result = set()
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        result.add(values[i])
+        i = previous[i]
+    return result
+
+
+def _moves(
+    current: list[str], desired: list[str], keep: set[int]
+) -> list[tuple[int, int, int]]:
+    """Plans the moves that put `current` in the order of `desired`, both with
+    the same distinct tracks, leaving the positions `keep` of `desired` where
+    they are.
+    """
+    order = list(current)
+    moves = []
+    i = 0
+    while i < len(desired):
+        if i in keep:
+            i += 1
+            continue
+        start = order.index(desired[i])
+        # Tracks that follow each other in both lists move together.
+        length = 1
+        while (
+            i + length < len(desired)
+            and i + length not in keep
+            and start + length < len(order)
+            and order[start + length] == desired[i + length]
+        ):
+            length += 1
+        # Right after the previous track, which is in place already.
+        insert_before = order.index(desired[i - 1]) + 1 if i else 0
+        if insert_before != start:
+            moves.append((start, insert_before, length))
+            block = order[start : start + length]
+            del order[start : start + length]
+            at = insert_before - length if insert_before > start else insert_before
+            order[at:at] = block
+        i += length
+    return moves
+
+
+def plan_edits(current: Sequence[str | None], desired: Sequence[str]) -> PlaylistEdits:
+    """Plans the requests that change the tracks `current` into `desired`.
+
+    Args:
+        current: URIs of the tracks in the playlist, None for tracks that are
+            no longer available.
+        desired: URIs of the tracks the playlist should have, in order.
+    """
+    desired = list(desired)
+    current_set = set(current)
+    desired_set = set(desired)
+    edits = PlaylistEdits(
+        added=len(desired_set - current_set),
+        removed=len(current_set - desired_set - {None}),
+    )
+    replacement = _batches(desired) or [[]]
+    budget = max(len(replacement), MAX_EDIT_REQUESTS)
+    if (
+        None in current_set
+        or len(current_set) < len(current)
+        or len(desired_set) < len(desired)
+    ):
+        # Tracks can only be removed by URI, which would remove all copies.
+        edits.replacement = replacement
+        return edits
+
+    edits.removals = _batches([uri for uri in current if uri not in desired_set])
+    kept = [uri for uri in current if uri in desired_set]
+    kept_desired = [uri for uri in desired if uri in current_set]
+    rank = {uri: i for i, uri in enumerate(kept_desired)}
+    keep = _longest_increasing([rank[uri] for uri in kept])
+    if len(kept) - len(keep) > budget:
+        # Each moved track may take a request.
+        edits.removals = []
+        edits.replacement = replacement
+        return edits
+    edits.moves = _moves(kept, kept_desired, keep)
+
+    position = 0
+    while position < len(desired):
+        if desired[position] in current_set:
+            position += 1
+            continue
+        end = position
+        while end < len(desired) and desired[end] not in current_set:
+            end += 1
+        for offset, batch in enumerate(_batches(desired[position:end])):
+            edits.additions.append((position + offset * PLAYLIST_BATCH_SIZE, batch))
+        position = end
+
+    if edits.requests > budget:
+        edits.removals, edits.moves, edits.additions = [], [], []
+        edits.replacement = replacement
+    return edits
+
+
+class PlaylistSnapshots:
+    """An LRU cache of the tracks of playlists by playlist ID, with the
+    snapshot ID they belong to.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._snapshots: OrderedDict[str, tuple[str, list[str | None]]] = OrderedDict()
+
+    def get(self, playlist_id: str) -> tuple[str, list[str | None]] | None:
+        with self._lock:
+            snapshot = self._snapshots.get(playlist_id)
+            if snapshot is not None:
+                self._snapshots.move_to_end(playlist_id)
+            return snapshot
+
+    def put(self, playlist_id: str, snapshot_id: str, uris: list[str | None]) -> None:
+        with self._lock:
+            self._snapshots[playlist_id] = (snapshot_id, list(uris))
+            self._snapshots.move_to_end(playlist_id)
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+
+
+playlist_snapshots = PlaylistSnapshots()
@@ -0,0 +1,108 @@
+"""Opt-in profiling of single requests.
+
+CPU hotspots such as formatting the history for the logs or encoding it for
+the database are hard to reproduce locally. An operator can profile a `/chat`
+turn or a page load by sending `X-Profile: 1` along with the debug token (see
+`app/debug_routes.py`), and a share of all such requests can be profiled with
+`PROFILE_SAMPLE_RATE`. Profiles are stored in `pstats` format under
+`instance/profiles`, named after the conversation, and listed at
+`/debug/profiles`.
+
+The profiler sees every thread, so the profile of a chat turn includes its
+tool calls, but also whatever other requests did meanwhile. Only one request
+is profiled at a time.
+"""
+
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from flask import current_app, request
+
+from app.debug_routes import has_debug_access
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+
+
+class RequestProfile:
+    def __init__(self, directory: str, endpoint: str, conversation_id: str | None):
+        self.directory = directory
+        self.name = f"{time.time_ns() // 1_000_000}_{endpoint}_{conversation_id}.prof"
+        self._profile = cProfile.Profile()
+        # Number of the request's threads inside `running`.
+        self._active = 0
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.name)
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        """Profiles while the context is active on any of the request's
+        threads, and saves the profile when the last one leaves it.
+        """
+        if not self._enter():
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def _enter(self) -> bool:
+        global _owner
+        with _lock:
+            if _owner not in (None, self):
+                return False
+            if self._active == 0:
+                _owner = self
+                self._profile.enable()
+            self._active += 1
+            return True
+
+    def _exit(self) -> None:
+        global _owner
+        with _lock:
+            self._active -= 1
+            if self._active:
+                return
+            self._profile.disable()
+            _owner = None
+            # Saved again if a thread of the request enters `running` later.
+            os.makedirs(self.directory, exist_ok=True)
+            self._profile.dump_stats(self.path)
+        logger.info(f"Saved profile {self.name}")
+
+
+# Only one profiler can be active in the process.
+_lock = threading.Lock()
+_owner: RequestProfile | None = None
+
+
+def start(endpoint: str, conversation_id: str | None) -> RequestProfile | None:
+    """Returns a profile for the current request if it should be profiled."""
+    rate = current_app.config["PROFILE_SAMPLE_RATE"]
+    requested = request.headers.get(PROFILE_HEADER) and has_debug_access()
+    if not requested and not (rate > 0 and random.random() < rate):
+        return None
+    if _owner is not None:
+        logger.info("Not profiling, another request is being profiled")
+        return None
+    return RequestProfile(current_app.config["PROFILES"], endpoint, conversation_id)
+
+
+@contextmanager
+def running(profile: RequestProfile | None) -> Iterator[None]:
+    """Profiles for `profile`, if there is one."""
+    if profile is None:
+        yield
+        return
+    with profile.running():
+        yield
@@ -0,0 +1,209 @@
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, dependency: str, retry_after: float | None):
+        if retry_after is None:
+            # Half-open: the probe decides when calls are let through again.
+            when = "retry shortly"
+        else:
+            when = f"retry in {max(1, round(retry_after))} seconds"
+        super().__init__(f"{dependency} is temporarily unavailable, {when}.")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Jittered exponential backoff for retryable errors."""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def backoff(self, attempt: int) -> float:
+        """Returns the delay before retry number `attempt` (starting at 1).
+
+        Uses "full jitter": a uniform random delay between zero and the
+        exponential cap, so that concurrent clients don't retry in lockstep.
+        """
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures of a dependency and fails fast when it is down.
+
+    The breaker is closed while the dependency is healthy. After
+    `failure_threshold` consecutive failures it opens and rejects all calls for
+    `reset_timeout` seconds. After that a single probe call is let through
+    (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> bool:
+        """Raises `CircuitOpenError` if the call must not be attempted.
+
+        Returns:
+            Whether the call is the probe of a half-open breaker, which must
+            end with `record_success`, `record_failure` or `end_probe`.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            if self._state == self.HALF_OPEN:
+                raise CircuitOpenError(self.name, None)
+            elapsed = self._clock() - self._opened_at
+            if elapsed >= self.reset_timeout:
+                logger.info(f"Circuit '{self.name}' half-open, probing dependency")
+                self._state = self.HALF_OPEN
+                return True
+            raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+
+    def end_probe(self) -> None:
+        """Re-opens a breaker whose probe ended without an outcome, e.g. because
+        it was interrupted, so that the next call probes again.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"Circuit '{self.name}' opened after {self._failures} failures"
+                    )
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class Dependency:
+    """An external service called through a shared retry policy and breaker.
+
+    `is_retryable` decides whether an exception indicates a transient problem
+    with the dependency (timeouts, rate limits, 5xx). Only those are retried
+    and counted against the circuit breaker; any other exception means the
+    dependency answered and is re-raised immediately. `retry_after` can extract
+    a server-provided delay (e.g. a `Retry-After` header) from an exception.
+    `is_unsent` decides whether a transient exception means that the request
+    was not carried out (rate limits, failures to connect), the only ones after
+    which `call_write` retries.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        is_retryable: Callable[[BaseException], bool],
+        retry_after: Callable[[BaseException], float | None] = lambda e: None,
+        is_unsent: Callable[[BaseException], bool] = lambda e: False,
+        policy: RetryPolicy | None = None,
+        breaker: CircuitBreaker | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.is_retryable = is_retryable
+        self.retry_after = retry_after
+        self.is_unsent = is_unsent
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(name)
+        self._sleep = sleep
+
+    def call[T](self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Calls `fn`, retrying transient failures with backoff."""
+        return self._call(self.is_retryable, fn, *args, **kwargs)
+
+    def call_write[T](self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Calls `fn`, a request that is not idempotent, such as adding tracks.
+
+        A timeout or server error may come after the request was carried out,
+        so that a retry would carry it out twice. Only failures for which
+        `is_unsent` holds are retried.
+        """
+        return self._call(self.is_unsent, fn, *args, **kwargs)
+
+    def _call[T](
+        self,
+        may_retry: Callable[[BaseException], bool],
+        fn: Callable[..., T],
+        *args,
+        **kwargs,
+    ) -> T:
+        attempt = 1
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self.is_retryable(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.policy.max_attempts or not may_retry(e):
+                    raise
+                delay = self.retry_after(e)
+                if delay is None:
+                    delay = self.policy.backoff(attempt)
+                delay = min(delay, self.policy.max_delay)
+                logger.warning(
+                    f"{self.name} call failed ({type(e).__name__}: {e}), "
+                    f"retry {attempt}/{self.policy.max_attempts - 1} in {delay:.2f}s"
+                )
+                self._sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+
+
+def error_output(e: BaseException) -> dict[str, dict[str, str]]:
+    """Describes a failed tool call in a form the model can reason about."""
+    return {"error": {"type": type(e).__name__, "message": str(e)}}
@@ -1,11 +1,15 @@
 import json
 import logging
 import os
+import queue
+import threading
 import uuid
+from typing import TYPE_CHECKING
 
 from flask import (
     Blueprint,
     Response,
+    current_app,
     jsonify,
     redirect,
     render_template,
@@ -14,59 +18,108 @@ from flask import (
     stream_with_context,
     url_for,
 )
-from openai.types.responses import (
-    ResponseInputParam,
-)
-from spotipy.oauth2 import SpotifyOAuth
 
-from app.chat_client import ChatClient, ChatResponse, ToolCallResponse
+from app import profiling, tracing
+from app.chat_types import (
+    ChatResponse,
+    ChatStreamResponse,
+    ToolCallResponse,
+    ToolProgressResponse,
+    consistent_history,
+)
+from app.clients import (
+    get_chat_client,
+    get_library_cache,
+    get_library_index,
+    get_prefetcher,
+    get_similarity_index,
+    get_trace_store,
+    get_track_resolver,
+)
+from app.connections import get_spotify_session
 from app.database import (
     create_conversation,
     delete_conversation,
+    flush_conversations,
     get_conversation,
     update_conversation,
 )
-from app.spotify_client import SpotifyClient
+
+if TYPE_CHECKING:
+    from openai.types.responses import ResponseInputParam
+
+    from app.spotify_client import SpotifyClient
 
 logger = logging.getLogger(__name__)
 
 bp = Blueprint("routes", __name__)
-chat_client = ChatClient()
 
 SCOPE = "playlist-read-private user-library-read playlist-modify-public"
 
 
 def get_spotify_auth_manager():
+    from spotipy.oauth2 import SpotifyOAuth
+
     return SpotifyOAuth(
         client_id=os.getenv("SPOTIFY_CLIENT_ID"),
         client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
         redirect_uri=url_for("routes.spotify_callback", _external=True),
         scope=SCOPE,
         cache_path=session.get("spotify_cache_path"),
+        requests_session=get_spotify_session(),
     )
 
 
+def get_spotify_client(auth_manager) -> "SpotifyClient":
+    from app.spotify_client import SpotifyClient
+
+    return SpotifyClient(
+        auth_manager=auth_manager,
+        library_index=get_library_index(),
+        library_cache=get_library_cache(),
+        track_resolver=get_track_resolver(),
+        similarity_index=get_similarity_index(),
+    )
+
+
+def prefetch_library(auth_manager) -> None:
+    """Starts loading the user's library in the background, so that the first
+    library question of the session is answered from memory.
+    """
+    if "spotify_cache_id" in session:
+        get_prefetcher().prefetch(
+            session["spotify_cache_id"], get_spotify_client(auth_manager)
+        )
+
+
 @bp.route("/", methods=["GET"])
 def index():
     """Main chat page."""
     if "conversation_id" not in session:
         session["conversation_id"] = str(uuid.uuid4())
-        create_conversation(session["conversation_id"], [])
+        create_conversation(
+            session["conversation_id"], [], session.get("spotify_cache_id")
+        )
 
-    conversation_history = get_conversation(session["conversation_id"])
-    if conversation_history is None:
-        create_conversation(session["conversation_id"], [])
+    with profiling.running(profiling.start("index", session["conversation_id"])):
         conversation_history = get_conversation(session["conversation_id"])
+        if conversation_history is None:
+            create_conversation(
+                session["conversation_id"], [], session.get("spotify_cache_id")
+            )
+            conversation_history = get_conversation(session["conversation_id"])
 
-    auth_manager = get_spotify_auth_manager()
-    token_info = auth_manager.cache_handler.get_cached_token()
-    is_spotify_connected = auth_manager.validate_token(token_info) is not None
+        auth_manager = get_spotify_auth_manager()
+        token_info = auth_manager.cache_handler.get_cached_token()
+        is_spotify_connected = auth_manager.validate_token(token_info) is not None
+        if is_spotify_connected:
+            prefetch_library(auth_manager)
 
-    return render_template(
-        "index.html",
-        conversation=conversation_history,
-        is_spotify_connected=is_spotify_connected,
-    )
+        return render_template(
+            "index.html",
+            conversation=conversation_history,
+            is_spotify_connected=is_spotify_connected,
+        )
 
 
 @bp.route("/spotify/login")
@@ -75,7 +128,9 @@ def spotify_login():
     if "spotify_cache_id" not in session:
         session["spotify_cache_id"] = str(uuid.uuid4())
     # Use a unique cache path for each user's session
-    session["spotify_cache_path"] = f".spotify_cache/{session['spotify_cache_id']}"
+    session["spotify_cache_path"] = os.path.join(
+        current_app.config["SPOTIFY_CACHE_DIR"], session["spotify_cache_id"]
+    )
     auth_manager = get_spotify_auth_manager()
     return redirect(auth_manager.get_authorize_url())
 
@@ -85,6 +140,7 @@ def spotify_callback():
     """Handles the callback from Spotify."""
     auth_manager = get_spotify_auth_manager()
     auth_manager.get_access_token(request.args.get("code"))
+    prefetch_library(auth_manager)
     return redirect(url_for("routes.index"))
 
 
@@ -106,34 +162,109 @@ def chat():
     )
     update_conversation(conversation_id, conversation_history)
 
-    auth_manager = get_spotify_auth_manager()
-    spotify_client = SpotifyClient(auth_manager=auth_manager)
+    if "spotify_cache_id" in session:
+        get_prefetcher().touch(session["spotify_cache_id"])
+    spotify_client = get_spotify_client(get_spotify_auth_manager())
+    chat_client = get_chat_client()
+
+    heartbeat_interval = current_app.config["SSE_HEARTBEAT_INTERVAL"]
+    trace_store = get_trace_store()
+    profile = profiling.start("chat", conversation_id)
 
     def stream():
+        with (
+            profiling.running(profile),
+            tracing.trace(
+                trace_store, "routes.chat", conversation_id=conversation_id
+            ) as root,
+        ):
+            # Lets support look up the trace of a turn.
+            yield f"data: {json.dumps({'trace_id': root.trace_id})}\n\n"
+            yield from respond()
+
+    def respond():
         logger.info("Starting chat response stream")
 
-        for response in chat_client.get_chat_completion(
-            conversation_history, spotify_client
-        ):
-            logger.info("Got completion response")
-            match response:
-                case ChatResponse(history, response):
-                    update_conversation(conversation_id, history)
-                    data = {"response": response}
-                    json_data = json.dumps(data)
-                    yield f"data: {json_data}\n\n"
-                case ToolCallResponse(function_name, arguments):
-                    tool_code = f"{function_name}({arguments})"
-                    data = {"tool_code": tool_code}
-                    json_data = json.dumps(data)
-                    yield f"data: {json_data}\n\n"
-
-        json_end = json.dumps({"status": "end"})
-        yield f"data: {json_end}\n\n"
+        # The turn runs on its own thread, so that this generator keeps writing
+        # to the client and notices when it disconnects.
+        cancel = threading.Event()
+        events: queue.Queue[ChatStreamResponse | None] = queue.Queue()
+
+        def produce() -> None:
+            try:
+                with profiling.running(profile):
+                    for response in chat_client.get_chat_completion(
+                        conversation_history, spotify_client, cancel, events.put
+                    ):
+                        events.put(response)
+            finally:
+                events.put(None)
+
+        threading.Thread(
+            target=tracing.propagate(produce), name="chat-turn", daemon=True
+        ).start()
+
+        finished = False
+        try:
+            while (response := _next_event(events, heartbeat_interval)) is not None:
+                if response == "heartbeat":
+                    yield ": heartbeat\n\n"
+                    continue
+                logger.info("Got completion response")
+                match response:
+                    case ChatResponse(history, response):
+                        update_conversation(conversation_id, history)
+                        data = {"response": response}
+                        json_data = json.dumps(data)
+                        yield f"data: {json_data}\n\n"
+                    case ToolCallResponse(function_name, arguments):
+                        tool_code = f"{function_name}({arguments})"
+                        data = {"tool_code": tool_code}
+                        json_data = json.dumps(data)
+                        yield f"data: {json_data}\n\n"
+                    case ToolProgressResponse(function_name, job_id, progress, message):
+                        data = {
+                            "tool_progress": {
+                                "tool": function_name,
+                                "job_id": job_id,
+                                "progress": progress,
+                                "message": message,
+                            }
+                        }
+                        yield f"data: {json.dumps(data)}\n\n"
+
+            # The turn is saved once the client learns it ended.
+            if not flush_conversations():
+                logger.error("Conversation was not saved at the end of the turn")
+            json_end = json.dumps({"status": "end"})
+            yield f"data: {json_end}\n\n"
+            finished = True
+        finally:
+            # The server closes this generator when writing to the client
+            # fails. Stop the turn and keep what was done so far.
+            if not finished:
+                logger.info("Client disconnected, cancelling chat turn")
+                cancel.set()
+                update_conversation(
+                    conversation_id, consistent_history(conversation_history)
+                )
+                flush_conversations()
 
     return Response(stream_with_context(stream()), mimetype="text/event-stream")
 
 
+def _next_event(
+    events: "queue.Queue[ChatStreamResponse | None]", timeout: float
+) -> "ChatStreamResponse | str | None":
+    """Waits for the next response of the turn, or returns "heartbeat" after
+    `timeout` seconds.
+    """
+    try:
+        return events.get(timeout=timeout)
+    except queue.Empty:
+        return "heartbeat"
+
+
 @bp.route("/clear", methods=["POST"])
 def clear_chat():
     """Clears the conversation history from the database and session."""
@@ -1,6 +0,0 @@
-DROP TABLE IF EXISTS conversation;
-
-CREATE TABLE conversation (
-  id TEXT PRIMARY KEY,
-  history TEXT NOT NULL
-);
@@ -0,0 +1,287 @@
+"""Vector similarity search over each user's library.
+
+To answer "find songs in my library similar to X", the model used to read the
+whole library as text. `SimilarityIndex` keeps a feature vector per track of
+the user's library in a memory-mapped float32 matrix, so that a query is a
+single matrix product.
+
+Spotify no longer serves audio features to new apps, so the vectors are built
+from track metadata: artists, album, release year and title words, hashed
+into a fixed number of dimensions. Tracks are similar when they share
+artists, albums or era.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.track_resolver import normalize
+from app.tracks import Track
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = 256
+
+# Minimum number of rows allocated in a user's matrix file.
+MIN_CAPACITY = 1024
+
+EXTRA_CANDIDATES = 5
+
+
+@functools.lru_cache(maxsize=65536)
+def _bucket(feature: str, dimensions: int) -> tuple[int, float]:
+    """Hashes a feature to a dimension and a sign, which keeps collisions from
+    adding up.
+    """
+    value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest())
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+
+# Artists and albums repeat across a library.
+_normalize_name = functools.lru_cache(maxsize=65536)(normalize)
+
+
+def _features(track: Track) -> list[tuple[str, float]]:
+    artists = [_normalize_name(artist) for artist in track.artists or (track.artist,)]
+    features = [(f"artist:{artist}", 3.0) for artist in artists]
+    features.append((f"album:{_normalize_name(track.album)}:{artists[0]}", 2.0))
+    if track.release_year:
+        year = track.release_year
+        features.append((f"decade:{year // 10}", 1.5))
+        features.extend(
+            (f"year:{y}", 1.0 if y == year else 0.5) for y in (year - 1, year, year + 1)
+        )
+    features.extend(
+        (f"word:{word}", 0.5) for word in normalize(track.name).split() if len(word) > 2
+    )
+    return features
+
+
+def vectorize(tracks: list[Track], dimensions: int = DIMENSIONS) -> np.ndarray:
+    """Returns the L2-normalized feature vectors of `tracks`, one per row."""
+    rows, columns, values = [], [], []
+    for row, track in enumerate(tracks):
+        for feature, weight in _features(track):
+            column, sign = _bucket(feature, dimensions)
+            rows.append(row)
+            columns.append(column)
+            values.append(sign * weight)
+    flat = np.asarray(rows, dtype=np.int64) * dimensions + columns
+    vectors = (
+        np.bincount(flat, weights=values, minlength=len(tracks) * dimensions)
+        .reshape(len(tracks), dimensions)
+        .astype(np.float32)
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+@dataclass
+class _UserMatrix:
+    matrix_path: str
+    tracks_path: str
+    tracks: list[Track]
+    rows: dict[str, int]
+    matrix: np.memmap | None
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.matrix is None else self.matrix.shape[0]
+
+
+class SimilarityIndex:
+    """Per-user track vectors in memory-mapped files under `directory`.
+
+    For each user, `<key>.f32` holds the matrix and `<key>.jsonl` the tracks of
+    its rows, appended to as tracks are added. Only the files of the
+    `max_users` most recently active users are kept open.
+    """
+
+    def __init__(
+        self, directory: str, dimensions: int = DIMENSIONS, max_users: int = 100
+    ):
+        self.directory = directory
+        self.dimensions = dimensions
+        self.max_users = max_users
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._users: OrderedDict[str, _UserMatrix] = OrderedDict()
+
+    def _user(self, user_id: str) -> _UserMatrix:
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+            return user
+        key = hashlib.sha256(user_id.encode()).hexdigest()[:32]
+        base = os.path.join(self.directory, key)
+        tracks = []
+        if os.path.exists(f"{base}.jsonl"):
+            with open(f"{base}.jsonl") as f:
+                tracks = [_row_track(json.loads(line)) for line in f]
+        user = _UserMatrix(
+            matrix_path=f"{base}.f32",
+            tracks_path=f"{base}.jsonl",
+            tracks=tracks,
+            rows={track.track_id: row for row, track in enumerate(tracks)},  # type: ignore[misc]
+            matrix=None,
+        )
+        if tracks:
+            user.matrix = self._open(user.matrix_path)
+        self._users[user_id] = user
+        while len(self._users) > self.max_users:
+            _, evicted = self._users.popitem(last=False)
+            if evicted.matrix is not None:
+                evicted.matrix.flush()
+                # Unmaps the file once no query uses the matrix anymore.
+                evicted.matrix = None
+        return user
+
+    def _open(self, path: str) -> np.memmap:
+        capacity = os.path.getsize(path) // (4 * self.dimensions)
+        return np.memmap(
+            path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions)
+        )
+
+    def _reserve(self, user: _UserMatrix, count: int) -> np.memmap:
+        if user.matrix is not None and count <= user.capacity:
+            return user.matrix
+        capacity = max(count, 2 * user.capacity, MIN_CAPACITY)
+        if user.matrix is not None:
+            user.matrix.flush()
+            user.matrix = None
+        with open(user.matrix_path, "ab") as f:
+            f.truncate(capacity * 4 * self.dimensions)
+        user.matrix = self._open(user.matrix_path)
+        return user.matrix
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            return len(self._user(user_id).tracks)
+
+    def add(self, user_id: str, tracks: Iterable[Track]) -> int:
+        """Adds the tracks that aren't in the user's index yet.
+
+        Returns:
+            The number of tracks added.
+        """
+        with self._lock:
+            user = self._user(user_id)
+            new: dict[str, Track] = {}
+            for track in tracks:
+                if track.track_id and track.track_id not in user.rows:
+                    new.setdefault(track.track_id, track)
+            if not new:
+                return 0
+            start = len(user.tracks)
+            matrix = self._reserve(user, start + len(new))
+            matrix[start : start + len(new)] = vectorize(
+                list(new.values()), self.dimensions
+            )
+            matrix.flush()
+            with open(user.tracks_path, "a") as f:
+                for row, track in enumerate(new.values(), start):
+                    f.write(json.dumps(_track_row(track)) + "\n")
+                    user.tracks.append(track)
+                    user.rows[track.track_id] = row  # type: ignore[index]
+            return len(new)
+
+    def sync(self, user_id: str, tracks: Iterable[Track]) -> None:
+        """Makes the user's index hold exactly `tracks`, adding missing tracks
+        and dropping the others.
+        """
+        tracks = list(tracks)
+        keep = {track.track_id for track in tracks}
+        with self._lock:
+            user = self._user(user_id)
+            kept_rows = [row for row, t in enumerate(user.tracks) if t.track_id in keep]
+            if len(kept_rows) < len(user.tracks):
+                self._compact(user, kept_rows)
+        added = self.add(user_id, tracks)
+        logger.info(f"Similarity index synced: {added} tracks added")
+
+    def _compact(self, user: _UserMatrix, kept_rows: list[int]) -> None:
+        assert user.matrix is not None
+        vectors = np.array(user.matrix[kept_rows])
+        tracks = [user.tracks[row] for row in kept_rows]
+        user.matrix.flush()
+        user.matrix = None
+        os.remove(user.matrix_path)
+        user.tracks, user.rows = [], {}
+        if tracks:
+            matrix = self._reserve(user, len(tracks))
+            matrix[: len(tracks)] = vectors
+            matrix.flush()
+        with open(user.tracks_path, "w") as f:
+            for row, track in enumerate(tracks):
+                f.write(json.dumps(_track_row(track)) + "\n")
+                user.tracks.append(track)
+                user.rows[track.track_id] = row  # type: ignore[index]
+
+    def find_similar(
+        self, user_id: str, seeds: list[Track], limit: int = 10
+    ) -> list[list[tuple[Track, float]]]:
+        """Finds the tracks of the user's library most similar to each seed.
+
+        Returns:
+            For each seed, up to `limit` `(track, cosine similarity)` pairs,
+            most similar first. The seed and other versions of it are left out.
+        """
+        queries = vectorize(seeds, self.dimensions)
+        with self._lock:
+            user = self._user(user_id)
+            # Rows below `count` don't change when tracks are added later.
+            tracks = user.tracks
+            count = len(tracks)
+            if not count:
+                return [[] for _ in seeds]
+            assert user.matrix is not None
+            scores = queries @ user.matrix[:count].T
+
+        # A few extra candidates make up for the versions of the seed.
+        k = min(limit + EXTRA_CANDIDATES, count)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for seed, seed_scores, candidates in zip(seeds, scores, top):
+            seed_version = (normalize(seed.name), seed.artist)
+            similar = []
+            for row in candidates[np.argsort(-seed_scores[candidates])]:
+                track = tracks[row]
+                if track.track_id == seed.track_id or (
+                    (normalize(track.name), track.artist) == seed_version
+                ):
+                    continue
+                similar.append((track, float(seed_scores[row])))
+            results.append(similar[:limit])
+        return results
+
+
+def _track_row(track: Track) -> list:
+    return [
+        track.track_id,
+        track.name,
+        track.artist,
+        track.album,
+        track.release_year,
+        list(track.artists),
+    ]
+
+
+def _row_track(row: list) -> Track:
+    # Rows written before the artists were stored have five fields.
+    track_id, name, artist, album, release_year, *artists = row
+    return Track(
+        track_id,
+        name,
+        artist,
+        album,
+        release_year,
+        tuple(artists[0] if artists else ()),
+    )
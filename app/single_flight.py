@@ -0,0 +1,61 @@
+"""Coalescing of identical concurrent calls.
+
+With two tabs open, or parallel tool calls asking for the same playlist, the
+same Spotify data used to be fetched several times at once. `SingleFlight`
+lets the first caller for a key do the work while later callers with the same
+key wait for its result.
+"""
+
+import logging
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Shares the result of a call among all callers that asked for the same
+    key while it was running.
+
+    If the call fails, the waiting callers get the same exception, unless it is
+    one of `retry_on`: failures specific to the first caller (e.g. its turn was
+    cancelled), after which the waiting callers run the call again themselves.
+    Results are shared, so callers must not modify them.
+    """
+
+    def __init__(self, retry_on: tuple[type[BaseException], ...] = ()):
+        self.retry_on = retry_on
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do[T](self, key: Hashable, fn: Callable[[], T]) -> T:
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = Future()
+                    break
+            logger.info(f"Waiting for call in flight: {key}")
+            try:
+                return future.result()
+            except self.retry_on as e:
+                logger.info(
+                    f"Call in flight failed ({type(e).__name__}), retrying: {key}"
+                )
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
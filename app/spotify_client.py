@@ -1,87 +1,374 @@
 import logging
+import threading
 import urllib.parse
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import TYPE_CHECKING
 
+import requests
 import spotipy
+import urllib3
+
+from app import library_cache, tracing, track_details
+from app.chat_types import TurnCancelled
+from app.connections import get_spotify_session
+from app.jobs import report_progress
+from app.library_cache import LibraryCache, PrefetchCancelled
+from app.library_index import LIKED_SONGS, PLAYLIST, LibraryIndex
+from app.library_summary import LibrarySummary
+from app.playlist_edits import (
+    PLAYLIST_BATCH_SIZE,
+    PlaylistEdits,
+    plan_edits,
+    playlist_snapshots,
+    track_uri,
+)
+from app.resilience import Dependency
+from app.single_flight import SingleFlight
+from app.tool_registry import ToolTimeoutError, check_deadline
+from app.track_details import track_details_cache
+from app.track_resolver import TrackResolver
+from app.tracks import Track, track_table
+
+if TYPE_CHECKING:
+    from app.similarity import SimilarityIndex
 
 logger = logging.getLogger(__name__)
 
 
+def _is_retryable(e: BaseException) -> bool:
+    if isinstance(e, spotipy.SpotifyException):
+        return e.http_status == 429 or e.http_status >= 500
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def _is_unsent(e: BaseException) -> bool:
+    """Whether the request failed before Spotify carried it out: it was rate
+    limited, or no connection could be made.
+    """
+    if isinstance(e, spotipy.SpotifyException):
+        return e.http_status == 429
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if isinstance(e, requests.ConnectionError) and e.args:
+        reason = getattr(e.args[0], "reason", None)
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+def _retry_after(e: BaseException) -> float | None:
+    if isinstance(e, spotipy.SpotifyException) and e.headers:
+        value = e.headers.get("Retry-After")
+        if value and value.isdigit():
+            return float(value)
+    return None
+
+
+# The maximum page size of the saved tracks endpoint (the default is 20).
+SAVED_TRACKS_PAGE_SIZE = 50
+
+# Shared by all clients, so that concurrent requests of the same user for the
+# same data make a single fetch. A fetch abandoned because its turn was
+# cancelled, its tool timed out or its prefetch went idle is run again by the
+# callers waiting for it.
+spotify_flights = SingleFlight(
+    retry_on=(TurnCancelled, ToolTimeoutError, PrefetchCancelled)
+)
+
+
+def _playlist_dict(item: dict) -> dict:
+    return {
+        "name": item["name"],
+        "playlist_id": item["id"],
+        "description": item["description"],
+        "tracks": item["tracks"]["total"],
+    }
+
+
+# Runs the batches of requests for many tracks in parallel.
+_batch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="spotify-batch")
+
+# Set once Spotify refused audio features; apps created since late 2024 have
+# no access to them.
+_audio_features_unavailable = threading.Event()
+
+
+def _batches(items: list[str], size: int) -> list[list[str]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+# Shared by all `SpotifyClient` instances, so that the circuit breaker sees the
+# failures of every request in this process.
+spotify_dependency = Dependency(
+    "Spotify",
+    is_retryable=_is_retryable,
+    retry_after=_retry_after,
+    is_unsent=_is_unsent,
+)
+
+
 class SpotifyClient:
     """A wrapper for the Spotipy library."""
 
-    def __init__(self, auth_manager):
-        self.client = spotipy.Spotify(auth_manager=auth_manager)
+    def __init__(
+        self,
+        auth_manager,
+        library_index: LibraryIndex | None = None,
+        library_cache: LibraryCache | None = None,
+        track_resolver: TrackResolver | None = None,
+        similarity_index: "SimilarityIndex | None" = None,
+    ):
+        # Retries are handled by `spotify_dependency`, not by spotipy itself.
+        self.client = spotipy.Spotify(
+            auth_manager=auth_manager,
+            requests_session=get_spotify_session(),
+            retries=0,
+            status_retries=0,
+        )
+        self.library_index = library_index
+        self.library_cache = library_cache
+        self.track_resolver = track_resolver
+        self.similarity_index = similarity_index
+        # Called before each page fetch; raises to abandon the fetch.
+        self.check_cancelled: Callable[[], None] | None = None
+
+    def _remember(self, tracks: list[Track]) -> None:
+        """Lets `search_songs` find the tracks locally from now on."""
+        if self.track_resolver:
+            self.track_resolver.add(self.user_id, tracks)
+
+    def _shared[T](self, key: tuple, fn: Callable[[], T]) -> T:
+        """Runs `fn`, or waits for the identical fetch of this user in flight."""
+        return spotify_flights.do((self.user_id, *key), fn)
+
+    def _call(self, fn, *args, **kwargs):
+        with tracing.span(f"spotify.{getattr(fn, '__name__', 'call')}"):
+            return spotify_dependency.call(fn, *args, **kwargs)
+
+    def _write(self, fn, *args, **kwargs):
+        """Like `_call`, for requests that change the user's library, which are
+        not retried once they may have been carried out.
+        """
+        with tracing.span(f"spotify.{getattr(fn, '__name__', 'call')}"):
+            return spotify_dependency.call_write(fn, *args, **kwargs)
+
+    def _next_page(self, results):
+        """Fetches the page after `results`, or returns None on the last page."""
+        if not results["next"]:
+            return None
+        if self.check_cancelled:
+            self.check_cancelled()
+        check_deadline()
+        return self._call(self.client.next, results)
+
+    @cached_property
+    def user_id(self) -> str:
+        """The Spotify ID of the current user."""
+        return self._call(self.client.me)["id"]
+
+    def _iter_pages(self, results) -> Iterator[dict]:
+        while results:
+            yield results
+            results = self._next_page(results)
+
+    def _iter_owned_playlists(self) -> Iterator[dict]:
+        user_id = self.user_id
+        for page in self._iter_pages(self._call(self.client.current_user_playlists)):
+            for item in page["items"]:
+                # Only include playlists owned by the user
+                if item["owner"]["id"] == user_id:
+                    yield item
+
+    def iter_user_playlists(self) -> Iterator[dict]:
+        """Yields the current user's playlists, fetching them page by page."""
+        for item in self._iter_owned_playlists():
+            yield _playlist_dict(item)
 
     def get_user_playlists(self):
         """Gets the current user's playlists."""
+        if self.library_cache:
+            cached = self.library_cache.get(self.user_id, library_cache.PLAYLISTS)
+            if cached is not None:
+                return cached
+        return self._shared(("playlists",), self._fetch_user_playlists)
+
+    def _fetch_user_playlists(self) -> list[dict]:
         playlists = []
-        results = self.client.current_user_playlists()
-        while results:
-            for item in results["items"]:
-                # Only include playlists owned by the user
-                if item["owner"]["id"] == self.client.me()["id"]:
-                    playlists.append(
-                        {
-                            "name": item["name"],
-                            "playlist_id": item["id"],
-                            "description": item["description"],
-                            "tracks": item["tracks"]["total"],
-                        }
-                    )
-            if results["next"]:
-                results = self.client.next(results)
-            else:
-                results = None
+        snapshots = []
+        for item in self._iter_owned_playlists():
+            snapshots.append((item["id"], item["name"], item.get("snapshot_id")))
+            playlists.append(_playlist_dict(item))
+        if self.library_index:
+            self.library_index.index_playlists(self.user_id, snapshots)
+        if self.library_cache:
+            self.library_cache.put(self.user_id, library_cache.PLAYLISTS, playlists)
         return playlists
 
-    def get_liked_songs(self):
+    def iter_liked_songs(self) -> Iterator[Track]:
+        """Yields the current user's liked songs, fetching them page by page."""
+        if self.library_cache:
+            cached = self.library_cache.get(self.user_id, library_cache.LIKED_SONGS)
+            if cached is not None:
+                yield from cached
+                return
+        results = self._call(
+            self.client.current_user_saved_tracks, limit=SAVED_TRACKS_PAGE_SIZE
+        )
+        for page in self._iter_pages(results):
+            for item in page["items"]:
+                if item["track"]:
+                    yield track_table.intern(item["track"])
+
+    def get_liked_songs(self) -> list[Track]:
         """Gets the current user's liked songs."""
-        liked_songs = []
-        results = self.client.current_user_saved_tracks()
-        while results:
-            for item in results["items"]:
-                track = item["track"]
-                liked_songs.append(
-                    {
-                        "name": track["name"],
-                        "artist": ", ".join(
-                            artist["name"] for artist in track["artists"]
-                        ),
-                        "album": track["album"]["name"],
-                        "track_id": track["id"],
-                    }
-                )
-            if results["next"]:
-                results = self.client.next(results)
-            else:
-                results = None
+        if self.library_cache:
+            cached = self.library_cache.get(self.user_id, library_cache.LIKED_SONGS)
+            if cached is not None:
+                return cached
+        return self._shared(("liked_songs",), self._fetch_liked_songs)
+
+    def _fetch_liked_songs(self) -> list[Track]:
+        liked_songs = list(self.iter_liked_songs())
+        self._remember(liked_songs)
+        if self.similarity_index:
+            self.similarity_index.add(self.user_id, liked_songs)
+        if self.library_index:
+            self.library_index.index_tracks(
+                self.user_id, LIKED_SONGS, LIKED_SONGS, liked_songs, "Liked Songs"
+            )
+        if self.library_cache:
+            self.library_cache.put(self.user_id, library_cache.LIKED_SONGS, liked_songs)
         return liked_songs
 
-    def get_playlist_contents(self, playlist_id: str):
-        """Gets the tracks in a specific playlist."""
+    def iter_playlist_items(self, playlist_id: str) -> Iterator[Track]:
+        """Yields the tracks in a playlist, fetching them page by page."""
         logger.info(f"Getting contents for playlist: {playlist_id}")
-        tracks = []
-        results = self.client.playlist_items(playlist_id)
-        while results:
-            for item in results["items"]:
-                track = item["track"]
-                if track:
-                    tracks.append(
-                        {
-                            "name": track["name"],
-                            "artist": ", ".join(
-                                artist["name"] for artist in track["artists"]
-                            ),
-                            "album": track["album"]["name"],
-                            "track_id": track["id"],
-                        }
-                    )
-            if results["next"]:
-                results = self.client.next(results)
-            else:
-                results = None
+        for page in self._iter_pages(
+            self._call(self.client.playlist_items, playlist_id)
+        ):
+            for item in page["items"]:
+                if item["track"]:
+                    yield track_table.intern(item["track"])
+
+    def get_playlist_contents(self, playlist_id: str) -> list[Track]:
+        """Gets the tracks in a specific playlist."""
+        return self._shared(
+            ("playlist", playlist_id),
+            lambda: self._fetch_playlist_contents(playlist_id),
+        )
+
+    def _fetch_playlist_contents(self, playlist_id: str) -> list[Track]:
+        tracks = list(self.iter_playlist_items(playlist_id))
+        self._remember(tracks)
+        if self.similarity_index:
+            self.similarity_index.add(self.user_id, tracks)
+        if self.library_index:
+            self.library_index.index_tracks(self.user_id, PLAYLIST, playlist_id, tracks)
         return tracks
 
+    def sync_library_index(self) -> None:
+        """Brings the library index up to date.
+
+        Only the playlists whose snapshot changed since they were last indexed
+        are fetched again, and the liked songs only if their count or most
+        recent addition changed. Concurrent syncs of the same user are one.
+        """
+        self._shared(("library_sync",), self._sync_library_index)
+
+    def _sync_library_index(self) -> None:
+        assert self.library_index is not None
+        user_id = self.user_id
+        if self.library_cache:
+            self.library_cache.invalidate(user_id, library_cache.PLAYLISTS)
+        self.get_user_playlists()
+        probe = self._call(self.client.current_user_saved_tracks, limit=1)
+        newest = probe["items"][0]["added_at"] if probe["items"] else ""
+        self.library_index.set_snapshot(
+            user_id,
+            LIKED_SONGS,
+            LIKED_SONGS,
+            "Liked Songs",
+            f"{probe['total']}:{newest}",
+        )
+        # Stream the tracks into the index instead of materializing them.
+        for kind, source_id in self.library_index.stale_sources(user_id):
+            if kind == LIKED_SONGS:
+                if self.library_cache:
+                    self.library_cache.invalidate(user_id, library_cache.LIKED_SONGS)
+                tracks = self.iter_liked_songs()
+            else:
+                tracks = self.iter_playlist_items(source_id)
+            self.library_index.index_tracks(user_id, kind, source_id, tracks)
+        self.library_index.mark_synced(user_id)
+        if self.similarity_index:
+            self.similarity_index.sync(user_id, self.library_index.tracks(user_id))
+
+    def summarize_library(self, top: int = 10) -> dict:
+        """Summarizes the user's playlists and liked songs, streaming their
+        tracks page by page instead of holding them all.
+
+        Args:
+            top: The number of entries in each ranking.
+
+        Returns:
+            See `LibrarySummary.result`.
+        """
+        summary = LibrarySummary()
+        playlists = self.get_user_playlists()
+        report_progress(0, len(playlists) + 1, "Reading liked songs")
+        summary.add("Liked Songs", self.iter_liked_songs())
+        for i, playlist in enumerate(playlists, 1):
+            report_progress(i, len(playlists) + 1, f"Reading {playlist['name']}")
+            summary.add(
+                playlist["name"], self.iter_playlist_items(playlist["playlist_id"])
+            )
+        return summary.result(top)
+
+    def search_library(self, query: str, limit: int = 50) -> list[dict]:
+        """Searches the user's playlists and liked songs in the local index.
+
+        Args:
+            query: Words to find in track names, artists or albums.
+            limit: The maximum number of tracks to return.
+
+        Returns:
+            The matching tracks, each with the playlists it appears in.
+        """
+        if self.library_index is None:
+            raise RuntimeError("The library index is not available.")
+        if self.library_index.needs_sync(self.user_id):
+            logger.info("Syncing library index")
+            self.sync_library_index()
+        return self.library_index.search(self.user_id, query, limit)
+
+    def find_similar_in_library(
+        self, title: str, artist: str, limit: int = 10
+    ) -> list[tuple[Track, float]]:
+        """Finds the tracks of the user's library most similar to a song.
+
+        Args:
+            title: The title of the song.
+            artist: The artist of the song.
+            limit: The maximum number of tracks to return.
+
+        Returns:
+            `(track, similarity)` pairs, most similar first.
+        """
+        if self.library_index is None or self.similarity_index is None:
+            raise RuntimeError("The similarity index is not available.")
+        if self.library_index.needs_sync(self.user_id):
+            logger.info("Syncing library index")
+            self.sync_library_index()
+        elif not self.similarity_index.count(self.user_id):
+            self.similarity_index.sync(
+                self.user_id, self.library_index.tracks(self.user_id)
+            )
+        seeds = self.search_songs(title, artist, 1)
+        if not seeds:
+            raise ValueError(f"No song '{title}' by '{artist}' found on Spotify.")
+        return self.similarity_index.find_similar(self.user_id, seeds[:1], limit)[0]
+
     def create_playlist(
         self, name: str, description: str, track_uris: list[str]
     ) -> str:
@@ -96,17 +383,175 @@ class SpotifyClient:
             The ID of the newly created playlist.
         """
         logger.info(f"Creating playlist '{name}'")
-        user_id = self.client.me()["id"]
-        playlist = self.client.user_playlist_create(
-            user_id, name, public=True, description=description
+        playlist = self._write(
+            self.client.user_playlist_create,
+            self.user_id,
+            name,
+            public=True,
+            description=description,
         )
         logger.info(f"Adding items to playlist: {track_uris}")
-        self.client.playlist_add_items(playlist["id"], track_uris)
+        batches = _batches(track_uris, PLAYLIST_BATCH_SIZE)
+        snapshot_id = playlist.get("snapshot_id")
+        for i, batch in enumerate(batches):
+            report_progress(i, len(batches), f"Adding tracks to '{name}'")
+            snapshot_id = self._write(
+                self.client.playlist_add_items, playlist["id"], batch
+            )["snapshot_id"]
+        if snapshot_id:
+            # Lets a follow-up `update_playlist` skip fetching the tracks.
+            playlist_snapshots.put(playlist["id"], snapshot_id, track_uris)
+        if self.library_cache:
+            self.library_cache.invalidate(self.user_id, library_cache.PLAYLISTS)
         return playlist["id"]
 
-    def search_songs(
-        self, title: str, artist: str, limit: int = 5
-    ) -> list[dict[str, str]]:
+    def update_playlist(self, playlist_id: str, track_uris: list[str]) -> dict:
+        """Changes the tracks of a playlist to `track_uris`, in that order,
+        with as few requests as possible.
+
+        Args:
+            playlist_id: The ID of the playlist.
+            track_uris: Spotify URIs or IDs of all the tracks the playlist
+                should have.
+
+        Returns:
+            The number of tracks added and removed, and of requests made.
+        """
+        desired = [track_uri(uri) for uri in track_uris]
+        snapshot_id, current = self._playlist_snapshot(playlist_id)
+        edits = plan_edits(current, desired)
+        logger.info(
+            f"Updating playlist {playlist_id}: {edits.added} added,"
+            f" {edits.removed} removed, {edits.requests} requests"
+        )
+        if edits.requests:
+            snapshot_id = self._apply_edits(playlist_id, snapshot_id, edits)
+        playlist_snapshots.put(playlist_id, snapshot_id, desired)
+        if self.library_cache:
+            self.library_cache.invalidate(self.user_id, library_cache.PLAYLISTS)
+        if self.library_index:
+            self.library_index.expire(self.user_id)
+        return {
+            "playlist_id": playlist_id,
+            "tracks": len(desired),
+            "added": edits.added,
+            "removed": edits.removed,
+            "requests": edits.requests,
+        }
+
+    def _playlist_snapshot(self, playlist_id: str) -> tuple[str, list[str | None]]:
+        """Returns the snapshot ID of a playlist and the URIs of its tracks."""
+        cached = playlist_snapshots.get(playlist_id)
+        if cached:
+            playlist = self._call(
+                self.client.playlist, playlist_id, fields="snapshot_id"
+            )
+            if playlist["snapshot_id"] == cached[0]:
+                return cached
+        playlist = self._call(
+            self.client.playlist,
+            playlist_id,
+            fields="snapshot_id,tracks.items(track.uri),tracks.next",
+        )
+        uris = [
+            # Tracks that are no longer available are null.
+            item["track"]["uri"] if item["track"] else None
+            for page in self._iter_pages(playlist["tracks"])
+            for item in page["items"]
+        ]
+        return playlist["snapshot_id"], uris
+
+    def _apply_edits(
+        self, playlist_id: str, snapshot_id: str, edits: PlaylistEdits
+    ) -> str:
+        """Makes the requests of `edits`, each against the snapshot the previous
+        one created, so that concurrent changes fail instead of being mixed up.
+
+        Returns:
+            The snapshot ID after the edits.
+        """
+        requests = iter(range(edits.requests))
+
+        def call(fn, *args, **kwargs) -> str:
+            report_progress(next(requests), edits.requests, "Updating the playlist")
+            return self._write(fn, playlist_id, *args, **kwargs)["snapshot_id"]
+
+        if edits.replacement is not None:
+            first, *rest = edits.replacement
+            snapshot_id = call(self.client.playlist_replace_items, first)
+            for batch in rest:
+                snapshot_id = call(self.client.playlist_add_items, batch)
+            return snapshot_id
+        for batch in edits.removals:
+            snapshot_id = call(
+                self.client.playlist_remove_all_occurrences_of_items,
+                batch,
+                snapshot_id=snapshot_id,
+            )
+        for range_start, insert_before, range_length in edits.moves:
+            snapshot_id = call(
+                self.client.playlist_reorder_items,
+                range_start,
+                insert_before,
+                range_length=range_length,
+                snapshot_id=snapshot_id,
+            )
+        for position, batch in edits.additions:
+            snapshot_id = call(self.client.playlist_add_items, batch, position=position)
+        return snapshot_id
+
+    def get_track_details(self, track_ids: list[str]) -> list[dict]:
+        """Gets release dates, popularity and audio features of tracks.
+
+        Args:
+            track_ids: Spotify IDs or URIs of the tracks.
+
+        Returns:
+            The details of the tracks found, in the order of `track_ids`.
+        """
+        ids = list(dict.fromkeys(map(track_details.track_id, track_ids)))
+        found = track_details_cache.get_many(ids)
+        missing = [track_id for track_id in ids if track_id not in found]
+        if missing:
+            logger.info(f"Fetching details of {len(missing)} tracks")
+            fetched = self._fetch_track_details(missing)
+            track_details_cache.put_many(fetched)
+            found.update((d["track_id"], d) for d in fetched)
+        return [found[track_id] for track_id in ids if track_id in found]
+
+    def _fetch_track_details(self, ids: list[str]) -> list[dict]:
+        tracks = [
+            _batch_executor.submit(
+                tracing.propagate(self._call), self.client.tracks, batch
+            )
+            for batch in _batches(ids, track_details.TRACKS_BATCH_SIZE)
+        ]
+        features = [
+            _batch_executor.submit(tracing.propagate(self._fetch_audio_features), batch)
+            for batch in _batches(ids, track_details.AUDIO_FEATURES_BATCH_SIZE)
+            if not _audio_features_unavailable.is_set()
+        ]
+        features_by_id = {f["id"]: f for future in features for f in future.result()}
+        return [
+            track_details.details(track, features_by_id.get(track["id"]))
+            for future in tracks
+            for track in future.result()["tracks"]
+            # Unknown IDs come back as null.
+            if track
+        ]
+
+    def _fetch_audio_features(self, ids: list[str]) -> list[dict]:
+        try:
+            features = self._call(self.client.audio_features, ids)
+        except spotipy.SpotifyException as e:
+            if e.http_status not in (403, 404):
+                raise
+            logger.warning(f"Audio features are not available: {e}")
+            _audio_features_unavailable.set()
+            return []
+        return [f for f in features or [] if f]
+
+    def search_songs(self, title: str, artist: str, limit: int = 5) -> list[Track]:
         """Searches for songs on Spotify.
 
         Args:
@@ -115,11 +560,20 @@ class SpotifyClient:
             limit: The maximum number of songs to return.
 
         Returns:
-            A list of songs, each a dictionary with song details.
+            A list of songs.
         """
+        if self.track_resolver:
+            tracks = self.track_resolver.resolve(self.user_id, title, artist, limit)
+            if tracks:
+                logger.info(f"Resolved '{title}' by '{artist}' locally.")
+                return tracks
+
         query = f'track:"{title}" "{artist}"'
         logger.info(f"Searching songs with query '{query}'.")
-        results = self.client.search(q=query, type="track", limit=limit)
+        results = self._shared(
+            ("search", query, limit),
+            lambda: self._call(self.client.search, q=query, type="track", limit=limit),
+        )
         if results:
             logger.info(f"Found {len(results)} results.")
             print("%s" % results)
@@ -128,15 +582,7 @@ class SpotifyClient:
         songs = []
         if results and results["tracks"]["items"]:
             for item in results["tracks"]["items"]:
-                songs.append(
-                    {
-                        "name": item["name"],
-                        "artist": ", ".join(
-                            artist["name"] for artist in item["artists"]
-                        ),
-                        "album": item["album"]["name"],
-                        "track_id": item["id"],
-                    }
-                )
+                songs.append(track_table.intern(item))
+        self._remember(songs)
         logger.info(f"Returning songs: {songs}.")
         return songs
@@ -0,0 +1,279 @@
+"""Declarative registry of the tools offered to the model.
+
+Each tool is a typed Python function whose JSON schema is generated from its
+signature and docstring. Its `ToolPolicy` controls caching, timeouts and
+concurrency, so that the performance behaviour of every tool is tuned in one
+place.
+"""
+
+import contextvars
+import inspect
+import json
+import logging
+import threading
+import time
+import types
+import typing
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_JSON_TYPES: dict[type, str] = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+}
+
+
+class ToolTimeoutError(TimeoutError):
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"Tool '{name}' did not finish within {timeout} seconds.")
+
+
+# The tool running in this context, its timeout and its deadline.
+_deadline: contextvars.ContextVar[tuple[str, float, float] | None] = (
+    contextvars.ContextVar("tool_deadline", default=None)
+)
+
+
+def check_deadline() -> None:
+    """Raises `ToolTimeoutError` if the running tool is past its timeout.
+
+    Tools run on the caller's thread, so a timeout can't interrupt them; they
+    call this between the requests of a long read, where stopping is safe. A
+    single request is bounded by the HTTP client's timeout instead.
+    """
+    current = _deadline.get()
+    if current is not None and time.monotonic() > current[2]:
+        raise ToolTimeoutError(current[0], current[1])
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    """How a tool is executed."""
+
+    # Seconds for which results are cached per user and arguments; 0 disables.
+    cache_ttl: float = 0.0
+    # Seconds after which the call stops at its next `check_deadline` and is
+    # reported as failed. Writes don't check it, so that they are never left
+    # half done.
+    timeout: float | None = None
+    # Maximum number of concurrent calls of this tool across all requests.
+    max_concurrency: int | None = None
+    # Whether the tool may run concurrently with other tool calls of a turn.
+    parallel_safe: bool = False
+    # Tools whose cached results become stale when this tool is called.
+    invalidates: tuple[str, ...] = ()
+    # Whether calls run as jobs, with limited concurrency per tool and user
+    # and reported progress, see `app/jobs.py`.
+    job: bool = False
+
+
+@dataclass
+class Tool:
+    name: str
+    description: str
+    parameters: dict[str, Any]
+    policy: ToolPolicy
+    fn: Callable[..., Any]
+    semaphore: threading.BoundedSemaphore | None = field(default=None, repr=False)
+
+    @property
+    def schema(self) -> dict[str, Any]:
+        return {
+            "type": "function",
+            "name": self.name,
+            "description": self.description,
+            "parameters": self.parameters,
+            "strict": True,
+        }
+
+
+def _json_schema(annotation: Any) -> dict[str, Any]:
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    origin = typing.get_origin(annotation)
+    if origin is list:
+        (item,) = typing.get_args(annotation)
+        return {"type": "array", "items": _json_schema(item)}
+    if origin in (typing.Union, types.UnionType):
+        args = typing.get_args(annotation)
+        if len(args) == 2 and type(None) in args:
+            (inner,) = (a for a in args if a is not type(None))
+            schema = _json_schema(inner)
+            return {**schema, "type": [schema["type"], "null"]}
+    raise TypeError(f"Unsupported tool parameter type: {annotation!r}")
+
+
+def _parse_docstring(doc: str) -> tuple[str, dict[str, str]]:
+    """Splits a Google-style docstring into its summary and `Args:` entries."""
+    lines = inspect.cleandoc(doc).splitlines()
+    summary: list[str] = []
+    args: dict[str, str] = {}
+    current: str | None = None
+    section = "summary"
+    for line in lines:
+        stripped = line.strip()
+        if stripped in ("Args:", "Returns:", "Raises:"):
+            section = stripped
+            continue
+        if section == "summary":
+            if stripped:
+                summary.append(stripped)
+        elif section == "Args:" and stripped:
+            if line.startswith("    ") and not line.startswith("        "):
+                current, _, text = stripped.partition(":")
+                args[current] = text.strip()
+            elif current:
+                args[current] += " " + stripped
+    return " ".join(summary), args
+
+
+class ToolRegistry:
+    """Declares tools and dispatches model tool calls to them.
+
+    Tool functions take the per-request context (e.g. the `SpotifyClient`) as
+    their first argument, followed by the parameters the model fills in.
+    """
+
+    def __init__(self, max_cache_entries: int = 1024):
+        self._tools: dict[str, Tool] = {}
+        self._cache: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._max_cache_entries = max_cache_entries
+
+    def tool(
+        self, policy: ToolPolicy | None = None
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Registers the decorated function as a tool."""
+        policy = policy or ToolPolicy()
+
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            description, arg_docs = _parse_docstring(fn.__doc__ or "")
+            hints = typing.get_type_hints(fn)
+            params = list(inspect.signature(fn).parameters)[1:]
+            properties: dict[str, Any] = {}
+            for param in params:
+                properties[param] = _json_schema(hints[param])
+                if param in arg_docs:
+                    properties[param]["description"] = arg_docs[param]
+            self._tools[fn.__name__] = Tool(
+                name=fn.__name__,
+                description=description,
+                parameters={
+                    "type": "object",
+                    "properties": properties,
+                    # Strict mode requires every parameter to be listed.
+                    "required": params,
+                    "additionalProperties": False,
+                },
+                policy=policy,
+                fn=fn,
+                semaphore=(
+                    threading.BoundedSemaphore(policy.max_concurrency)
+                    if policy.max_concurrency
+                    else None
+                ),
+            )
+            return fn
+
+        return decorator
+
+    @property
+    def schemas(self) -> list[dict[str, Any]]:
+        return [tool.schema for tool in self._tools.values()]
+
+    def get(self, name: str) -> Tool | None:
+        return self._tools.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def call(
+        self,
+        name: str,
+        context: Any,
+        arguments: str,
+        scope: Any = None,
+        deadline: float | None = None,
+    ) -> Any:
+        """Calls tool `name` with the JSON-encoded `arguments`.
+
+        `scope` identifies whose data the call sees (e.g. the user ID); cached
+        results are only shared within the same scope. `deadline`, a
+        `time.monotonic()` value such as the end of a chat turn, shortens the
+        tool's timeout to end by then.
+        """
+        tool = self._tools[name]
+        args = json.loads(arguments) if arguments else {}
+        policy = tool.policy
+
+        key = (scope, name, json.dumps(args, sort_keys=True))
+        if policy.cache_ttl:
+            cached = self._cache_get(key)
+            if cached is not None:
+                logger.info(f"Tool '{name}' served from cache")
+                return cached
+
+        result = self._run(tool, context, args, deadline)
+
+        if policy.cache_ttl:
+            self._cache_put(key, result, policy.cache_ttl)
+        for other in policy.invalidates:
+            self.invalidate(other, scope)
+        return result
+
+    def invalidate(self, name: str, scope: Any = None) -> None:
+        """Drops the cached results of tool `name` within `scope`."""
+        with self._cache_lock:
+            for key in [k for k in self._cache if k[0] == scope and k[1] == name]:
+                del self._cache[key]
+
+    def _run(
+        self,
+        tool: Tool,
+        context: Any,
+        args: dict[str, Any],
+        deadline: float | None = None,
+    ) -> Any:
+        """Runs the tool on this thread; see `check_deadline` for timeouts."""
+        timeout = tool.policy.timeout
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0.0)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        semaphore = tool.semaphore
+        if semaphore and not semaphore.acquire(timeout=timeout):
+            raise ToolTimeoutError(tool.name, timeout or 0)
+        token = None
+        if timeout is not None:
+            token = _deadline.set((tool.name, timeout, time.monotonic() + timeout))
+        try:
+            return tool.fn(context, **args)
+        finally:
+            if token is not None:
+                _deadline.reset(token)
+            if semaphore:
+                semaphore.release()
+
+    def _cache_get(self, key: tuple) -> Any:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, key: tuple, value: Any, ttl: float) -> None:
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_cache_entries:
+                self._cache.popitem(last=False)
@@ -0,0 +1,165 @@
+"""The tools available to the model, and how each of them is executed."""
+
+import logging
+
+from app.spotify_client import SpotifyClient
+from app.tool_registry import ToolPolicy, ToolRegistry
+
+logger = logging.getLogger(__name__)
+
+registry = ToolRegistry()
+
+# Reads of the user's library change rarely within a conversation.
+LIBRARY_READ = ToolPolicy(
+    cache_ttl=60.0,
+    timeout=60.0,
+    max_concurrency=8,
+    parallel_safe=True,
+)
+
+
+@registry.tool(LIBRARY_READ)
+def get_my_playlists(spotify: SpotifyClient) -> list[dict]:
+    """Returns a list of the user's Spotify playlists"""
+    return spotify.get_user_playlists()
+
+
+@registry.tool(
+    ToolPolicy(cache_ttl=60.0, timeout=60.0, max_concurrency=16, parallel_safe=True)
+)
+def get_playlist_contents(spotify: SpotifyClient, playlist_id: str) -> list[dict]:
+    """Returns a list of songs in a playlist
+
+    Args:
+        playlist_id: The ID of the playlist. This ID must have been previously
+            retrieved by a call to get_my_playlists.
+    """
+    return [track.to_dict() for track in spotify.get_playlist_contents(playlist_id)]
+
+
+@registry.tool(LIBRARY_READ)
+def get_liked_songs(spotify: SpotifyClient) -> list[dict]:
+    """Returns a list of the user's liked songs from Spotify."""
+    return [track.to_dict() for track in spotify.get_liked_songs()]
+
+
+@registry.tool(
+    ToolPolicy(
+        timeout=120.0,
+        invalidates=("get_my_playlists", "summarize_library"),
+        job=True,
+    )
+)
+def create_playlist(
+    spotify: SpotifyClient, name: str, description: str, track_uris: list[str]
+) -> str:
+    """Creates a new playlist on Spotify.
+
+    Args:
+        name: The name of the playlist.
+        description: The description of the playlist.
+        track_uris: A list of Spotify track URIs to add to the playlist.
+    """
+    logger.info(f"Creating playlist '{name}' with {len(track_uris)} tracks.")
+    return spotify.create_playlist(name, description, track_uris)
+
+
+@registry.tool(
+    ToolPolicy(
+        timeout=120.0,
+        invalidates=("get_my_playlists", "get_playlist_contents", "summarize_library"),
+        job=True,
+    )
+)
+def update_playlist(
+    spotify: SpotifyClient, playlist_id: str, track_uris: list[str]
+) -> dict:
+    """Sets the songs of one of the user's playlists. Use this to refine a
+    playlist instead of creating a new one.
+
+    Args:
+        playlist_id: The ID of the playlist.
+        track_uris: Spotify URIs of all the songs the playlist should have, in
+            order.
+    """
+    return spotify.update_playlist(playlist_id, track_uris)
+
+
+@registry.tool(
+    ToolPolicy(cache_ttl=600.0, timeout=20.0, max_concurrency=16, parallel_safe=True)
+)
+def search_songs(
+    spotify: SpotifyClient, title: str, artist: str, limit: int
+) -> list[dict[str, str]]:
+    """Searches for songs on Spotify by title and artist.
+
+    Args:
+        title: The title of the song.
+        artist: The artist of the song.
+        limit: The maximum number of songs to return.
+    """
+    return [track.to_dict() for track in spotify.search_songs(title, artist, limit)]
+
+
+@registry.tool(ToolPolicy(timeout=300.0, max_concurrency=8, parallel_safe=True))
+def search_my_library(spotify: SpotifyClient, query: str, limit: int) -> list[dict]:
+    """Searches the user's playlists and liked songs for tracks by name, artist or
+    album, and returns the matching tracks with the playlists they appear in. Use
+    this instead of reading every playlist to find where a song or artist occurs.
+
+    Args:
+        query: Words to look for, e.g. an artist name or song title.
+        limit: The maximum number of tracks to return.
+    """
+    return spotify.search_library(query, limit)
+
+
+@registry.tool(ToolPolicy(timeout=60.0, max_concurrency=8, parallel_safe=True))
+def get_track_details(spotify: SpotifyClient, track_ids: list[str]) -> list[dict]:
+    """Returns the release date, popularity and, where available, tempo, key
+    and mood of songs. Pass all songs in one call.
+
+    Args:
+        track_ids: Spotify IDs or URIs of the songs.
+    """
+    return spotify.get_track_details(track_ids)
+
+
+@registry.tool(
+    ToolPolicy(
+        cache_ttl=600.0,
+        timeout=300.0,
+        max_concurrency=4,
+        parallel_safe=True,
+        job=True,
+    )
+)
+def summarize_library(spotify: SpotifyClient, top: int) -> dict:
+    """Summarizes the user's playlists and liked songs: distinct tracks and
+    artists, playlist sizes, top artists and albums, tracks per decade, and the
+    playlists sharing most tracks. Use this for questions about the whole
+    library instead of reading every track.
+
+    Args:
+        top: The number of entries in each ranking, e.g. 10.
+    """
+    return spotify.summarize_library(top)
+
+
+@registry.tool(ToolPolicy(timeout=300.0, max_concurrency=8, parallel_safe=True))
+def find_similar_in_library(
+    spotify: SpotifyClient, title: str, artist: str, limit: int
+) -> list[dict]:
+    """Finds the songs in the user's playlists and liked songs that are most
+    similar to a given song, based on shared artists, albums and era. Use this
+    instead of reading the whole library to find related songs.
+
+    Args:
+        title: The title of the song to compare with.
+        artist: The artist of the song to compare with.
+        limit: The maximum number of songs to return.
+    """
+    return [
+        dict(track.to_dict(), similarity=round(score, 3))
+        for track, score in spotify.find_similar_in_library(title, artist, limit)
+    ]
@@ -0,0 +1,256 @@
+"""Span-based tracing of chat turns.
+
+Metrics show that turns are slow, not why a given turn took 40 seconds. Each
+`/chat` request is recorded as a trace: a tree of timed spans for the model
+calls, tool calls, Spotify requests and database writes it made. Traces are
+stored in SQLite and shown as a waterfall at `/debug/traces/<trace_id>`.
+
+The current span is kept in a context variable. Work handed to other threads
+must be wrapped with `propagate` to stay in the trace.
+"""
+
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS span (
+  trace_id TEXT NOT NULL,
+  span_id TEXT NOT NULL,
+  parent_id TEXT,
+  name TEXT NOT NULL,
+  start REAL NOT NULL,
+  duration REAL NOT NULL,
+  thread TEXT NOT NULL,
+  attributes TEXT NOT NULL,
+  error TEXT,
+  PRIMARY KEY (trace_id, span_id)
+);
+
+CREATE INDEX IF NOT EXISTS span_root ON span (start) WHERE parent_id IS NULL;
+"""
+
+
+@dataclass(slots=True)
+class Span:
+    trace: "Trace"
+    name: str
+    span_id: str
+    parent_id: str | None
+    # Wall-clock start, in seconds since the epoch.
+    start: float
+    thread: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration: float = 0.0
+    error: str | None = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """Collects the spans of one trace and stores them when it ends."""
+
+    def __init__(self, store: "TraceStore | None"):
+        self.trace_id = uuid.uuid4().hex
+        self._store = store
+        self._lock = threading.Lock()
+        self._spans: list[Span] = []
+        self._finished = False
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            if not self._finished:
+                self._spans.append(span)
+                return
+        # A span of work that outlived the request, e.g. a playlist write that
+        # completed after its client went away.
+        self._write([span])
+
+    def finish(self) -> None:
+        with self._lock:
+            self._finished = True
+            spans, self._spans = self._spans, []
+        self._write(spans)
+
+    def _write(self, spans: list[Span]) -> None:
+        if self._store is None:
+            return
+        try:
+            self._store.write(spans)
+        except sqlite3.Error:
+            logger.exception(f"Failed to store trace {self.trace_id}")
+
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+@contextmanager
+def _span(
+    trace: Trace, parent_id: str | None, name: str, attributes: dict[str, Any]
+) -> Iterator[Span]:
+    span = Span(
+        trace=trace,
+        name=name,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent_id,
+        start=time.time(),
+        thread=threading.current_thread().name,
+        attributes=attributes,
+    )
+    token = _current_span.set(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        trace.record(span)
+
+
+@contextmanager
+def trace(store: "TraceStore | None", name: str, **attributes: Any) -> Iterator[Span]:
+    """Starts a new trace whose root span is `name`."""
+    new_trace = Trace(store)
+    try:
+        with _span(new_trace, None, name, attributes) as root:
+            yield root
+    finally:
+        new_trace.finish()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Records a child span of the current span, if there is one."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _span(parent.trace, parent.span_id, name, attributes) as child:
+        yield child
+
+
+def current_trace_id() -> str | None:
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+def propagate[**P, R](fn: Callable[P, R]) -> Callable[P, R]:
+    """Binds `fn` to the current trace, to run it on another thread.
+
+    The returned function must only be called once.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args: P.args, **kwargs: P.kwargs) -> R:
+        return context.run(fn, *args, **kwargs)
+
+    return run
+
+
+class TraceStore:
+    """Stores spans in SQLite, with a connection per thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            self._local.db = db
+        return db
+
+    def write(self, spans: Iterable[Span]) -> None:
+        with self._connect() as db:
+            db.executemany(
+                """
+                INSERT OR REPLACE INTO span (trace_id, span_id, parent_id, name,
+                  start, duration, thread, attributes, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        s.trace_id,
+                        s.span_id,
+                        s.parent_id,
+                        s.name,
+                        s.start,
+                        s.duration,
+                        s.thread,
+                        json.dumps(s.attributes, default=str),
+                        s.error,
+                    )
+                    for s in spans
+                ],
+            )
+
+    def get(self, trace_id: str) -> list[dict[str, Any]]:
+        """Returns the spans of a trace, ordered by start time."""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT * FROM span WHERE trace_id = ? ORDER BY start", (trace_id,)
+            )
+            .fetchall()
+        )
+        return [dict(row, attributes=json.loads(row["attributes"])) for row in rows]
+
+    def recent(self, limit: int = 50) -> list[dict[str, Any]]:
+        """Returns the root spans of the most recent traces."""
+        rows = (
+            self._connect()
+            .execute(
+                """
+                SELECT trace_id, name, start, duration, error FROM span
+                WHERE parent_id IS NULL ORDER BY start DESC LIMIT ?
+                """,
+                (limit,),
+            )
+            .fetchall()
+        )
+        return [dict(row) for row in rows]
+
+    def delete_old(self, cutoff: float) -> int:
+        """Deletes the traces started before `cutoff`, a Unix timestamp.
+
+        Returns:
+            The number of traces deleted.
+        """
+        with self._connect() as db:
+            traces = [
+                row["trace_id"]
+                for row in db.execute(
+                    "SELECT trace_id FROM span WHERE parent_id IS NULL AND start < ?",
+                    (cutoff,),
+                )
+            ]
+            db.executemany(
+                "DELETE FROM span WHERE trace_id = ?", [(t,) for t in traces]
+            )
+        return len(traces)
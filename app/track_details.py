@@ -0,0 +1,81 @@
+"""Cache of Spotify track metadata shared by all users.
+
+Tracks only carry name, artists, album and id, so the model made follow-up
+searches to learn release dates or popularity. `get_track_details` fetches
+these in batches, and as track metadata practically never changes, the
+details of a track are cached for everyone who asks about it.
+"""
+
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+
+# Maximum number of ids per request of the Spotify endpoints.
+TRACKS_BATCH_SIZE = 50
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+AUDIO_FEATURES = (
+    "tempo",
+    "key",
+    "mode",
+    "time_signature",
+    "danceability",
+    "energy",
+    "valence",
+    "acousticness",
+    "instrumentalness",
+)
+
+
+def track_id(value: str) -> str:
+    """Returns the ID of a track given by ID or URI."""
+    return value.removeprefix("spotify:track:")
+
+
+def details(track: dict, features: dict | None) -> dict:
+    """Returns the details of a track object of the Spotify API, with its
+    audio features if they are known.
+    """
+    result = {
+        "track_id": track["id"],
+        "name": track["name"],
+        "artist": ", ".join(a["name"] for a in track["artists"]),
+        "album": track["album"]["name"],
+        "release_date": track["album"].get("release_date"),
+        "duration_seconds": round(track["duration_ms"] / 1000),
+        "popularity": track.get("popularity"),
+        "explicit": track.get("explicit"),
+    }
+    if features:
+        result.update((name, features.get(name)) for name in AUDIO_FEATURES)
+    return result
+
+
+class TrackDetailsCache:
+    """An LRU cache of track details by track ID."""
+
+    def __init__(self, max_size: int = 50_000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._details: OrderedDict[str, dict] = OrderedDict()
+
+    def get_many(self, track_ids: Iterable[str]) -> dict[str, dict]:
+        found = {}
+        with self._lock:
+            for key in track_ids:
+                value = self._details.get(key)
+                if value is not None:
+                    self._details.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def put_many(self, details: Iterable[dict]) -> None:
+        with self._lock:
+            for value in details:
+                self._details[value["track_id"]] = value
+                self._details.move_to_end(value["track_id"])
+            while len(self._details) > self.max_size:
+                self._details.popitem(last=False)
+
+
+track_details_cache = TrackDetailsCache()
@@ -0,0 +1,151 @@
+"""Resolves song searches from tracks that were already fetched.
+
+When the model builds a playlist from the user's own taste, most songs it
+looks up with `search_songs` are in the user's liked songs or playlists, or
+were found by an earlier search. `TrackResolver` remembers every track that
+`SpotifyClient` returned for a user under its normalized title and artists,
+so that such lookups are answered without calling Spotify.
+"""
+
+import difflib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from app.tracks import Track
+
+# Version suffixes that searches usually leave out: "Song - Remastered 2009",
+# "Song (feat. Someone)", "Song [Live]".
+_SUFFIX = re.compile(r"\s+-\s+.*$|\s*[(\[].*?[)\]]")
+_NON_WORD = re.compile(r"[^\w]+")
+# "Rock & Roll" and "Rock and Roll" are the same song.
+_AND = re.compile(r"\band\b")
+
+
+def normalize(text: str, strip_suffix: bool = True) -> str:
+    """Lowercases, strips accents, version suffixes, "and" and punctuation."""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    stripped = _SUFFIX.sub("", text.lower()) if strip_suffix else text.lower()
+    # Keep titles that consist of nothing but a suffix, e.g. "(Untitled)".
+    words = _AND.sub(" ", stripped or text.lower())
+    return " ".join(_NON_WORD.sub(" ", words).split())
+
+
+def _artists(track: Track) -> list[str]:
+    return [normalize(artist) for artist in track.artists or (track.artist,)]
+
+
+class _Titles:
+    """The tracks of an artist by normalized title, with and without the
+    version suffix.
+    """
+
+    __slots__ = ("exact", "versions")
+
+    def __init__(self):
+        self.exact: dict[str, Track] = {}
+        # The versions of each title, e.g. the studio and the live recording.
+        self.versions: dict[str, list[Track]] = {}
+
+    def add(self, track: Track) -> None:
+        self.exact.setdefault(normalize(track.name, strip_suffix=False), track)
+        versions = self.versions.setdefault(normalize(track.name), [])
+        if track not in versions:
+            versions.append(track)
+
+    def find(self, title: str, limit: int, threshold: float) -> list[Track]:
+        """Returns the track titled exactly `title`, or else up to `limit`
+        versions of the title without suffix, or of the closest title.
+        """
+        track = self.exact.get(title)
+        if track is not None:
+            return [track]
+        versions = self.versions.get(title)
+        if versions is None:
+            matches = difflib.get_close_matches(
+                title, self.versions.keys(), n=1, cutoff=threshold
+            )
+            if not matches:
+                return []
+            versions = self.versions[matches[0]]
+        return versions[:limit]
+
+
+# Normalized artist -> titles.
+type _ArtistTitles = dict[str, _Titles]
+
+
+class TrackResolver:
+    """Maps normalized (title, artist) pairs to tracks, per user.
+
+    Lookups match the artist and title exactly after normalization, or else
+    the closest artist and title whose similarity both reach `threshold`. A
+    title with a version suffix ("Song (Live)") only matches that version;
+    without one, it matches all versions the user has seen.
+    Only the `max_users` most recently active users are kept.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_users: int = 1000):
+        self.threshold = threshold
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: OrderedDict[str, _ArtistTitles] = OrderedDict()
+
+    def _user(self, user_id: str) -> _ArtistTitles:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = {}
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return user
+
+    def add(self, user_id: str, tracks: Iterable[Track]) -> None:
+        """Remembers tracks seen by the user. The first track seen for a title
+        and artist is kept.
+        """
+        entries = [
+            (artist, track)
+            for track in tracks
+            if track.track_id
+            for artist in _artists(track)
+        ]
+        with self._lock:
+            by_artist = self._user(user_id)
+            for artist, track in entries:
+                titles = by_artist.get(artist)
+                if titles is None:
+                    titles = by_artist[artist] = _Titles()
+                titles.add(track)
+
+    def resolve(
+        self, user_id: str, title: str, artist: str, limit: int = 1
+    ) -> list[Track]:
+        """Returns up to `limit` tracks the user has seen for `title` by
+        `artist`, or none if there is no confident match.
+        """
+        title = normalize(title, strip_suffix=False)
+        # The whole artist first, then each artist of a collaboration.
+        artists = [artist] + re.split(r",|&|\band\b|\bfeat\.", artist)
+        with self._lock:
+            by_artist = self._users.get(user_id)
+            if by_artist is None:
+                return []
+            for name in filter(None, map(normalize, artists)):
+                titles = by_artist.get(name)
+                if titles is None:
+                    matches = difflib.get_close_matches(
+                        name, by_artist.keys(), n=1, cutoff=self.threshold
+                    )
+                    if not matches:
+                        continue
+                    titles = by_artist[matches[0]]
+                tracks = titles.find(title, limit, self.threshold)
+                if tracks:
+                    return tracks
+        return []
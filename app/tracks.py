@@ -0,0 +1,90 @@
+"""Compact, shared representation of Spotify tracks.
+
+The same track shows up in the liked songs, several playlists and search
+results, and each occurrence used to be a separate dict with its own copies
+of the artist and album names. `Track` is a slotted record with interned
+strings, and `TrackTable` hands out one instance per track ID, so caches of
+large libraries share their tracks. Tracks are converted to dicts only when
+they are returned to the model.
+"""
+
+import sys
+import threading
+import weakref
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True)
+class Track:
+    track_id: str | None
+    name: str
+    # The artists' names joined by ", ", for display.
+    artist: str
+    album: str
+    release_year: int | None = None
+    # The artists' names as Spotify lists them, if known. Names can contain
+    # ", " themselves, e.g. "Earth, Wind & Fire".
+    artists: tuple[str, ...] = ()
+
+    @property
+    def uri(self) -> str | None:
+        return f"spotify:track:{self.track_id}" if self.track_id else None
+
+    def to_dict(self) -> dict[str, str]:
+        return {
+            "name": self.name,
+            "artist": self.artist,
+            "album": self.album,
+            "track_id": self.track_id,  # type: ignore[dict-item]
+        }
+
+
+def _release_year(album: dict) -> int | None:
+    release_date = album.get("release_date")
+    if release_date and release_date[:4].isdigit():
+        return int(release_date[:4])
+    return None
+
+
+class TrackTable:
+    """Maps track IDs to their `Track`, as long as any cache still holds it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracks: weakref.WeakValueDictionary[str, Track] = (
+            weakref.WeakValueDictionary()
+        )
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def get(self, track_id: str) -> Track | None:
+        return self._tracks.get(track_id)
+
+    def intern(self, track: dict) -> Track:
+        """Returns the shared `Track` for a track object of the Spotify API."""
+        album = track["album"]
+        artists = tuple(sys.intern(artist["name"]) for artist in track["artists"])
+        record = Track(
+            track_id=track["id"],
+            name=track["name"],
+            artist=sys.intern(", ".join(artists)),
+            album=sys.intern(album["name"]),
+            release_year=_release_year(album),
+            artists=artists,
+        )
+        if record.track_id is None:
+            # Local files have no ID and can't be shared.
+            return record
+        with self._lock:
+            existing = self._tracks.get(record.track_id)
+            # Metadata can change (e.g. a renamed album), in which case the
+            # new record replaces the old one for future lookups.
+            if existing == record:
+                return existing
+            self._tracks[record.track_id] = record
+            return record
+
+
+# Shared by all users, as track metadata is the same for everyone.
+track_table = TrackTable()
@@ -0,0 +1,136 @@
+"""Write-behind persistence of conversation histories.
+
+`routes.chat` saves the history after every response of a turn. Committing
+each save on the request thread put an fsync between streamed events, and
+under load that latency showed up as gaps in the event stream.
+`ConversationWriter` keeps the latest history per conversation in memory and
+updates the pending ones together from a background thread, at most
+`interval` seconds after they were written. `flush` waits for the commit,
+which `routes.chat` does at the end of each turn.
+
+Reads go through `pending` first, so that a request sees its own writes
+before they are committed. Histories are only appended to after a write, so
+the writer keeps a shallow copy and encodes it when committing. The writer
+works with any `ConversationStore`, but only SQLite has commits to save.
+"""
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.conversation_store import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationWriter:
+    def __init__(self, store: "ConversationStore", interval: float = 0.05):
+        self.store = store
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._pending: dict[str, list] = {}
+        # The batch being committed, still visible to readers.
+        self._writing: dict[str, list] = {}
+        self._written = 0
+        self._committed = 0
+        self._flushing = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="conversation-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, conversation_id: str, history: list) -> None:
+        """Queues the history of a conversation, replacing any queued one."""
+        with self._cond:
+            if not self._pending:
+                self._cond.notify_all()
+            self._pending[conversation_id] = list(history)
+            self._written += 1
+
+    def pending(self, conversation_id: str) -> list | None:
+        """Returns the history written but not yet committed, if any."""
+        with self._cond:
+            history = self._pending.get(conversation_id)
+            if history is None:
+                history = self._writing.get(conversation_id)
+            return None if history is None else list(history)
+
+    def discard(self, conversation_id: str) -> None:
+        """Drops the queued history of a conversation that is being deleted."""
+        with self._cond:
+            self._pending.pop(conversation_id, None)
+            self._settle()
+
+    def _settle(self) -> None:
+        # With nothing pending or being committed, all writes are done with.
+        if not self._pending and not self._writing:
+            self._committed = self._written
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Waits until everything written so far is committed.
+
+        Returns:
+            Whether the writes were committed within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._written
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._committed < target:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning("Conversation writes were not committed in time")
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    def close(self) -> None:
+        """Commits what is pending and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _take(self) -> tuple[dict[str, list], int] | None:
+        with self._cond:
+            while True:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                # Gather the other writes of this interval, unless someone
+                # waits for them.
+                if not self._flushing and not self._closed:
+                    self._cond.wait(self.interval)
+                if self._pending:
+                    batch, self._pending = self._pending, {}
+                    self._writing = batch
+                    return batch, self._written
+                if self._closed:
+                    return None
+
+    def _run(self) -> None:
+        while (taken := self._take()) is not None:
+            batch, written = taken
+            try:
+                self.store.update_many(batch)
+            except Exception:
+                logger.exception("Could not commit conversations, retrying")
+                with self._cond:
+                    for conversation_id, history in batch.items():
+                        self._pending.setdefault(conversation_id, history)
+                    self._writing = {}
+                time.sleep(self.interval)
+                continue
+            logger.debug(f"Committed {len(batch)} conversations")
+            with self._cond:
+                self._writing = {}
+                self._committed = written
+                self._settle()
+                self._cond.notify_all()
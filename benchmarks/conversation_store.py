@@ -0,0 +1,109 @@
+"""Compares the conversation store backends:
+
+    uv run python -m benchmarks.conversation_store [--conversations N] [--turns N]
+
+Creates conversations of realistic size (a user message, a tool call with its
+output, and an answer per turn), then reports the median time to get one,
+to append a turn to one, to update a batch of 20 at once, and to bulk load
+all of them.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import string
+import tempfile
+import time
+from collections.abc import Callable
+
+from app.conversation_store import (
+    ConversationStore,
+    InMemoryConversationStore,
+    SQLiteConversationStore,
+)
+
+BACKENDS: dict[str, Callable[[str], ConversationStore]] = {
+    "memory": lambda directory: InMemoryConversationStore(),
+    "sqlite": lambda directory: SQLiteConversationStore(f"{directory}/db.sqlite"),
+}
+
+
+def turn(rng: random.Random, i: int) -> list[dict]:
+    """Returns the items of a turn in which the model searched for songs."""
+    tracks = [
+        {
+            "name": f"Song {rng.randrange(10_000)}",
+            "artist": f"Artist {rng.randrange(500)}",
+            "album": f"Album {rng.randrange(2_000)}",
+            "track_id": "".join(
+                rng.choices(string.ascii_letters + string.digits, k=22)
+            ),
+        }
+        for _ in range(rng.randrange(5, 40))
+    ]
+    arguments = {"title": f"Song {i}", "artist": f"Artist {i}", "limit": 10}
+    call_id = f"call_{rng.randrange(10**12)}"
+    return [
+        {"role": "user", "content": f"Find me songs like number {i}"},
+        {
+            "type": "function_call",
+            "name": "search_songs",
+            "call_id": call_id,
+            "arguments": json.dumps(arguments, separators=(",", ":")),
+        },
+        # Tool outputs are stored as `str` of the result, see `ChatClient`.
+        {
+            "type": "function_call_output",
+            "call_id": call_id,
+            "output": str(tracks),
+        },
+        {"role": "assistant", "content": "Here are some songs you might like. " * 5},
+    ]
+
+
+def median_ms(fn: Callable[[], object], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    histories = {
+        f"c{c}": [item for i in range(args.turns) for item in turn(rng, i)]
+        for c in range(args.conversations)
+    }
+    ids = list(histories)
+    batch = {
+        conversation_id: histories[conversation_id] for conversation_id in ids[:20]
+    }
+
+    print(f"{'backend':8} {'get':>9} {'append':>9} {'update 20':>10} {'get all':>9}")
+    for name, factory in BACKENDS.items():
+        with tempfile.TemporaryDirectory() as directory:
+            store = factory(directory)
+            for conversation_id, history in histories.items():
+                store.create(conversation_id, history, user_id="user")
+            get = median_ms(lambda store=store: store.get(rng.choice(ids)), 200)
+            append = median_ms(
+                lambda store=store: store.append(
+                    rng.choice(ids), turn(rng, args.turns)
+                ),
+                200,
+            )
+            update = median_ms(lambda store=store: store.update_many(batch), 20)
+            get_all = median_ms(lambda store=store: store.get_many(ids), 5)
+        print(f"{name:8} {get:7.2f}ms {append:7.2f}ms {update:8.2f}ms {get_all:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compares the storage encodings of conversation histories:
+
+    uv run python -m benchmarks.history_codec [--turns N] [--conversations N]
+
+For histories of the given number of turns, reports the median encoded size,
+and the median time to encode and to decode one, for the legacy JSON text,
+zlib without a dictionary, zlib with `PRESET` at every size, and
+`HistoryCodec`, which only compresses long histories.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import zlib
+from collections.abc import Callable
+
+from app.codec import HistoryCodec, dumps
+from benchmarks.conversation_store import turn
+
+
+def zlib_only(history: list) -> bytes:
+    return zlib.compress(dumps(history))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--conversations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'encoding':10} {'turns':>5} {'size':>9} {'encode':>9} {'decode':>9}")
+    for turns in args.turns:
+        rng = random.Random(turns)
+        histories = [
+            [item for i in range(turns) for item in turn(rng, i)]
+            for _ in range(args.conversations)
+        ]
+        preset = HistoryCodec(min_size=0)
+        codec = HistoryCodec()
+        encodings: dict[str, tuple[Callable, Callable]] = {
+            "json": (json.dumps, json.loads),
+            "zlib": (zlib_only, lambda v: json.loads(zlib.decompress(v))),
+            "preset": (preset.encode, preset.decode),
+            "codec": (codec.encode, codec.decode),
+        }
+        for name, (encode, decode) in encodings.items():
+            sizes, encode_times, decode_times = [], [], []
+            for history in histories:
+                t0 = time.perf_counter()
+                value = encode(history)
+                t1 = time.perf_counter()
+                decoded = decode(value)
+                t2 = time.perf_counter()
+                assert decoded == history
+                sizes.append(len(value))
+                encode_times.append(t1 - t0)
+                decode_times.append(t2 - t1)
+            print(
+                f"{name:10} {turns:5} {statistics.median(sizes):7.0f} B"
+                f" {statistics.median(encode_times) * 1000:7.3f}ms"
+                f" {statistics.median(decode_times) * 1000:7.3f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measures similarity search over a large synthetic library:
+
+    uv run python -m benchmarks.similarity [--tracks N] [--queries N]
+
+Reports the time to build the user's index, and the median time of a query
+for the 10 most similar tracks.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from app.similarity import SimilarityIndex
+from app.tracks import Track
+
+
+def library(size: int) -> list[Track]:
+    rng = random.Random(0)
+    artists = [f"Artist {i}" for i in range(size // 20 + 1)]
+    return [
+        Track(
+            f"t{i}",
+            f"Song {rng.randrange(size)} {rng.choice(['Love', 'Night', 'Blue'])}",
+            rng.choice(artists),
+            f"Album {rng.randrange(size // 10 + 1)}",
+            rng.randrange(1950, 2025),
+        )
+        for i in range(size)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    tracks = library(args.tracks)
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimilarityIndex(directory)
+        t0 = time.perf_counter()
+        index.add("user", tracks)
+        build = time.perf_counter() - t0
+
+        samples = []
+        for seed in random.Random(1).sample(tracks, args.queries):
+            t0 = time.perf_counter()
+            index.find_similar("user", [seed], limit=10)
+            samples.append(time.perf_counter() - t0)
+
+    print(f"build   {build * 1000:9.1f} ms for {args.tracks} tracks")
+    print(f"query   {statistics.median(samples) * 1000:9.1f} ms median")
+
+
+if __name__ == "__main__":
+    main()
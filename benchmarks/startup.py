@@ -0,0 +1,58 @@
+"""Measures the cold-start cost of the app factory.
+
+Each sample runs in a fresh interpreter, so that imports are not cached:
+
+    uv run python benchmarks/startup.py [--runs N]
+
+Reports the time to import and call `create_app`, and the additional time to
+build the `ChatClient` on first use.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SAMPLE = """
+import json, time
+t0 = time.perf_counter()
+from app import create_app
+app = create_app()
+t1 = time.perf_counter()
+from app.clients import get_chat_client
+with app.app_context():
+    get_chat_client()
+t2 = time.perf_counter()
+print(json.dumps({"create_app": t1 - t0, "chat_client": t2 - t1}))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark")}
+    samples: dict[str, list[float]] = {"create_app": [], "chat_client": []}
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", SAMPLE],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for key, value in json.loads(out.splitlines()[-1]).items():
+            samples[key].append(value)
+
+    for key, values in samples.items():
+        print(
+            f"{key:12} median {statistics.median(values) * 1000:7.1f} ms"
+            f"  min {min(values) * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
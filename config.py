@@ -12,3 +12,86 @@ class Config:
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     SPOTIFY_CLIENT_ID: str = os.getenv("SPOTIFY_CLIENT_ID", "")
     SPOTIFY_CLIENT_SECRET: str = os.getenv("SPOTIFY_CLIENT_SECRET", "")
+
+    # Connection pooling for the Spotify and OpenAI APIs.
+    SPOTIFY_POOL_MAXSIZE: int = int(os.getenv("SPOTIFY_POOL_MAXSIZE", "32"))
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+    WARM_UP_CONNECTIONS: bool = os.getenv("WARM_UP_CONNECTIONS", "false") == "true"
+
+    # Seconds after which the local library index is re-synced with Spotify.
+    LIBRARY_INDEX_MAX_AGE: float = float(os.getenv("LIBRARY_INDEX_MAX_AGE", "3600"))
+    # Seconds for which prefetched playlists and liked songs are served from
+    # memory, and after which an inactive session's prefetch is abandoned.
+    LIBRARY_CACHE_TTL: float = float(os.getenv("LIBRARY_CACHE_TTL", "600"))
+    PREFETCH_IDLE_TIMEOUT: float = float(os.getenv("PREFETCH_IDLE_TIMEOUT", "300"))
+    # Similarity (0 to 1) a previously seen track needs to answer a song
+    # search without calling Spotify.
+    TRACK_RESOLVER_THRESHOLD: float = float(
+        os.getenv("TRACK_RESOLVER_THRESHOLD", "0.9")
+    )
+
+    # Models per stage of the tool loop, see `app/model_router.py`: the tool
+    # model picks tools, the final model writes the answers. Latency
+    # budgets are in seconds (0 for none) and only apply if a fallback model is
+    # set, which is used when they are exceeded.
+    OPENAI_TOOL_MODEL: str = os.getenv("OPENAI_TOOL_MODEL", "gpt-4o-mini")
+    OPENAI_FINAL_MODEL: str = os.getenv("OPENAI_FINAL_MODEL", "gpt-4o-mini")
+    OPENAI_FALLBACK_MODEL: str = os.getenv("OPENAI_FALLBACK_MODEL", "")
+    OPENAI_TOOL_LATENCY_BUDGET: float = float(
+        os.getenv("OPENAI_TOOL_LATENCY_BUDGET", "30")
+    )
+    OPENAI_FINAL_LATENCY_BUDGET: float = float(
+        os.getenv("OPENAI_FINAL_LATENCY_BUDGET", "60")
+    )
+
+    # Bounds of a single chat turn: rounds of tool calls, seconds after which
+    # running tool and model calls stop and the model must answer with what it
+    # has, and seconds it then has to answer.
+    CHAT_MAX_TOOL_ROUNDS: int = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "8"))
+    CHAT_TURN_DEADLINE: float = float(os.getenv("CHAT_TURN_DEADLINE", "120"))
+    CHAT_ANSWER_TIMEOUT: float = float(os.getenv("CHAT_ANSWER_TIMEOUT", "30"))
+
+    # Records a trace of each chat turn, see `app/tracing.py`, which `flask gc`
+    # deletes after `TRACE_MAX_AGE_DAYS`. The `/debug` pages are available in
+    # debug mode, or with this token in the `X-Debug-Token` header.
+    TRACING: bool = os.getenv("TRACING", "true") == "true"
+    TRACE_MAX_AGE_DAYS: float = float(os.getenv("TRACE_MAX_AGE_DAYS", "3"))
+    DEBUG_ROUTES_TOKEN: str = os.getenv("DEBUG_ROUTES_TOKEN", "")
+
+    # Share of `/chat` turns and page loads that are profiled, see
+    # `app/profiling.py`. Single requests can also be profiled on demand.
+    # Profiles are deleted by `flask gc` after `PROFILE_MAX_AGE_DAYS`.
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_MAX_AGE_DAYS: float = float(os.getenv("PROFILE_MAX_AGE_DAYS", "7"))
+
+    # Backend of conversation histories, `sqlite` or `memory`, see
+    # `app/conversation_store.py`.
+    CONVERSATION_STORE: str = os.getenv("CONVERSATION_STORE", "sqlite")
+    # Garbage collection, see `app/maintenance.py`. Conversations and Spotify
+    # token caches unused for the given number of days are deleted by
+    # `flask gc`, which is meant to be run by cron. A single process of a
+    # deployment may run it every `GC_INTERVAL` seconds instead (0 for never).
+    CONVERSATION_MAX_IDLE_DAYS: float = float(
+        os.getenv("CONVERSATION_MAX_IDLE_DAYS", "30")
+    )
+    SPOTIFY_CACHE_DIR: str = os.getenv("SPOTIFY_CACHE_DIR", ".spotify_cache")
+    SPOTIFY_CACHE_MAX_IDLE_DAYS: float = float(
+        os.getenv("SPOTIFY_CACHE_MAX_IDLE_DAYS", "90")
+    )
+    GC_INTERVAL: float = float(os.getenv("GC_INTERVAL", "0"))
+    # Seconds for which conversation updates are gathered before they are
+    # committed together, see `app/write_behind.py`.
+    CONVERSATION_WRITE_INTERVAL: float = float(
+        os.getenv("CONVERSATION_WRITE_INTERVAL", "0.05")
+    )
+
+    # Calls of each long tool (bulk playlist writes, whole-library reads)
+    # that may run at once, in all and per user, see `app/jobs.py`. Jobs are
+    # kept for `JOB_MAX_AGE_DAYS` after they last changed.
+    JOB_CONCURRENCY: int = int(os.getenv("JOB_CONCURRENCY", "2"))
+    JOB_CONCURRENCY_PER_USER: int = int(os.getenv("JOB_CONCURRENCY_PER_USER", "1"))
+    JOB_MAX_AGE_DAYS: float = float(os.getenv("JOB_MAX_AGE_DAYS", "7"))
+
+    # Seconds between keep-alive comments on the chat event stream. They also
+    # let the server notice clients that went away during long tool calls.
+    SSE_HEARTBEAT_INTERVAL: float = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "10"))
@@ -0,0 +1,184 @@
+"""Record/replay of the HTTP traffic to OpenAI and Spotify.
+
+Tests that mock `ChatClient` or spotipy methods can't tell whether a change
+added model round trips or Spotify requests. A `Cassette` sits below the
+clients instead: a `requests` adapter for spotipy and an `httpx` transport for
+the OpenAI SDK. It replays recorded responses in order, fails on requests that
+weren't recorded, and counts requests and bytes per host, so that scenarios
+can assert on them.
+
+Cassettes are recorded from real sessions with `CASSETTE_MODE=record`, which
+needs `OPENAI_API_KEY` and a Spotify access token in `SPOTIFY_ACCESS_TOKEN`.
+Credentials are never written to the cassette. The cassettes checked in so far
+are hand-written rather than recorded.
+"""
+
+import json
+import os
+from collections import Counter
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+CASSETTE_DIR = os.path.join(os.path.dirname(__file__), "cassettes")
+
+# Response headers worth keeping; the others only add noise to cassettes.
+KEPT_HEADERS = ("content-type", "retry-after")
+
+
+class UnexpectedRequest(AssertionError):
+    pass
+
+
+def _decode(body: bytes, content_type: str) -> object:
+    if "json" in content_type and body:
+        return json.loads(body)
+    return body.decode()
+
+
+def _encode(body: object) -> bytes:
+    return body.encode() if isinstance(body, str) else json.dumps(body).encode()
+
+
+class Cassette:
+    def __init__(self, name: str, record: bool = False):
+        self.path = os.path.join(CASSETTE_DIR, f"{name}.json")
+        self.record = record
+        self.interactions: list[dict] = []
+        if not record:
+            with open(self.path) as f:
+                self.interactions = json.load(f)
+        self._used = [False] * len(self.interactions)
+        self.requests: Counter[str] = Counter()
+        self.bytes_sent: Counter[str] = Counter()
+
+    def requests_to(self, host: str, path: str | None = None) -> int:
+        """Returns the number of requests to `host`, or to `path` on it."""
+        if path is None:
+            return self.requests[host]
+        return self.requests[f"{host}{path}"]
+
+    def _count(self, url: str, body: bytes | None) -> None:
+        parts = urlsplit(url)
+        self.requests[parts.netloc] += 1
+        self.requests[f"{parts.netloc}{parts.path}"] += 1
+        self.bytes_sent[parts.netloc] += len(body or b"")
+
+    def _replay(self, method: str, url: str) -> dict:
+        """Returns the first unused interaction recorded for the request."""
+        for i, interaction in enumerate(self.interactions):
+            request = interaction["request"]
+            if not self._used[i] and request == {"method": method, "url": url}:
+                self._used[i] = True
+                return interaction["response"]
+        raise UnexpectedRequest(f"No recorded response for {method} {url}")
+
+    def _append(
+        self, method: str, url: str, status: int, headers: dict, body: bytes
+    ) -> None:
+        headers = {k.lower(): v for k, v in headers.items()}
+        content_type = headers.get("content-type", "")
+        self.interactions.append(
+            {
+                "request": {"method": method, "url": url},
+                "response": {
+                    "status": status,
+                    "headers": {k: v for k, v in headers.items() if k in KEPT_HEADERS},
+                    "body": _decode(body, content_type),
+                },
+            }
+        )
+
+    def save(self) -> None:
+        if self.record:
+            os.makedirs(CASSETTE_DIR, exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.interactions, f, indent=1)
+
+    def unused(self) -> int:
+        """Returns the number of recorded interactions that weren't replayed."""
+        return self._used.count(False)
+
+    def requests_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = _CassetteAdapter(self)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def httpx_transport(self) -> httpx.BaseTransport:
+        return _CassetteTransport(self)
+
+
+class _CassetteAdapter(BaseAdapter):
+    def __init__(self, cassette: Cassette):
+        super().__init__()
+        self.cassette = cassette
+        self._real = HTTPAdapter() if cassette.record else None
+
+    def send(self, request, **kwargs) -> requests.Response:
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        method, url = request.method, request.url
+        self.cassette._count(url, body)
+        if self._real:
+            response = self._real.send(request, **kwargs)
+            self.cassette._append(
+                method,
+                url,
+                response.status_code,
+                dict(response.headers),
+                response.content,
+            )
+            return response
+
+        recorded = self.cassette._replay(method, url)
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response._content = _encode(recorded["body"])
+        response.encoding = "utf-8"
+        response.url = url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        if self._real:
+            self._real.close()
+
+
+class _CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._real = httpx.HTTPTransport() if cassette.record else None
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        method, url = request.method, str(request.url)
+        self.cassette._count(url, body)
+        if self._real:
+            response = self._real.handle_request(request)
+            content = response.read()
+            self.cassette._append(
+                method, url, response.status_code, dict(response.headers), content
+            )
+            # The content is already decoded, so `content-encoding` is dropped.
+            headers = {
+                k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS
+            }
+            return httpx.Response(
+                response.status_code, headers=headers, content=content
+            )
+
+        recorded = self.cassette._replay(method, url)
+        return httpx.Response(
+            recorded["status"],
+            headers=recorded["headers"],
+            content=_encode(recorded["body"]),
+        )
+
+    def close(self) -> None:
+        if self._real:
+            self._real.close()
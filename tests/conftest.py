@@ -4,9 +4,9 @@ from app.database import init_db
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """Create and configure a new app instance for each test."""
-    app = create_app()
+    app = create_app(instance_path=str(tmp_path / "instance"))
     app.config.update(
         {
             "TESTING": True,
@@ -1,17 +1,24 @@
 import json
+import subprocess
+import sys
+import threading
 from unittest.mock import patch
 
+from flask import session
+
 from app import create_app
-from app.chat_client import ChatResponse
+from app.chat_client import ChatResponse, ToolCallResponse
+from app.database import get_conversation
 
 
-@patch("app.routes.chat_client")
-def test_chat_get(mock_chat_client) -> None:
+@patch("app.routes.get_chat_client")
+def test_chat_get(mock_get_chat_client, tmp_path) -> None:
     # Arrange
+    mock_chat_client = mock_get_chat_client.return_value
     mock_chat_client.get_chat_completion.return_value = [
         ChatResponse(conversation_history=[], response="Test response")
     ]
-    app = create_app()
+    app = create_app(instance_path=str(tmp_path / "instance"))
     client = app.test_client()
 
     # Act
@@ -28,11 +35,77 @@ def test_chat_get(mock_chat_client) -> None:
     # The response from the chat endpoint is JSON, so we need to check for the
     # response in the JSON data.
     elements = response.data.rstrip(b"\n").split(b"\n\n")
-    assert len(elements) == 2
+    assert len(elements) == 3
     print("Hundwyler: %s" % elements)
     dicts = [
         json.loads(item.decode().removeprefix("data: ").strip()) for item in elements
     ]
-    assert dicts[0]["response"] == "Test response"
-    assert dicts[1]["status"] == "end"
+    assert len(dicts[0]["trace_id"]) == 32
+    assert dicts[1]["response"] == "Test response"
+    assert dicts[2]["status"] == "end"
     mock_chat_client.get_chat_completion.assert_called_once()
+
+
+def test_create_app_does_not_build_chat_client(monkeypatch, tmp_path) -> None:
+    # Arrange
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    app = create_app(instance_path=str(tmp_path / "instance"))
+
+    # Act
+    with app.app_context():
+        result = app.test_cli_runner().invoke(args=["init-db"])
+
+    # Assert
+    assert "Initialized the database." in result.output
+    assert "chat_client" not in app.extensions
+
+
+def test_create_app_does_not_import_openai(tmp_path) -> None:
+    # A fresh interpreter, as other tests have already imported the SDK.
+    code = (
+        "import sys\n"
+        "from app import create_app\n"
+        f"create_app(instance_path={str(tmp_path / 'instance')!r})\n"
+        "print('openai' in sys.modules)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+@patch("app.routes.get_chat_client")
+def test_chat_is_cancelled_when_client_disconnects(
+    mock_get_chat_client, tmp_path
+) -> None:
+    # Arrange
+    cancelled = threading.Event()
+
+    def get_chat_completion(history, spotify_client, cancel, on_progress=None):
+        history.append({"type": "function_call", "call_id": "c1", "name": "f"})
+        history.append({"type": "function_call_output", "call_id": "c1"})
+        history.append({"type": "function_call", "call_id": "c2", "name": "f"})
+        yield ToolCallResponse("f", "{}")
+        if cancel.wait(timeout=5):
+            cancelled.set()
+
+    mock_get_chat_client.return_value.get_chat_completion = get_chat_completion
+    app = create_app(instance_path=str(tmp_path / "instance"))
+    client = app.test_client()
+
+    # Act
+    with client:
+        client.get("/")
+        response = client.get("/chat?query=Test%20query", buffered=False)
+        next(response.response)  # The trace ID
+        first_event = next(response.response)
+        response.close()
+        conversation_id = session["conversation_id"]
+
+    # Assert
+    assert b"tool_code" in first_event
+    assert cancelled.wait(timeout=5)
+    with app.app_context():
+        history = get_conversation(conversation_id)
+    # The call without output is dropped.
+    assert [item.get("call_id") for item in history] == [None, "c1", "c1"]
@@ -1,7 +1,11 @@
 import os
+import threading
+import time
 from typing import Iterator
 from unittest.mock import MagicMock, patch
 
+import httpx
+import openai
 import pytest
 from openai.types.responses import (
     Response,
@@ -10,7 +14,9 @@ from openai.types.responses import (
     ResponseOutputText,
 )
 
-from app.chat_client import ChatClient, ChatResponse, ToolCallResponse
+from app import tool_registry, tools
+from app.chat_client import ChatClient, ChatResponse, ToolCallResponse, TurnBudget
+from app.tracks import Track
 
 
 @pytest.fixture
@@ -225,3 +231,201 @@ def test_create_playlist_tool_call(chat_client: ChatClient) -> None:
     mock_spotify_client.create_playlist.assert_called_once_with(
         "New Playlist", "A new playlist", ["spotify:track:123"]
     )
+
+
+def test_tool_error_is_returned_to_model(chat_client: ChatClient) -> None:
+    """Test that a failing tool call is reported to the model as an error output."""
+    # Arrange
+    mock_spotify_client = MagicMock()
+    mock_spotify_client.get_liked_songs.side_effect = RuntimeError("Spotify is down")
+
+    # Act
+    result = chat_client.perform_function_call(
+        mock_spotify_client, "get_liked_songs", "call_123", "{}"
+    )
+
+    # Assert
+    assert result["call_id"] == "call_123"
+    assert "RuntimeError" in result["output"]
+    assert "Spotify is down" in result["output"]
+
+
+def test_parallel_tool_calls_keep_order(chat_client: ChatClient) -> None:
+    """Test that tool calls run in parallel are added to the history in order."""
+    # Arrange
+    outputs = [
+        ResponseFunctionToolCall(
+            id=f"id_{i}",
+            call_id=f"call_{i}",
+            name="get_playlist_contents",
+            arguments=f'{{"playlist_id": "playlist_{i}"}}',
+            type="function_call",
+        )
+        for i in range(3)
+    ]
+    mock_spotify_client = MagicMock()
+    mock_spotify_client.get_playlist_contents.side_effect = lambda playlist_id: [
+        Track(playlist_id, playlist_id, "Artist", "Album")
+    ]
+
+    # Act
+    history = chat_client.process_tool_calls(outputs, [], mock_spotify_client)
+
+    # Assert
+    assert [item["call_id"] for item in history] == [
+        "call_0",
+        "call_0",
+        "call_1",
+        "call_1",
+        "call_2",
+        "call_2",
+    ]
+    assert "playlist_2" in history[5]["output"]
+    assert mock_spotify_client.get_playlist_contents.call_count == 3
+
+
+def test_cancelled_turn_stops_after_running_tool_call(chat_client: ChatClient) -> None:
+    """Test that a cancelled turn drops the interrupted call and stops."""
+    # Arrange
+    cancel = threading.Event()
+    mock_response = MagicMock(spec=Response)
+    mock_response.output = [
+        ResponseFunctionToolCall(
+            call_id="call_1",
+            name="get_playlist_contents",
+            arguments='{"playlist_id": "playlist_1"}',
+            type="function_call",
+        )
+    ]
+    chat_client.client.responses.create.return_value = mock_response
+    mock_spotify_client = MagicMock()
+
+    def get_playlist_contents(playlist_id):
+        cancel.set()
+        return []
+
+    mock_spotify_client.get_playlist_contents.side_effect = get_playlist_contents
+    conversation_history = [{"role": "user", "content": "Hello"}]
+
+    # Act
+    list(
+        chat_client.get_chat_completion(
+            conversation_history, mock_spotify_client, cancel
+        )
+    )
+
+    # Assert
+    chat_client.client.responses.create.assert_called_once()
+    assert conversation_history == [{"role": "user", "content": "Hello"}]
+
+
+def test_exhausted_budget_forces_final_answer(chat_client: ChatClient) -> None:
+    """Test that the turn ends with a no-tools call once the budget is used up."""
+    # Arrange
+    chat_client.budget = TurnBudget(max_tool_rounds=1)
+    mock_response_tool_call = MagicMock(spec=Response)
+    mock_response_tool_call.output = [
+        ResponseFunctionToolCall(
+            call_id="call_1",
+            name="get_my_playlists",
+            arguments="{}",
+            type="function_call",
+        )
+    ]
+    mock_response_text = MagicMock(spec=Response)
+    mock_response_text.output = [
+        ResponseOutputMessage(
+            id="test_id",
+            content=[
+                ResponseOutputText(
+                    text="Best effort.", type="output_text", annotations=[]
+                )
+            ],
+            type="message",
+            role="assistant",
+            status="completed",
+        )
+    ]
+    chat_client.client.responses.create.side_effect = [
+        mock_response_tool_call,
+        mock_response_text,
+    ]
+    mock_spotify_client = MagicMock()
+    mock_spotify_client.get_user_playlists.return_value = []
+
+    # Act
+    results = list(
+        chat_client.get_chat_completion(
+            [{"role": "user", "content": "Hello"}], mock_spotify_client
+        )
+    )
+
+    # Assert
+    assert results[-1].response == "Best effort."
+    calls = chat_client.client.responses.create.call_args_list
+    assert "at most 1 more rounds" in calls[0].kwargs["input"][1]["content"]
+    assert calls[1].kwargs["tool_choice"] == "none"
+
+
+def test_turn_deadline_bounds_tool_and_model_calls(chat_client: ChatClient) -> None:
+    # Arrange
+    chat_client.budget = TurnBudget(deadline=0.2, answer_timeout=5.0)
+    tool_call = MagicMock(spec=Response)
+    tool_call.output = [
+        ResponseFunctionToolCall(
+            call_id="call_1",
+            name="get_my_playlists",
+            arguments="{}",
+            type="function_call",
+        )
+    ]
+    answer = MagicMock(spec=Response)
+    answer.output = [
+        ResponseOutputMessage(
+            id="test_id",
+            content=[
+                ResponseOutputText(text="Too slow.", type="output_text", annotations=[])
+            ],
+            type="message",
+            role="assistant",
+            status="completed",
+        )
+    ]
+    calls: list[dict] = []
+
+    def create(**kwargs) -> Response:
+        calls.append(kwargs)
+        if len(calls) == 1:
+            return tool_call
+        if len(calls) == 2:
+            # The model is slower than the rest of the turn.
+            time.sleep(kwargs["timeout"])
+            raise openai.APITimeoutError(request=httpx.Request("POST", "https://x"))
+        return answer
+
+    chat_client.client.responses.create.side_effect = create
+    tool_timeouts = []
+
+    def get_user_playlists() -> list:
+        tool_timeouts.append(tool_registry._deadline.get()[1])  # type: ignore[index]
+        return []
+
+    mock_spotify_client = MagicMock()
+    mock_spotify_client.user_id = "deadline-test-user"
+    mock_spotify_client.get_user_playlists.side_effect = get_user_playlists
+
+    # Act
+    results = list(
+        chat_client.get_chat_completion(
+            [{"role": "user", "content": "Hello"}], mock_spotify_client
+        )
+    )
+    tools.registry.invalidate("get_my_playlists", scope="deadline-test-user")
+
+    # Assert
+    assert results[-1].response == "Too slow."
+    # The tool's own timeout is 60 seconds.
+    assert 0 < tool_timeouts[0] <= 0.2
+    assert [0 < call["timeout"] <= 0.2 for call in calls[:2]] == [True, True]
+    assert calls[2]["tool_choice"] == "none"
+    assert 4 < calls[2]["timeout"] <= 5
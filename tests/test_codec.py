@@ -0,0 +1,77 @@
+import json
+
+from app.codec import HistoryCodec, dumps
+from app.conversation_store import SQLiteConversationStore
+
+HISTORY = [
+    {"role": "user", "content": "Find songs by Miles Davis"},
+    {
+        "type": "function_call",
+        "name": "search_songs",
+        "call_id": "call_1",
+        "arguments": '{"title":"So What","artist":"Miles Davis","limit":5}',
+    },
+    {
+        "type": "function_call_output",
+        "call_id": "call_1",
+        "output": str(
+            [
+                {
+                    "name": "So What",
+                    "artist": "Miles Davis",
+                    "album": "Kind of Blue",
+                    "track_id": f"id{i}",
+                }
+                for i in range(5)
+            ]
+        ),
+    },
+    {"role": "assistant", "content": "Here are five songs by Miles Davis – enjoy!"},
+]
+
+
+def test_short_history_is_compact_json():
+    # Arrange
+    codec = HistoryCodec()
+
+    # Act
+    encoded = codec.encode(HISTORY)
+
+    # Assert
+    assert encoded == dumps(HISTORY)
+    assert codec.decode(encoded) == HISTORY
+
+
+def test_long_history_is_compressed():
+    # Arrange
+    codec = HistoryCodec(min_size=1024)
+    history = HISTORY * 10
+
+    # Act
+    encoded = codec.encode(history)
+
+    # Assert
+    assert codec.decode(encoded) == history
+    assert len(encoded) < len(json.dumps(history)) / 4
+
+
+def test_legacy_json_is_decoded():
+    # Act & Assert
+    assert HistoryCodec().decode(json.dumps(HISTORY)) == HISTORY
+    assert HistoryCodec().decode(json.dumps(HISTORY).encode()) == HISTORY
+
+
+def test_store_reads_legacy_rows(tmp_path):
+    # Arrange
+    store = SQLiteConversationStore(str(tmp_path / "db.sqlite"))
+    with store._connect() as db:
+        db.execute(
+            "INSERT INTO conversation (id, history) VALUES (?, ?)",
+            ("old", json.dumps(HISTORY)),
+        )
+
+    # Act
+    store.append("old", [{"role": "user", "content": "More"}])
+
+    # Assert
+    assert store.get("old") == HISTORY + [{"role": "user", "content": "More"}]
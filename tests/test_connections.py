@@ -0,0 +1,32 @@
+from unittest.mock import MagicMock, patch
+
+from app.connections import get_openai_http_client, get_spotify_session
+from app.spotify_client import SpotifyClient
+
+
+def test_spotify_session_is_shared():
+    assert get_spotify_session() is get_spotify_session()
+
+
+def test_spotify_session_survives_client_close():
+    # Arrange
+    session = get_spotify_session()
+    adapter = session.get_adapter("https://api.spotify.com/")
+
+    # Act
+    session.close()
+
+    # Assert
+    assert session.get_adapter("https://api.spotify.com/") is adapter
+    assert adapter.poolmanager is not None
+
+
+def test_spotify_client_uses_shared_session():
+    with patch("spotipy.Spotify") as mock_spotify:
+        SpotifyClient(auth_manager=MagicMock())
+
+    assert mock_spotify.call_args.kwargs["requests_session"] is get_spotify_session()
+
+
+def test_openai_http_client_is_shared():
+    assert get_openai_http_client() is get_openai_http_client()
@@ -0,0 +1,175 @@
+"""Behaviour every conversation store must have. Add new backends to
+`BACKENDS`.
+"""
+
+import threading
+import time
+from collections.abc import Callable
+from unittest.mock import patch
+
+import pytest
+
+from app.conversation_store import (
+    ConversationStore,
+    InMemoryConversationStore,
+    SQLiteConversationStore,
+)
+
+BACKENDS: dict[str, Callable[[str], ConversationStore]] = {
+    "memory": lambda directory: InMemoryConversationStore(),
+    "sqlite": lambda directory: SQLiteConversationStore(f"{directory}/db.sqlite"),
+}
+
+USER = {"role": "user", "content": "hello"}
+ASSISTANT = {"role": "assistant", "content": "hi there"}
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path) -> ConversationStore:
+    return BACKENDS[request.param](str(tmp_path))
+
+
+def test_create_and_get(store: ConversationStore):
+    # Act
+    store.create("c1", [USER])
+
+    # Assert
+    assert store.get("c1") == [USER]
+    assert store.get("missing") is None
+
+
+def test_returned_history_is_a_copy(store: ConversationStore):
+    # Arrange
+    store.create("c1", [USER])
+
+    # Act
+    store.get("c1").append(ASSISTANT)  # type: ignore[union-attr]
+
+    # Assert
+    assert store.get("c1") == [USER]
+
+
+def test_create_replaces_existing_conversation(store: ConversationStore):
+    # Arrange
+    store.create("c1", [USER, ASSISTANT])
+
+    # Act
+    store.create("c1", [])
+
+    # Assert
+    assert store.get("c1") == []
+
+
+def test_update_many_ignores_unknown_ids(store: ConversationStore):
+    # Arrange
+    store.create("c1", [])
+    store.create("c2", [])
+
+    # Act
+    store.update_many({"c1": [USER], "c2": [USER, ASSISTANT], "missing": [USER]})
+
+    # Assert
+    assert store.get("c1") == [USER]
+    assert store.get("c2") == [USER, ASSISTANT]
+    assert store.get("missing") is None
+
+
+def test_append(store: ConversationStore):
+    # Arrange
+    store.create("c1", [USER])
+
+    # Act
+    appended = store.append("c1", [ASSISTANT])
+
+    # Assert
+    assert appended
+    assert store.get("c1") == [USER, ASSISTANT]
+    assert not store.append("missing", [USER])
+
+
+def test_concurrent_appends_are_not_lost(store: ConversationStore):
+    # Arrange
+    store.create("c1", [])
+
+    def append_many(thread: int) -> None:
+        for i in range(20):
+            store.append("c1", [{"role": "user", "content": f"{thread}-{i}"}])
+
+    # Act
+    threads = [threading.Thread(target=append_many, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Assert
+    assert len(store.get("c1")) == 80  # type: ignore[arg-type]
+
+
+def test_delete(store: ConversationStore):
+    # Arrange
+    store.create("c1", [USER], user_id="u1")
+
+    # Act & Assert
+    assert store.delete("c1")
+    assert store.get("c1") is None
+    assert store.list_by_user("u1") == []
+    assert not store.delete("c1")
+
+
+def test_list_by_user_in_creation_order(store: ConversationStore):
+    # Arrange
+    store.create("c1", [], user_id="u1")
+    store.create("c2", [], user_id="u2")
+    store.create("c3", [], user_id="u1")
+    store.create("c4", [])
+
+    # Act & Assert
+    assert store.list_by_user("u1") == ["c1", "c3"]
+    assert store.list_by_user("u2") == ["c2"]
+    assert store.list_by_user("nobody") == []
+
+
+def test_get_many(store: ConversationStore):
+    # Arrange
+    ids = [f"c{i}" for i in range(1200)]
+    for conversation_id in ids:
+        store.create(conversation_id, [{"role": "user", "content": conversation_id}])
+
+    # Act
+    histories = store.get_many(ids + ["missing"])
+
+    # Assert
+    assert len(histories) == 1200
+    assert histories["c7"] == [{"role": "user", "content": "c7"}]
+
+
+def test_app_uses_configured_store(client, app):
+    # Arrange
+    app.config["CONVERSATION_STORE"] = "memory"
+
+    # Act
+    client.get("/")
+
+    # Assert
+    with client.session_transaction() as session:
+        conversation_id = session["conversation_id"]
+    store = app.extensions["conversation_store"]
+    assert isinstance(store, InMemoryConversationStore)
+    assert store.get(conversation_id) == []
+
+
+def test_delete_idle(store: ConversationStore):
+    # Arrange
+    store.create("old", [USER])
+    cutoff = time.time() + 1
+    with patch("time.time", return_value=cutoff + 10):
+        store.create("new", [USER])
+
+    # Act
+    deleted = store.delete_idle(cutoff)
+
+    # Assert
+    assert deleted == 1
+    assert store.get("old") is None
+    assert store.get("new") == [USER]
@@ -1,9 +1,9 @@
-import json
 from unittest.mock import MagicMock, patch
 
 from flask import Flask
 
 from app.chat_client import ChatResponse
+from app.codec import HistoryCodec
 from app.database import get_db
 
 
@@ -29,7 +29,7 @@ def test_conversation_lifecycle(client, app: Flask):
         ]
     )
 
-    with patch("app.routes.chat_client", mock_chat_client):
+    with patch("app.routes.get_chat_client", return_value=mock_chat_client):
         # 1. Initial visit
         response = client.get("/")
         assert response.status_code == 200
@@ -44,7 +44,7 @@ def test_conversation_lifecycle(client, app: Flask):
             )
             row = cur.fetchone()
             assert row is not None
-            assert json.loads(row["history"]) == []
+            assert HistoryCodec().decode(row["history"]) == []
 
         # 2. Send a chat message
         response = client.get("/chat?query=hello")
@@ -62,7 +62,7 @@ def test_conversation_lifecycle(client, app: Flask):
                 {"role": "user", "content": "hello"},
                 {"role": "assistant", "content": "hi there"},
             ]
-            assert json.loads(row["history"]) == expected_history
+            assert HistoryCodec().decode(row["history"]) == expected_history
 
         # 3. Verify persistence on page reload
         response = client.get("/")
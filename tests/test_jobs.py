@@ -0,0 +1,186 @@
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app import tools
+from app.chat_client import ChatClient, ToolProgressResponse, TurnCancelled
+from app.jobs import DONE, FAILED, QUEUED, RUNNING, Job, JobQueue, report_progress
+
+
+@pytest.fixture
+def jobs(tmp_path) -> JobQueue:
+    return JobQueue(str(tmp_path / "jobs.sqlite"), per_kind=2, per_owner=1)
+
+
+def test_job_runs_on_the_callers_thread(jobs: JobQueue):
+    # Arrange
+    threads = []
+
+    def work() -> dict:
+        threads.append(threading.current_thread())
+        return {"playlist_id": "p1"}
+
+    # Act
+    result = jobs.run("create_playlist", work, owner="u1")
+
+    # Assert
+    assert result == {"playlist_id": "p1"}
+    assert threads == [threading.current_thread()]
+    row = jobs.recent()[0]
+    assert (row["tool"], row["owner"], row["status"]) == ("create_playlist", "u1", DONE)
+    assert row["progress"] == 1.0
+    assert row["result"] == "{'playlist_id': 'p1'}"
+
+
+def test_progress_is_passed_on(jobs: JobQueue):
+    # Arrange
+    updates: list[tuple[float, str]] = []
+
+    def work() -> None:
+        report_progress(1, 4, "Adding tracks")
+        report_progress(3, 4, "Adding tracks")
+
+    def on_progress(job: Job) -> None:
+        updates.append((job.progress, job.message))
+        assert jobs.get(job.id)["status"] == RUNNING  # type: ignore[index]
+
+    # Act
+    jobs.run("create_playlist", work, on_progress=on_progress)
+
+    # Assert
+    assert updates == [(0.25, "Adding tracks"), (0.75, "Adding tracks")]
+
+
+def test_report_progress_outside_of_jobs_does_nothing():
+    report_progress(1, 2, "Nothing")
+
+
+def test_failed_job_raises(jobs: JobQueue):
+    # Arrange
+    def work() -> None:
+        raise ValueError("No such playlist")
+
+    # Act
+    with pytest.raises(ValueError, match="No such playlist"):
+        jobs.run("update_playlist", work)
+
+    # Assert
+    row = jobs.recent()[0]
+    assert row["status"] == FAILED
+    assert "No such playlist" in row["result"]
+
+
+def run_in_thread(jobs: JobQueue, tool: str, owner: str) -> threading.Event:
+    """Starts a job that runs until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def work() -> None:
+        started.set()
+        release.wait(timeout=5)
+
+    threading.Thread(target=jobs.run, args=(tool, work, owner)).start()
+    assert started.wait(timeout=5)
+    return release
+
+
+def test_jobs_wait_for_capacity_of_their_tool_and_user(jobs: JobQueue):
+    # Arrange
+    release = run_in_thread(jobs, "summarize_library", "u1")
+    statuses = []
+
+    def check_cancelled() -> None:
+        statuses.append(jobs.recent()[0]["status"])
+        release.set()
+
+    # Act
+    other_tool = jobs.run("create_playlist", lambda: "other tool", "u1")
+    other_user = jobs.run("summarize_library", lambda: "other user", "u2")
+    same_user = jobs.run(
+        "summarize_library",
+        lambda: "same user",
+        "u1",
+        check_cancelled=check_cancelled,
+        poll_interval=0.01,
+    )
+
+    # Assert
+    assert (other_tool, other_user, same_user) == (
+        "other tool",
+        "other user",
+        "same user",
+    )
+    assert statuses[0] == QUEUED
+
+
+def test_cancelled_job_stops_waiting_in_line(jobs: JobQueue):
+    # Arrange
+    release = run_in_thread(jobs, "create_playlist", "u1")
+    work = MagicMock()
+
+    def check_cancelled() -> None:
+        raise TurnCancelled()
+
+    # Act
+    with pytest.raises(TurnCancelled):
+        jobs.run(
+            "create_playlist",
+            work,
+            "u1",
+            check_cancelled=check_cancelled,
+            poll_interval=0.01,
+        )
+    release.set()
+
+    # Assert
+    work.assert_not_called()
+    assert jobs.recent()[0]["status"] == FAILED
+
+
+def test_delete_old(jobs: JobQueue):
+    # Arrange
+    jobs.run("create_playlist", lambda: None)
+    job = jobs.recent()[0]
+
+    # Act
+    kept = jobs.delete_old(0)
+    deleted = jobs.delete_old(float("inf"))
+
+    # Assert
+    assert (kept, deleted) == (0, 1)
+    assert jobs.get(job["id"]) is None
+
+
+def test_chat_client_runs_long_tools_as_jobs(jobs: JobQueue):
+    # Arrange
+    def summarize_library(top: int) -> dict:
+        report_progress(1, 2, "Reading Jazz")
+        return {"distinct_tracks": 3}
+
+    spotify_client = MagicMock()
+    spotify_client.user_id = "jobs-test-user"
+    spotify_client.summarize_library.side_effect = summarize_library
+    progress: list[ToolProgressResponse] = []
+    with (
+        patch("openai.OpenAI"),
+        patch.dict(os.environ, {"OPENAI_API_KEY": "test_api_key"}),
+    ):
+        chat_client = ChatClient(jobs=jobs)
+
+    # Act
+    output = chat_client.perform_function_call(
+        spotify_client,
+        "summarize_library",
+        "call_1",
+        '{"top": 5}',
+        on_progress=progress.append,
+    )
+    tools.registry.invalidate("summarize_library", scope="jobs-test-user")
+
+    # Assert
+    assert output["output"] == "{'distinct_tracks': 3}"
+    assert [(p.function_name, p.progress, p.message) for p in progress] == [
+        ("summarize_library", 0.5, "Reading Jazz")
+    ]
+    assert jobs.recent()[0]["tool"] == "summarize_library"
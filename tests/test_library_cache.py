@@ -0,0 +1,154 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from app.library_cache import (
+    LIKED_SONGS,
+    PLAYLISTS,
+    LibraryCache,
+    LibraryPrefetcher,
+)
+from app.spotify_client import SpotifyClient
+
+
+def page(items: list[dict], next_url: str | None = None) -> dict:
+    return {"items": items, "next": next_url, "total": len(items)}
+
+
+def saved_track(track_id: str) -> dict:
+    return {
+        "track": {
+            "id": track_id,
+            "name": f"Song {track_id}",
+            "artists": [{"name": "Artist"}],
+            "album": {"name": "Album"},
+        }
+    }
+
+
+def test_cache_expires():
+    # Arrange
+    now = [0.0]
+    cache = LibraryCache(ttl=10, clock=lambda: now[0])
+    cache.put("alice", PLAYLISTS, ["p1"])
+
+    # Act & Assert
+    assert cache.get("alice", PLAYLISTS) == ["p1"]
+    assert cache.get("bob", PLAYLISTS) is None
+    now[0] = 11
+    assert cache.get("alice", PLAYLISTS) is None
+
+
+def test_cache_drops_least_recently_used_and_expired_users():
+    # Arrange
+    now = [0.0]
+    cache = LibraryCache(ttl=10, clock=lambda: now[0], max_users=2)
+    cache.put("alice", PLAYLISTS, ["p1"])
+    cache.put("bob", PLAYLISTS, ["p2"])
+    cache.get("alice", PLAYLISTS)
+
+    # Act
+    cache.put("carol", PLAYLISTS, ["p3"])
+    kept = list(cache._users)
+    now[0] = 11
+    cache.put("dave", PLAYLISTS, ["p4"])
+
+    # Assert
+    assert kept == ["alice", "carol"]
+    assert list(cache._users) == ["dave"]
+
+
+def test_prefetched_library_is_served_from_cache():
+    # Arrange
+    cache = LibraryCache()
+    prefetcher = LibraryPrefetcher(cache)
+    with patch("spotipy.Spotify") as mock_spotify:
+        spotify = mock_spotify.return_value
+        spotify.me.return_value = {"id": "alice"}
+        spotify.current_user_playlists.return_value = page([])
+        spotify.current_user_saved_tracks.return_value = page([saved_track("t1")])
+
+        # Act
+        prefetcher.prefetch(
+            "session", SpotifyClient(auth_manager=MagicMock(), library_cache=cache)
+        ).result()
+        liked_songs = SpotifyClient(
+            auth_manager=MagicMock(), library_cache=cache
+        ).get_liked_songs()
+
+    # Assert
+    assert [song.track_id for song in liked_songs] == ["t1"]
+    spotify.current_user_saved_tracks.assert_called_once()
+    assert cache.is_fresh("alice")
+
+
+def test_prefetch_is_cancelled_when_session_goes_idle():
+    # Arrange
+    now = [0.0]
+    cache = LibraryCache()
+    prefetcher = LibraryPrefetcher(cache, idle_timeout=60, clock=lambda: now[0])
+
+    def next_page(results):
+        # The user leaves while the first page is being processed.
+        now[0] += 100
+        return page([], next_url="page3")
+
+    with patch("spotipy.Spotify") as mock_spotify:
+        spotify = mock_spotify.return_value
+        spotify.me.return_value = {"id": "alice"}
+        spotify.current_user_playlists.return_value = page([], next_url="page2")
+        spotify.next.side_effect = next_page
+
+        # Act
+        prefetcher.prefetch(
+            "session", SpotifyClient(auth_manager=MagicMock(), library_cache=cache)
+        ).result()
+
+    # Assert
+    spotify.next.assert_called_once()
+    spotify.current_user_saved_tracks.assert_not_called()
+    assert cache.get("alice", LIKED_SONGS) is None
+
+
+def test_turn_fetches_again_after_idle_prefetch_it_waited_for():
+    # Arrange
+    now = [0.0]
+    cache = LibraryCache()
+    prefetcher = LibraryPrefetcher(cache, idle_timeout=60, clock=lambda: now[0])
+    started, waiting = threading.Event(), threading.Event()
+    playlist = {
+        "id": "p1",
+        "name": "Jazz",
+        "description": "",
+        "owner": {"id": "alice"},
+        "tracks": {"total": 0},
+    }
+
+    def current_user_playlists(**kwargs) -> dict:
+        if not started.is_set():
+            # The prefetch goes idle while the turn waits for it.
+            started.set()
+            waiting.wait(timeout=5)
+            now[0] += 100
+            return page([], next_url="page2")
+        return page([playlist])
+
+    with (
+        patch("spotipy.Spotify") as mock_spotify,
+        patch("app.single_flight.logger.info", side_effect=lambda _: waiting.set()),
+    ):
+        spotify = mock_spotify.return_value
+        spotify.me.return_value = {"id": "alice"}
+        spotify.current_user_playlists.side_effect = current_user_playlists
+        prefetch = prefetcher.prefetch(
+            "session", SpotifyClient(auth_manager=MagicMock(), library_cache=cache)
+        )
+        assert started.wait(timeout=5)
+
+        # Act
+        turn_client = SpotifyClient(auth_manager=MagicMock(), library_cache=cache)
+        playlists = turn_client.get_user_playlists()
+        prefetch.result()  # type: ignore[union-attr]
+
+    # Assert
+    assert [p["playlist_id"] for p in playlists] == ["p1"]
+    spotify.next.assert_not_called()
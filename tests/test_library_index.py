@@ -0,0 +1,241 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.library_index import LIKED_SONGS, PLAYLIST, LibraryIndex
+from app.spotify_client import SpotifyClient
+from app.tracks import Track
+
+
+def track(name: str, artist: str, album: str, track_id: str) -> Track:
+    return Track(track_id, name, artist, album)
+
+
+@pytest.fixture
+def index(tmp_path) -> LibraryIndex:
+    return LibraryIndex(str(tmp_path / "library.sqlite"))
+
+
+def test_search_returns_tracks_with_their_sources(index: LibraryIndex):
+    # Arrange
+    naima = track("Naima", "John Coltrane", "Giant Steps", "t1")
+    so_what = track("So What", "Miles Davis", "Kind of Blue", "t2")
+    index.index_playlists("alice", [("p1", "Jazz, mostly", "s1"), ("p2", "Sax", "s1")])
+    index.index_tracks("alice", PLAYLIST, "p1", [naima, so_what])
+    index.index_tracks("alice", PLAYLIST, "p2", [naima])
+    index.index_tracks("alice", LIKED_SONGS, LIKED_SONGS, [naima], "Liked Songs")
+
+    # Act
+    results = index.search("alice", "coltrane")
+
+    # Assert
+    assert len(results) == 1
+    assert results[0]["track_id"] == "t1"
+    assert sorted(results[0]["in"]) == ["Jazz, mostly", "Liked Songs", "Sax"]
+
+
+def test_search_is_per_user_and_tolerates_syntax(index: LibraryIndex):
+    # Arrange
+    index.index_tracks(
+        "alice", PLAYLIST, "p1", [track("Naïma", "John Coltrane", "Giant", "t1")]
+    )
+
+    # Act & Assert
+    assert index.search("bob", "coltrane") == []
+    assert index.search("alice", 'naima" (') != []
+    assert index.search("alice", "colt") != []
+    assert index.search("alice", "***") == []
+
+
+def test_reindexing_replaces_tracks(index: LibraryIndex):
+    # Arrange
+    index.index_tracks("alice", PLAYLIST, "p1", [track("A", "X", "Y", "t1")])
+
+    # Act
+    index.index_tracks("alice", PLAYLIST, "p1", [track("B", "X", "Y", "t2")])
+
+    # Assert
+    assert [r["track_id"] for r in index.search("alice", "X")] == ["t2"]
+
+
+def test_tracks_keep_their_artists(index: LibraryIndex):
+    # Arrange
+    september = Track(
+        "t1",
+        "September",
+        "Earth, Wind & Fire",
+        "The Best of",
+        artists=("Earth, Wind & Fire",),
+    )
+    index.index_tracks("alice", LIKED_SONGS, LIKED_SONGS, [september])
+
+    # Act
+    (track,) = index.tracks("alice")
+
+    # Assert
+    assert track.artists == ("Earth, Wind & Fire",)
+
+
+def test_reads_and_deletes_of_a_user_use_the_index(index: LibraryIndex):
+    # Arrange
+    db = index._connect()
+
+    def plan(query: str, *args: str) -> str:
+        rows = db.execute(f"EXPLAIN QUERY PLAN {query}", args)
+        return " ".join(row["detail"] for row in rows)
+
+    # Act
+    read = plan(
+        "SELECT track_id FROM library_entry WHERE user_id = ? GROUP BY track_id",
+        "alice",
+    )
+    delete = plan(
+        "DELETE FROM library_entry WHERE user_id = ? AND kind = ? AND source_id = ?",
+        "alice",
+        PLAYLIST,
+        "p1",
+    )
+
+    # Assert
+    assert "INDEX library_entry_source (user_id=?)" in read
+    assert "INDEX library_entry_source (user_id=? AND kind=? AND source_id=?)" in delete
+
+
+def test_index_of_earlier_layout_is_rebuilt(tmp_path):
+    # Arrange
+    path = str(tmp_path / "library.sqlite")
+    with sqlite3.connect(path) as db:
+        db.executescript(
+            """
+            CREATE TABLE library_source (
+              user_id TEXT NOT NULL, kind TEXT NOT NULL, source_id TEXT NOT NULL,
+              name TEXT, snapshot_id TEXT, indexed_snapshot_id TEXT,
+              indexed_at REAL, PRIMARY KEY (user_id, kind, source_id)
+            );
+            CREATE TABLE library_sync (
+              user_id TEXT PRIMARY KEY, synced_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE library_track USING fts5(
+              name, artist, album, user_id UNINDEXED, kind UNINDEXED,
+              source_id UNINDEXED, track_id UNINDEXED
+            );
+            INSERT INTO library_source VALUES
+              ('alice', 'playlist', 'p1', 'One', 's1', 's1', 1.0);
+            INSERT INTO library_sync VALUES ('alice', 1.0);
+            """
+        )
+    db.close()
+
+    # Act
+    index = LibraryIndex(path)
+
+    # Assert
+    assert index.stale_sources("alice") == [(PLAYLIST, "p1")]
+    assert index.needs_sync("alice")
+    index.index_tracks("alice", PLAYLIST, "p1", [track("A", "X", "Y", "t1")])
+    assert [r["track_id"] for r in index.search("alice", "X")] == ["t1"]
+
+
+def test_stale_sources_follow_snapshots(index: LibraryIndex):
+    # Arrange
+    index.index_playlists("alice", [("p1", "One", "s1"), ("p2", "Two", "s1")])
+    index.index_tracks("alice", PLAYLIST, "p1", [])
+    index.index_tracks("alice", PLAYLIST, "p2", [])
+    assert index.stale_sources("alice") == []
+
+    # Act
+    index.index_playlists("alice", [("p1", "One", "s2")])
+
+    # Assert
+    assert index.stale_sources("alice") == [(PLAYLIST, "p1")]
+
+
+def mock_library(spotify: MagicMock) -> None:
+    """Sets up a library of two playlists with one track each."""
+    spotify.me.return_value = {"id": "alice"}
+    spotify.current_user_playlists.return_value = {
+        "items": [
+            {
+                "id": f"p{i}",
+                "name": f"Playlist {i}",
+                "description": "",
+                "owner": {"id": "alice"},
+                "tracks": {"total": 1},
+                "snapshot_id": "s1",
+            }
+            for i in range(2)
+        ],
+        "next": None,
+    }
+    spotify.current_user_saved_tracks.return_value = {
+        "items": [],
+        "total": 0,
+        "next": None,
+    }
+    spotify.playlist_items.return_value = {
+        "items": [
+            {
+                "track": {
+                    "id": "t1",
+                    "name": "Naima",
+                    "artists": [{"name": "John Coltrane"}],
+                    "album": {"name": "Giant Steps"},
+                }
+            }
+        ],
+        "next": None,
+    }
+
+
+def test_sync_only_fetches_changed_playlists(index: LibraryIndex):
+    # Arrange
+    with patch("spotipy.Spotify") as mock_spotify:
+        spotify = mock_spotify.return_value
+        mock_library(spotify)
+        client = SpotifyClient(auth_manager=MagicMock(), library_index=index)
+
+        # Act
+        results = client.search_library("coltrane")
+        client.sync_library_index()
+
+        # Assert
+        assert sorted(results[0]["in"]) == ["Playlist 0", "Playlist 1"]
+        # The second sync found no changed snapshots.
+        assert spotify.playlist_items.call_count == 2
+
+
+def test_concurrent_syncs_of_a_user_are_one(index: LibraryIndex):
+    # Arrange
+    waiting = threading.Event()
+    with (
+        patch("spotipy.Spotify") as mock_spotify,
+        patch("app.single_flight.logger.info", side_effect=lambda _: waiting.set()),
+    ):
+        spotify = mock_spotify.return_value
+        mock_library(spotify)
+        items = spotify.playlist_items.return_value
+
+        def playlist_items(*args, **kwargs) -> dict:
+            waiting.wait(timeout=5)
+            return items
+
+        spotify.playlist_items.side_effect = playlist_items
+        client = SpotifyClient(auth_manager=MagicMock(), library_index=index)
+
+        # Act
+        with ThreadPoolExecutor() as executor:
+            searches = [
+                executor.submit(client.search_library, "coltrane") for _ in range(2)
+            ]
+            results = [search.result() for search in searches]
+
+    # Assert
+    assert results[0] == results[1]
+    assert spotify.playlist_items.call_count == 2
+    # The probe of the liked songs, then the liked songs.
+    assert spotify.current_user_saved_tracks.call_count == 2
+    rows = index._connect().execute("SELECT count(*) FROM library_entry")
+    assert rows.fetchone()[0] == 2
@@ -0,0 +1,122 @@
+from unittest.mock import MagicMock, patch
+
+from app.library_summary import LibrarySummary
+from app.spotify_client import SpotifyClient
+from app.tracks import Track
+
+SO_WHAT = Track("t1", "So What", "Miles Davis", "Kind of Blue", 1959)
+BLUE_IN_GREEN = Track(
+    "t2",
+    "Blue in Green",
+    "Miles Davis, Bill Evans",
+    "Kind of Blue",
+    1959,
+    artists=("Miles Davis", "Bill Evans"),
+)
+NAIMA = Track("t3", "Naima", "John Coltrane", "Giant Steps", 1960)
+LOCAL = Track(None, "Demo", "Me", "Local Files")
+
+
+def test_summary_counts_distinct_tracks():
+    # Arrange
+    summary = LibrarySummary()
+
+    # Act
+    summary.add("Liked Songs", iter([SO_WHAT, NAIMA, LOCAL]))
+    summary.add("Jazz", iter([SO_WHAT, BLUE_IN_GREEN, BLUE_IN_GREEN]))
+    summary.add("Saxophone", iter([NAIMA, SO_WHAT]))
+    result = summary.result(top=2)
+
+    # Assert
+    assert result["distinct_tracks"] == 4
+    assert result["distinct_artists"] == 4
+    assert result["sources"] == [
+        {"name": "Liked Songs", "tracks": 3},
+        {"name": "Jazz", "tracks": 2},
+        {"name": "Saxophone", "tracks": 2},
+    ]
+    assert result["top_artists"] == {"Miles Davis": 2, "John Coltrane": 1}
+    assert len(result["top_albums"]) == 2
+    assert result["top_albums"][0] == {
+        "album": "Kind of Blue",
+        "artist": "Miles Davis",
+        "tracks": 2,
+    }
+    assert result["tracks_per_decade"] == {"1950s": 2, "1960s": 1, "unknown": 1}
+    assert result["largest_overlaps"] == [
+        {"sources": ["Liked Songs", "Saxophone"], "shared_tracks": 2},
+        {"sources": ["Liked Songs", "Jazz"], "shared_tracks": 1},
+    ]
+
+
+def test_summary_keeps_commas_in_artist_names():
+    # Arrange
+    summary = LibrarySummary()
+    september = Track(
+        "t4",
+        "September",
+        "Earth, Wind & Fire",
+        "The Best of Earth, Wind & Fire",
+        1978,
+        artists=("Earth, Wind & Fire",),
+    )
+
+    # Act
+    summary.add("Liked Songs", iter([september]))
+    result = summary.result()
+
+    # Assert
+    assert result["top_artists"] == {"Earth, Wind & Fire": 1}
+    assert result["top_albums"][0]["artist"] == "Earth, Wind & Fire"
+
+
+def test_spotify_client_summarizes_liked_songs_and_playlists():
+    # Arrange
+    def track(track_id: str, name: str) -> dict:
+        return {
+            "id": track_id,
+            "name": name,
+            "artists": [{"name": "Miles Davis"}],
+            "album": {"name": "Kind of Blue", "release_date": "1959-08-17"},
+        }
+
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.me.return_value = {"id": "test_user"}
+        mock_spotify_instance.current_user_saved_tracks.return_value = {
+            "items": [{"track": track("t1", "So What")}],
+            "next": None,
+        }
+        mock_spotify_instance.current_user_playlists.return_value = {
+            "items": [
+                {
+                    "id": "p1",
+                    "owner": {"id": "test_user"},
+                    "name": "Jazz",
+                    "description": "",
+                    "tracks": {"total": 2},
+                    "snapshot_id": "s1",
+                }
+            ],
+            "next": None,
+        }
+        mock_spotify_instance.playlist_items.return_value = {
+            "items": [
+                {"track": track("t1", "So What")},
+                {"track": track("t2", "Freddie Freeloader")},
+            ],
+            "next": None,
+        }
+        client = SpotifyClient(auth_manager=MagicMock())
+
+        # Act
+        result = client.summarize_library(top=5)
+
+    # Assert
+    assert result["distinct_tracks"] == 2
+    assert result["top_artists"] == {"Miles Davis": 2}
+    assert result["tracks_per_decade"] == {"1950s": 2}
+    assert result["largest_overlaps"] == [
+        {"sources": ["Liked Songs", "Jazz"], "shared_tracks": 1}
+    ]
+    mock_spotify_instance.playlist_items.assert_called_once_with("p1")
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Flask
+
+from app import tracing
+from app.clients import get_conversation_store, get_trace_store
+from app.conversation_store import SQLiteConversationStore
+from app.maintenance import collect_garbage, enable_incremental_vacuum, vacuum
+
+DAY = 24 * 60 * 60
+
+
+def test_collect_garbage(app: Flask, tmp_path):
+    # Arrange
+    cache_dir = tmp_path / "spotify_cache"
+    cache_dir.mkdir()
+    (cache_dir / "stale").write_text("{}" * 100)
+    (cache_dir / "fresh").write_text("{}")
+    old = time.time() - 100 * DAY
+    os.utime(cache_dir / "stale", (old, old))
+    app.config.update(SPOTIFY_CACHE_DIR=str(cache_dir), SPOTIFY_CACHE_MAX_IDLE_DAYS=90)
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    (profiles / "old.prof").write_bytes(b"x" * 100)
+    (profiles / "new.prof").write_bytes(b"x")
+    os.utime(profiles / "old.prof", (old, old))
+    app.config.update(PROFILES=str(profiles), PROFILE_MAX_AGE_DAYS=7)
+    with app.app_context():
+        store = get_conversation_store()
+        store.create("stale", [{"role": "user", "content": "hi" * 1000}])
+        store.create("fresh", [])
+        with store._connect() as db:  # type: ignore[attr-defined]
+            db.execute(
+                "UPDATE conversation SET updated_at = ? WHERE id = 'stale'", (old,)
+            )
+        traces = get_trace_store()
+        assert traces is not None
+        with tracing.trace(traces, "old") as old_trace, tracing.span("child"):
+            pass
+        with tracing.trace(traces, "new"):
+            pass
+        with traces._connect() as db:
+            db.execute(
+                "UPDATE span SET start = ? WHERE trace_id = ?",
+                (old, old_trace.trace_id),
+            )
+
+    # Act
+    report = collect_garbage(app)
+
+    # Assert
+    assert report.conversations == 1
+    assert report.token_caches == 1
+    assert report.traces == 1
+    assert report.profiles == 1
+    assert report.bytes_reclaimed >= 300
+    assert sorted(os.listdir(cache_dir)) == ["fresh"]
+    assert sorted(os.listdir(profiles)) == ["new.prof"]
+    with app.app_context():
+        assert store.get("stale") is None
+        assert store.get("fresh") == []
+        assert traces.get(old_trace.trace_id) == []
+        assert [trace["name"] for trace in traces.recent()] == ["new"]
+
+
+def test_vacuum_shrinks_database(tmp_path):
+    # Arrange
+    path = str(tmp_path / "db.sqlite")
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE t (data BLOB)")
+        db.executemany("INSERT INTO t VALUES (?)", [(b"x" * 4096,)] * 100)
+    with sqlite3.connect(path) as db:
+        db.execute("DELETE FROM t")
+
+    # Act
+    before_migration = vacuum(path)
+    converted = enable_incremental_vacuum(path)
+    with sqlite3.connect(path) as db:
+        db.executemany("INSERT INTO t VALUES (?)", [(b"x" * 4096,)] * 100)
+    with sqlite3.connect(path) as db:
+        db.execute("DELETE FROM t")
+    after_migration = vacuum(path)
+
+    # Assert
+    # Converting takes a full vacuum, which is left to `flask migrate-db`.
+    assert before_migration == 0
+    assert converted
+    assert not enable_incremental_vacuum(path)
+    assert after_migration > 300_000
+
+
+def test_new_store_uses_incremental_vacuum(tmp_path):
+    # Arrange
+    path = str(tmp_path / "db.sqlite")
+    store = SQLiteConversationStore(path)
+
+    # Act
+    reclaimed_empty = vacuum(path)
+    for i in range(100):
+        store.create(f"c{i}", [{"role": "user", "content": "x" * 4096}])
+    for i in range(100):
+        store.delete(f"c{i}")
+    reclaimed = vacuum(path)
+
+    # Assert
+    with sqlite3.connect(path) as db:
+        assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    # The truncated WAL isn't counted.
+    assert reclaimed_empty == 0
+    assert reclaimed > 300_000
+
+
+def test_gc_command(app: Flask, tmp_path):
+    # Arrange
+    app.config["SPOTIFY_CACHE_DIR"] = str(tmp_path)
+
+    # Act
+    result = app.test_cli_runner().invoke(args=["gc"])
+
+    # Assert
+    assert result.exit_code == 0
+    assert "Deleted" in result.output
+
+
+def test_migrate_db_command(app: Flask):
+    # Act
+    result = app.test_cli_runner().invoke(args=["migrate-db"])
+
+    # Assert
+    assert result.exit_code == 0
+    assert "up to date" in result.output
+    with sqlite3.connect(app.config["DATABASE"]) as db:
+        assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_gc_thread_is_off_by_default(app: Flask):
+    assert app.config["GC_INTERVAL"] == 0
+    assert "gc" not in {thread.name for thread in threading.enumerate()}
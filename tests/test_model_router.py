@@ -0,0 +1,181 @@
+from unittest.mock import MagicMock
+
+import httpx
+import openai
+import pytest
+from openai import NOT_GIVEN
+from openai.types.responses import (
+    Response,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+)
+
+from app.chat_client import ChatClient, ChatResponse, TurnBudget, openai_dependency
+from app.model_router import FINAL_STAGE, TOOL_STAGE, ModelRoute, ModelRouter
+
+CONFIG = {
+    "OPENAI_TOOL_MODEL": "fast-model",
+    "OPENAI_FINAL_MODEL": "big-model",
+    "OPENAI_FALLBACK_MODEL": "small-model",
+    "OPENAI_TOOL_LATENCY_BUDGET": 10.0,
+    "OPENAI_FINAL_LATENCY_BUDGET": 0,
+}
+
+
+def text_response(text: str) -> MagicMock:
+    response = MagicMock(spec=Response)
+    response.output = [
+        ResponseOutputMessage(
+            id="msg",
+            content=[ResponseOutputText(text=text, type="output_text", annotations=[])],
+            type="message",
+            role="assistant",
+            status="completed",
+        )
+    ]
+    return response
+
+
+def tool_call_response() -> MagicMock:
+    response = MagicMock(spec=Response)
+    response.output = [
+        ResponseFunctionToolCall(
+            id="fc",
+            call_id="call_1",
+            name="get_my_playlists",
+            arguments="{}",
+            type="function_call",
+        )
+    ]
+    return response
+
+
+@pytest.fixture
+def chat_client(monkeypatch) -> ChatClient:
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+    client = ChatClient(router=ModelRouter.from_config(CONFIG))
+    client.client = MagicMock()
+    return client
+
+
+def test_from_config():
+    router = ModelRouter.from_config(CONFIG)
+
+    assert router.route(TOOL_STAGE) == ModelRoute("fast-model", 10.0, "small-model")
+    assert router.route(FINAL_STAGE) == ModelRoute("big-model", None, "small-model")
+
+
+def test_latency_budget_needs_a_fallback_model():
+    router = ModelRouter.from_config({**CONFIG, "OPENAI_FALLBACK_MODEL": ""})
+
+    assert router.route(TOOL_STAGE) == ModelRoute("fast-model", None, None)
+
+
+def test_tool_rounds_use_tool_model(chat_client: ChatClient):
+    # Arrange
+    create = chat_client.client.responses.create
+    create.side_effect = [
+        tool_call_response(),
+        text_response("Draft of the tool model."),
+        text_response("Here are your playlists."),
+    ]
+
+    # Act
+    results = list(
+        chat_client.get_chat_completion(
+            [{"role": "user", "content": "Show my playlists"}], MagicMock()
+        )
+    )
+
+    # Assert
+    # The final model answers the user; the tool model picks the tools.
+    models = [call.kwargs["model"] for call in create.call_args_list]
+    assert models == ["big-model", "fast-model", "big-model"]
+    assert create.call_args_list[-1].kwargs["tool_choice"] == "none"
+    assert isinstance(results[-1], ChatResponse)
+    assert results[-1].response == "Here are your playlists."
+
+
+def test_answer_is_not_written_again_by_the_same_model(monkeypatch):
+    # Arrange
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+    config = {**CONFIG, "OPENAI_FINAL_MODEL": "fast-model"}
+    chat_client = ChatClient(router=ModelRouter.from_config(config))
+    chat_client.client = MagicMock()
+    create = chat_client.client.responses.create
+    create.side_effect = [
+        tool_call_response(),
+        text_response("Here are your playlists."),
+    ]
+
+    # Act
+    results = list(
+        chat_client.get_chat_completion(
+            [{"role": "user", "content": "Show my playlists"}], MagicMock()
+        )
+    )
+
+    # Assert
+    assert create.call_count == 2
+    assert results[-1].response == "Here are your playlists."
+
+
+def test_final_model_answers_when_budget_is_used_up(monkeypatch):
+    # Arrange
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+    chat_client = ChatClient(
+        router=ModelRouter.from_config(CONFIG), budget=TurnBudget(max_tool_rounds=1)
+    )
+    chat_client.client = MagicMock()
+    create = chat_client.client.responses.create
+    create.side_effect = [tool_call_response(), text_response("What I found.")]
+
+    # Act
+    list(
+        chat_client.get_chat_completion(
+            [{"role": "user", "content": "Show my playlists"}], MagicMock()
+        )
+    )
+
+    # Assert
+    last = create.call_args_list[-1].kwargs
+    assert (last["model"], last["tool_choice"]) == ("big-model", "none")
+
+
+def test_falls_back_when_budget_exceeded(chat_client: ChatClient):
+    # Arrange
+    create = chat_client.client.responses.create
+    timeout = openai.APITimeoutError(request=httpx.Request("POST", "https://x"))
+    create.side_effect = [timeout, text_response("fallback answer")]
+    breaker = openai_dependency.breaker
+
+    # Act
+    response = chat_client.create_response(TOOL_STAGE, [])
+
+    # Assert
+    assert response.output[0].content[0].text == "fallback answer"
+    assert create.call_args_list[0].kwargs["timeout"] == 10.0
+    # The slow model was not retried, and the API not counted as failing.
+    assert [call.kwargs["model"] for call in create.call_args_list] == [
+        "fast-model",
+        "small-model",
+    ]
+    assert breaker.state == breaker.CLOSED
+
+
+def test_no_timeout_without_fallback_model(monkeypatch):
+    # Arrange
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+    chat_client = ChatClient(
+        router=ModelRouter.from_config({**CONFIG, "OPENAI_FALLBACK_MODEL": ""})
+    )
+    chat_client.client = MagicMock()
+    create = chat_client.client.responses.create
+    create.return_value = text_response("slow answer")
+
+    # Act
+    chat_client.create_response(TOOL_STAGE, [])
+
+    # Assert
+    assert create.call_args.kwargs["timeout"] is NOT_GIVEN
@@ -0,0 +1,224 @@
+import random
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.playlist_edits import PlaylistEdits, PlaylistSnapshots, plan_edits
+from app.spotify_client import SpotifyClient
+
+
+def apply(current: list[str | None], edits: PlaylistEdits) -> list[str | None]:
+    """Applies edits the way the Spotify API does."""
+    if edits.replacement is not None:
+        return [uri for batch in edits.replacement for uri in batch]
+    tracks = list(current)
+    for batch in edits.removals:
+        tracks = [uri for uri in tracks if uri not in batch]
+    for start, insert_before, length in edits.moves:
+        block = tracks[start : start + length]
+        tracks[insert_before:insert_before] = block
+        if insert_before < start:
+            start += length
+        del tracks[start : start + length]
+    for position, batch in edits.additions:
+        tracks[position:position] = batch
+    return tracks
+
+
+def uris(count: int, prefix: str = "t") -> list[str]:
+    return [f"spotify:track:{prefix}{i}" for i in range(count)]
+
+
+def test_unchanged_playlist_needs_no_requests():
+    # Act
+    edits = plan_edits(uris(100), uris(100))
+
+    # Assert
+    assert edits.requests == 0
+
+
+def test_swapping_the_last_songs():
+    # Arrange
+    current = uris(100)
+    desired = current[:95] + uris(5, prefix="new")
+
+    # Act
+    edits = plan_edits(current, desired)
+
+    # Assert
+    assert edits.requests == 2
+    assert (edits.added, edits.removed) == (5, 5)
+    assert edits.additions == [(95, desired[95:])]
+    assert apply(current, edits) == desired
+
+
+def test_moving_a_song_moves_only_that_song():
+    # Arrange
+    current = uris(100)
+    desired = [current[-1]] + current[:-1]
+
+    # Act
+    edits = plan_edits(current, desired)
+
+    # Assert
+    assert edits.moves == [(99, 0, 1)]
+    assert apply(current, edits) == desired
+
+
+def test_adjacent_songs_move_together():
+    # Arrange
+    current = uris(10)
+    desired = current[5:8] + current[:5] + current[8:]
+
+    # Act
+    edits = plan_edits(current, desired)
+
+    # Assert
+    assert len(edits.moves) == 1
+    assert apply(current, edits) == desired
+
+
+def test_large_additions_are_batched():
+    # Arrange
+    current = uris(10)
+    desired = current + uris(250, prefix="new")
+
+    # Act
+    edits = plan_edits(current, desired)
+
+    # Assert
+    assert [len(batch) for _, batch in edits.additions] == [100, 100, 50]
+    assert apply(current, edits) == desired
+
+
+@pytest.mark.parametrize(
+    "current",
+    [
+        ["spotify:track:a", "spotify:track:a", "spotify:track:b"],
+        ["spotify:track:a", None],
+    ],
+)
+def test_duplicates_and_unavailable_tracks_are_replaced(current):
+    # Act
+    edits = plan_edits(current, ["spotify:track:b", "spotify:track:c"])
+
+    # Assert
+    assert edits.replacement == [["spotify:track:b", "spotify:track:c"]]
+    assert edits.requests == 1
+
+
+def test_shuffle_is_replaced():
+    # Arrange
+    current = uris(100)
+    desired = random.Random(1).sample(current, len(current))
+
+    # Act
+    edits = plan_edits(current, desired)
+
+    # Assert
+    assert edits.replacement is not None
+    assert apply(current, edits) == desired
+
+
+def test_random_edits_give_the_desired_tracks():
+    rng = random.Random(0)
+    for _ in range(500):
+        # Arrange
+        current = rng.sample(uris(30), rng.randint(0, 30))
+        desired = current[:]
+        for _ in range(rng.randint(0, 4)):
+            if desired and rng.random() < 0.5:
+                desired.pop(rng.randrange(len(desired)))
+            if desired:
+                desired.insert(rng.randrange(len(desired)), desired.pop())
+        desired += rng.sample(uris(5, prefix="new"), rng.randint(0, 5))
+
+        # Act
+        edits = plan_edits(current, desired)
+
+        # Assert
+        assert apply(current, edits) == desired
+
+
+def test_snapshots_evict_least_recently_used():
+    # Arrange
+    snapshots = PlaylistSnapshots(max_size=1)
+    snapshots.put("p1", "s1", ["spotify:track:a"])
+
+    # Act
+    snapshots.put("p2", "s2", ["spotify:track:b"])
+
+    # Assert
+    assert snapshots.get("p1") is None
+    assert snapshots.get("p2") == ("s2", ["spotify:track:b"])
+
+
+def test_spotify_client_updates_playlist_from_cached_snapshot():
+    # Arrange
+    current = uris(100)
+    snapshots = PlaylistSnapshots()
+    snapshots.put("p1", "s1", current)
+    with (
+        patch("spotipy.Spotify") as mock_spotify,
+        patch("app.spotify_client.playlist_snapshots", snapshots),
+    ):
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.playlist.return_value = {"snapshot_id": "s1"}
+        mock_spotify_instance.playlist_remove_all_occurrences_of_items.return_value = {
+            "snapshot_id": "s2"
+        }
+        mock_spotify_instance.playlist_add_items.return_value = {"snapshot_id": "s3"}
+        client = SpotifyClient(auth_manager=MagicMock())
+
+        # Act
+        result = client.update_playlist("p1", current[:95] + ["new1", "new2"])
+
+    # Assert
+    assert result == {
+        "playlist_id": "p1",
+        "tracks": 97,
+        "added": 2,
+        "removed": 5,
+        "requests": 2,
+    }
+    mock_spotify_instance.playlist.assert_called_once_with("p1", fields="snapshot_id")
+    mock_spotify_instance.playlist_remove_all_occurrences_of_items.assert_called_once_with(
+        "p1", current[95:], snapshot_id="s1"
+    )
+    mock_spotify_instance.playlist_add_items.assert_called_once_with(
+        "p1", ["spotify:track:new1", "spotify:track:new2"], position=95
+    )
+    assert snapshots.get("p1") == (
+        "s3",
+        current[:95] + ["spotify:track:new1", "spotify:track:new2"],
+    )
+
+
+def test_spotify_client_fetches_tracks_of_changed_playlist():
+    # Arrange
+    snapshots = PlaylistSnapshots()
+    snapshots.put("p1", "old", ["spotify:track:a"])
+    with (
+        patch("spotipy.Spotify") as mock_spotify,
+        patch("app.spotify_client.playlist_snapshots", snapshots),
+    ):
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.playlist.side_effect = [
+            {"snapshot_id": "new"},
+            {
+                "snapshot_id": "new",
+                "tracks": {
+                    "items": [{"track": {"uri": "spotify:track:b"}}],
+                    "next": None,
+                },
+            },
+        ]
+        client = SpotifyClient(auth_manager=MagicMock())
+
+        # Act
+        result = client.update_playlist("p1", ["spotify:track:b"])
+
+    # Assert
+    assert result["requests"] == 0
+    assert mock_spotify_instance.playlist.call_count == 2
+    mock_spotify_instance.playlist_add_items.assert_not_called()
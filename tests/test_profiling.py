@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+from flask import Flask
+
+from app.chat_client import ChatResponse
+
+
+def test_chat_turn_is_profiled_on_request(client, app: Flask, tmp_path):
+    # Arrange
+    app.config["PROFILES"] = str(tmp_path / "profiles")
+    with patch("app.routes.get_chat_client") as mock_get_chat_client:
+        mock_get_chat_client.return_value.get_chat_completion.return_value = [
+            ChatResponse(conversation_history=[], response="Test response")
+        ]
+        client.get("/")
+        with client.session_transaction() as session:
+            conversation_id = session["conversation_id"]
+
+        # Act
+        client.get("/chat?query=hello", headers={"X-Profile": "1"}).get_data()
+        listing = client.get("/debug/profiles").get_data(as_text=True)
+
+    # Assert
+    [name] = [p.name for p in (tmp_path / "profiles").iterdir()]
+    assert name.endswith(f"_chat_{conversation_id}.prof")
+    assert name in listing
+    text = client.get(f"/debug/profiles/{name}?format=text").get_data(as_text=True)
+    assert "update_conversation" in text
+    download = client.get(f"/debug/profiles/{name}")
+    assert download.status_code == 200
+    assert download.headers["Content-Disposition"].startswith("attachment")
+
+
+def test_requests_are_not_profiled_by_default(client, app: Flask, tmp_path):
+    # Arrange
+    app.config["PROFILES"] = str(tmp_path / "profiles")
+
+    # Act
+    client.get("/")
+
+    # Assert
+    assert not (tmp_path / "profiles").exists()
+
+
+def test_profile_header_requires_debug_access(client, app: Flask, tmp_path):
+    # Arrange
+    app.config.update(
+        TESTING=False, DEBUG_ROUTES_TOKEN="secret", PROFILES=str(tmp_path / "profiles")
+    )
+
+    # Act
+    client.get("/", headers={"X-Profile": "1"})
+    client.get("/", headers={"X-Profile": "1", "X-Debug-Token": "secret"})
+
+    # Assert
+    [name] = [p.name for p in (tmp_path / "profiles").iterdir()]
+    assert "_index_" in name
+    assert client.get("/debug/profiles/missing.prof?format=text").status_code == 404
+
+
+def test_sample_rate_profiles_without_header(client, app: Flask, tmp_path):
+    # Arrange
+    app.config.update(PROFILE_SAMPLE_RATE=1.0, PROFILES=str(tmp_path / "profiles"))
+
+    # Act
+    client.get("/")
+
+    # Assert
+    assert len(list((tmp_path / "profiles").iterdir())) == 1
@@ -0,0 +1,194 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Dependency,
+    RetryPolicy,
+    error_output,
+)
+
+
+class TransientError(Exception):
+    pass
+
+
+def make_dependency(clock=lambda: 0.0, **breaker_args) -> Dependency:
+    return Dependency(
+        "test",
+        is_retryable=lambda e: isinstance(e, TransientError),
+        policy=RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=1.0),
+        breaker=CircuitBreaker("test", clock=clock, **breaker_args),
+        sleep=lambda _: None,
+    )
+
+
+def test_retries_transient_errors_until_success():
+    # Arrange
+    dependency = make_dependency()
+    fn = MagicMock(side_effect=[TransientError(), TransientError(), "ok"])
+
+    # Act
+    result = dependency.call(fn, "arg")
+
+    # Assert
+    assert result == "ok"
+    assert fn.call_count == 3
+    assert dependency.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_max_attempts():
+    # Arrange
+    dependency = make_dependency()
+    fn = MagicMock(side_effect=TransientError())
+
+    # Act & Assert
+    with pytest.raises(TransientError):
+        dependency.call(fn)
+    assert fn.call_count == 3
+
+
+def test_does_not_retry_other_errors():
+    # Arrange
+    dependency = make_dependency()
+    fn = MagicMock(side_effect=ValueError("bad request"))
+
+    # Act & Assert
+    with pytest.raises(ValueError):
+        dependency.call(fn)
+    fn.assert_called_once()
+
+
+def test_uses_server_retry_after():
+    # Arrange
+    sleeps = []
+    dependency = Dependency(
+        "test",
+        is_retryable=lambda e: True,
+        retry_after=lambda e: 0.25,
+        sleep=sleeps.append,
+    )
+
+    # Act
+    dependency.call(MagicMock(side_effect=[TransientError(), "ok"]))
+
+    # Assert
+    assert sleeps == [0.25]
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(4.0, 2 ** (attempt - 1))
+
+
+def test_circuit_opens_and_fails_fast():
+    # Arrange
+    now = [0.0]
+    dependency = make_dependency(
+        clock=lambda: now[0], failure_threshold=3, reset_timeout=10.0
+    )
+    failing = MagicMock(side_effect=TransientError())
+    with pytest.raises(TransientError):
+        dependency.call(failing)
+    healthy = MagicMock(return_value="ok")
+
+    # Act & Assert
+    assert dependency.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        dependency.call(healthy)
+    healthy.assert_not_called()
+
+    # After the reset timeout a probe call goes through and closes the circuit.
+    now[0] = 11.0
+    assert dependency.call(healthy) == "ok"
+    assert dependency.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_circuit():
+    # Arrange
+    now = [0.0]
+    breaker = CircuitBreaker(
+        "test", failure_threshold=1, reset_timeout=10.0, clock=lambda: now[0]
+    )
+    breaker.record_failure()
+    now[0] = 11.0
+
+    # Act
+    breaker.before_call()
+    breaker.record_failure()
+
+    # Assert
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_calls_during_probe_are_rejected():
+    # Arrange
+    now = [0.0]
+    breaker = CircuitBreaker(
+        "test", failure_threshold=1, reset_timeout=10.0, clock=lambda: now[0]
+    )
+    breaker.record_failure()
+    now[0] = 11.0
+
+    # Act
+    probe = breaker.before_call()
+
+    # Assert
+    assert probe
+    with pytest.raises(CircuitOpenError, match="retry shortly"):
+        breaker.before_call()
+
+
+def test_interrupted_probe_lets_next_call_probe():
+    # Arrange
+    now = [0.0]
+    dependency = make_dependency(
+        clock=lambda: now[0], failure_threshold=1, reset_timeout=10.0
+    )
+    dependency.breaker.record_failure()
+    now[0] = 11.0
+
+    # Act
+    with pytest.raises(KeyboardInterrupt):
+        dependency.call(MagicMock(side_effect=KeyboardInterrupt()))
+
+    # Assert
+    assert dependency.breaker.state == CircuitBreaker.OPEN
+    assert dependency.call(MagicMock(return_value="ok")) == "ok"
+
+
+class UnsentError(TransientError):
+    pass
+
+
+def test_writes_are_retried_only_if_unsent():
+    # Arrange
+    dependency = Dependency(
+        "test",
+        is_retryable=lambda e: isinstance(e, TransientError),
+        is_unsent=lambda e: isinstance(e, UnsentError),
+        sleep=lambda _: None,
+    )
+    unsent = MagicMock(side_effect=[UnsentError(), "ok"])
+    timed_out = MagicMock(side_effect=[TransientError(), "ok"])
+
+    # Act
+    result = dependency.call_write(unsent)
+    with pytest.raises(TransientError):
+        dependency.call_write(timed_out)
+
+    # Assert
+    assert result == "ok"
+    assert unsent.call_count == 2
+    timed_out.assert_called_once()
+
+
+def test_error_output():
+    assert error_output(ValueError("boom")) == {
+        "error": {"type": "ValueError", "message": "boom"}
+    }
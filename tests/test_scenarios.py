@@ -0,0 +1,94 @@
+"""Replays recorded chat turns and checks how much traffic they cause.
+
+The cassettes in `tests/cassettes` hold the OpenAI and Spotify responses of a
+turn. A change that adds model round trips or Spotify requests fails here, as
+its requests have no recorded response.
+
+The cassettes are synthetic: they were written by hand after the shape of the
+API responses, not recorded, so they pin the requests made but not what the
+real services answer. Re-record them from real sessions as described in
+`tests/cassette.py` when the services are reachable.
+"""
+
+import os
+from collections.abc import Iterator
+from unittest.mock import patch
+
+import openai
+import pytest
+from cassette import Cassette
+
+from app import tools
+from app.chat_client import ChatClient, ChatResponse
+from app.spotify_client import SpotifyClient
+
+# The Spotify user of the recorded sessions.
+USER_ID = "cassette-user"
+
+OPENAI = "api.openai.com"
+SPOTIFY = "api.spotify.com"
+
+# The instructions and tool schemas are sent with every request, so this grows
+# by a few hundred bytes with each tool; a jump beyond that is a regression.
+MAX_OPENAI_BYTES = 13_000
+
+
+class StaticToken:
+    """Spotify auth manager with a fixed access token."""
+
+    def get_access_token(self, as_dict: bool = True) -> str:
+        return os.getenv("SPOTIFY_ACCESS_TOKEN", "replayed-token")
+
+
+@pytest.fixture
+def cassette(request) -> Iterator[Cassette]:
+    """Replays (or records) the cassette named after the test."""
+    name = request.node.name.removeprefix("test_")
+    cassette = Cassette(name, record=os.getenv("CASSETTE_MODE") == "record")
+    for schema in tools.registry.schemas:
+        tools.registry.invalidate(schema["name"], scope=USER_ID)
+    http_client = openai.DefaultHttpxClient(transport=cassette.httpx_transport())
+    with (
+        patch("app.chat_client.get_openai_http_client", return_value=http_client),
+        patch(
+            "app.spotify_client.get_spotify_session",
+            return_value=cassette.requests_session(),
+        ),
+        patch.dict(os.environ, {"OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "x")}),
+    ):
+        yield cassette
+    cassette.save()
+    assert cassette.unused() == 0, "Recorded requests were not made"
+
+
+def run_turn(query: str) -> list:
+    chat_client = ChatClient()
+    spotify_client = SpotifyClient(auth_manager=StaticToken())
+    history = [{"role": "user", "content": query}]
+    return list(chat_client.get_chat_completion(history, spotify_client))
+
+
+def test_list_playlists(cassette: Cassette):
+    # Act
+    responses = run_turn("Yes, please list my playlists.")
+
+    # Assert
+    assert isinstance(responses[-1], ChatResponse)
+    assert "Road Trip" in responses[-1].response
+    # One round trip to pick the tool, one for the answer.
+    assert cassette.requests_to(OPENAI, "/v1/responses") == 2
+    assert cassette.requests_to(SPOTIFY) == 2
+    assert cassette.bytes_sent[OPENAI] < MAX_OPENAI_BYTES
+
+
+def test_liked_songs_over_two_pages(cassette: Cassette):
+    # Act
+    responses = run_turn("Yes, go ahead and read my liked songs.")
+
+    # Assert
+    assert "Naima" in responses[-1].response
+    assert cassette.requests_to(OPENAI, "/v1/responses") == 2
+    # The user, then both pages of liked songs.
+    assert cassette.requests_to(SPOTIFY, "/v1/me/tracks") == 2
+    assert cassette.requests_to(SPOTIFY) == 3
+    assert cassette.bytes_sent[OPENAI] < MAX_OPENAI_BYTES
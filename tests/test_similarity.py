@@ -0,0 +1,147 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from app.library_index import PLAYLIST, LibraryIndex
+from app.similarity import SimilarityIndex, _features, vectorize
+from app.spotify_client import SpotifyClient
+from app.tracks import Track
+
+LIBRARY = [
+    Track("t1", "Naima", "John Coltrane", "Giant Steps", 1960),
+    Track("t2", "Giant Steps", "John Coltrane", "Giant Steps", 1960),
+    Track("t3", "So What", "Miles Davis", "Kind of Blue", 1959),
+    Track(
+        "t4",
+        "Blue in Green",
+        "Miles Davis, Bill Evans",
+        "Kind of Blue",
+        1959,
+        ("Miles Davis", "Bill Evans"),
+    ),
+    Track("t5", "Smells Like Teen Spirit", "Nirvana", "Nevermind", 1991),
+]
+
+
+@pytest.fixture
+def index(tmp_path) -> SimilarityIndex:
+    index = SimilarityIndex(str(tmp_path / "similarity"))
+    index.add("alice", LIBRARY)
+    return index
+
+
+def test_vectors_are_normalized():
+    # Act
+    vectors = vectorize(LIBRARY)
+
+    # Assert
+    assert vectors.shape == (5, 256)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+
+
+def test_find_similar_ranks_shared_artist_and_era_first(index: SimilarityIndex):
+    # Arrange
+    seeds = [
+        Track("s1", "Naima - Remastered", "John Coltrane", "Giant Steps", 1960),
+        Track("s2", "Freddie Freeloader", "Miles Davis", "Kind of Blue", 1959),
+    ]
+
+    # Act
+    coltrane, davis = index.find_similar("alice", seeds, limit=2)
+
+    # Assert
+    # The remastered version's original is left out.
+    assert [track.track_id for track, _ in coltrane] == ["t2", "t3"]
+    assert {track.track_id for track, _ in davis} == {"t3", "t4"}
+    assert coltrane[0][1] > coltrane[1][1]
+
+
+def test_index_is_persisted_and_synced(index: SimilarityIndex):
+    # Act
+    reopened = SimilarityIndex(index.directory)
+    reopened.sync(
+        "alice", LIBRARY[2:] + [Track("t6", "Lithium", "Nirvana", "Nevermind")]
+    )
+
+    # Assert
+    assert reopened.count("alice") == 4
+    assert reopened.count("bob") == 0
+    (similar,) = reopened.find_similar("alice", [LIBRARY[4]], limit=1)
+    assert similar[0][0].track_id == "t6"
+
+
+def test_artists_with_commas_are_kept_across_reloads(index: SimilarityIndex):
+    # Arrange
+    september = Track(
+        "t7",
+        "September",
+        "Earth, Wind & Fire",
+        "The Best of",
+        1978,
+        ("Earth, Wind & Fire",),
+    )
+    index.add("alice", [september])
+
+    # Act
+    reopened = SimilarityIndex(index.directory)
+    (track,) = [t for t in reopened._user("alice").tracks if t.track_id == "t7"]
+
+    # Assert
+    assert track.artists == ("Earth, Wind & Fire",)
+    assert _features(track)[:2] == [
+        ("artist:earth wind fire", 3.0),
+        ("album:the best of:earth wind fire", 2.0),
+    ]
+
+
+def test_least_recently_used_users_are_closed(tmp_path):
+    # Arrange
+    index = SimilarityIndex(str(tmp_path / "similarity"), max_users=1)
+    index.add("alice", LIBRARY)
+    alice = index._users["alice"]
+
+    # Act
+    index.add("bob", LIBRARY[:1])
+
+    # Assert
+    assert list(index._users) == ["bob"]
+    assert alice.matrix is None
+    # Reopened from its files.
+    assert index.count("alice") == len(LIBRARY)
+    assert len(index.find_similar("alice", LIBRARY[:1], limit=1)[0]) == 1
+
+
+def test_find_similar_in_library(tmp_path):
+    # Arrange
+    library_index = LibraryIndex(str(tmp_path / "library.sqlite"))
+    library_index.index_tracks("alice", PLAYLIST, "p1", LIBRARY)
+    library_index.mark_synced("alice")
+    empty = SimilarityIndex(str(tmp_path / "empty"))
+    with patch("spotipy.Spotify") as mock_spotify:
+        spotify = mock_spotify.return_value
+        spotify.me.return_value = {"id": "alice"}
+        spotify.search.return_value = {
+            "tracks": {
+                "items": [
+                    {
+                        "id": "s1",
+                        "name": "Moment's Notice",
+                        "artists": [{"name": "John Coltrane"}],
+                        "album": {"name": "Blue Train"},
+                    }
+                ]
+            }
+        }
+        client = SpotifyClient(
+            auth_manager=MagicMock(),
+            library_index=library_index,
+            similarity_index=empty,
+        )
+
+        # Act
+        similar = client.find_similar_in_library("Moment's Notice", "Coltrane", 2)
+
+    # Assert
+    assert {track.track_id for track, _ in similar} == {"t1", "t2"}
+    assert empty.count("alice") == 5
@@ -0,0 +1,95 @@
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from app.single_flight import SingleFlight
+
+
+@pytest.fixture
+def waiting() -> Iterator[threading.Event]:
+    """An event that is set once a caller waits for a call in flight."""
+    event = threading.Event()
+    with patch("app.single_flight.logger.info", side_effect=lambda _: event.set()):
+        yield event
+
+
+def test_concurrent_calls_share_one_result(waiting: threading.Event):
+    # Arrange
+    flights = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def fetch() -> list[str]:
+        calls.append(1)
+        started.set()
+        waiting.wait(timeout=5)
+        return ["result"]
+
+    # Act
+    with ThreadPoolExecutor() as executor:
+        first = executor.submit(flights.do, "key", fetch)
+        started.wait(timeout=5)
+        second = executor.submit(flights.do, "key", fetch)
+        other = flights.do("other", lambda: ["other"])
+
+    # Assert
+    assert first.result() is second.result()
+    assert other == ["other"]
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+
+class Cancelled(Exception):
+    pass
+
+
+def test_waiting_caller_shares_failure(waiting: threading.Event):
+    # Arrange
+    flights = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def failing_fetch() -> str:
+        calls.append(1)
+        started.set()
+        waiting.wait(timeout=5)
+        raise RuntimeError("Spotify is down")
+
+    # Act
+    with ThreadPoolExecutor() as executor:
+        first = executor.submit(flights.do, "key", failing_fetch)
+        started.wait(timeout=5)
+        second = executor.submit(flights.do, "key", failing_fetch)
+
+    # Assert
+    for future in (first, second):
+        with pytest.raises(RuntimeError, match="Spotify is down"):
+            future.result()
+    assert len(calls) == 1
+
+
+def test_waiting_caller_retries_after_caller_specific_failure(
+    waiting: threading.Event,
+):
+    # Arrange
+    flights = SingleFlight(retry_on=(Cancelled,))
+    started = threading.Event()
+
+    def failing_fetch() -> str:
+        started.set()
+        waiting.wait(timeout=5)
+        raise Cancelled()
+
+    # Act
+    with ThreadPoolExecutor() as executor:
+        first = executor.submit(flights.do, "key", failing_fetch)
+        started.wait(timeout=5)
+        second = executor.submit(flights.do, "key", lambda: "retried")
+
+    # Assert
+    with pytest.raises(Cancelled):
+        first.result()
+    assert second.result() == "retried"
@@ -1,7 +1,13 @@
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
 
-from app.spotify_client import SpotifyClient
+import pytest
+import requests
+import spotipy
+
+from app.spotify_client import SpotifyClient, spotify_dependency
 
 
 def test_get_user_playlists():
@@ -58,9 +64,9 @@ def test_get_liked_songs():
 
         # Assert
         assert len(liked_songs) == 1
-        assert liked_songs[0]["name"] == "Test Song"
-        assert liked_songs[0]["artist"] == "Test Artist"
-        assert liked_songs[0]["album"] == "Test Album"
+        assert liked_songs[0].name == "Test Song"
+        assert liked_songs[0].artist == "Test Artist"
+        assert liked_songs[0].album == "Test Album"
         mock_spotify_instance.current_user_saved_tracks.assert_called_once()
 
 
@@ -89,7 +95,7 @@ def test_get_playlist_contents():
 
         # Assert
         assert len(tracks) == 1
-        assert tracks[0]["name"] == "Test Song"
+        assert tracks[0].name == "Test Song"
         mock_spotify_instance.playlist_items.assert_called_once_with("test_playlist_id")
 
 
@@ -119,6 +125,32 @@ def test_create_playlist():
         )
 
 
+def test_create_playlist_does_not_retry_timed_out_writes():
+    # Arrange
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.me.return_value = {"id": "test_user"}
+        mock_spotify_instance.user_playlist_create.side_effect = [
+            spotipy.SpotifyException(429, -1, "Too many requests"),
+            {"id": "new_playlist_id"},
+        ]
+        mock_spotify_instance.playlist_add_items.side_effect = requests.ReadTimeout()
+        client = SpotifyClient(auth_manager=MagicMock())
+
+        # Act
+        with (
+            patch.object(spotify_dependency, "_sleep"),
+            pytest.raises(requests.ReadTimeout),
+        ):
+            client.create_playlist("New Playlist", "", ["spotify:track:123"])
+
+    # Assert
+    # Rate limited requests were not carried out, so they are retried.
+    assert mock_spotify_instance.user_playlist_create.call_count == 2
+    # The tracks may have been added before the timeout.
+    mock_spotify_instance.playlist_add_items.assert_called_once()
+
+
 def test_search_songs():
     # Arrange
     mock_auth_manager = MagicMock()
@@ -149,8 +181,8 @@ def test_search_songs():
 
         # Assert
         assert len(songs) == 2
-        assert songs[0]["name"] == "Test Song"
-        assert songs[1]["name"] == "Another Song"
+        assert songs[0].name == "Test Song"
+        assert songs[1].name == "Another Song"
         mock_spotify_instance.search.assert_called_once_with(
             q="track:Test Artist", type="track", limit=2
         )
@@ -176,3 +208,129 @@ def test_search_songs_with_special_characters():
         mock_spotify_instance.search.assert_called_once_with(
             q=expected_query, type="track", limit=5
         )
+
+
+def test_iter_liked_songs_fetches_pages_lazily():
+    # Arrange
+    mock_auth_manager = MagicMock()
+
+    def saved_track(track_id):
+        return {
+            "track": {
+                "id": track_id,
+                "name": f"Song {track_id}",
+                "artists": [{"name": "Artist A"}, {"name": "Artist B"}],
+                "album": {"name": "Album"},
+            }
+        }
+
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.current_user_saved_tracks.return_value = {
+            "items": [saved_track("1"), saved_track("2")],
+            "next": "page2",
+        }
+        mock_spotify_instance.next.return_value = {
+            "items": [saved_track("3")],
+            "next": None,
+        }
+        client = SpotifyClient(auth_manager=mock_auth_manager)
+
+        # Act
+        songs = client.iter_liked_songs()
+        first_page = [next(songs), next(songs)]
+        fetched_before_second_page = mock_spotify_instance.next.call_count
+        rest = list(songs)
+
+        # Assert
+        assert [song.track_id for song in first_page] == ["1", "2"]
+        assert fetched_before_second_page == 0
+        assert [song.track_id for song in rest] == ["3"]
+        assert rest[0].artist == "Artist A, Artist B"
+        mock_spotify_instance.current_user_saved_tracks.assert_called_once_with(
+            limit=50
+        )
+
+
+def test_get_playlist_contents_skips_missing_tracks():
+    # Arrange
+    mock_auth_manager = MagicMock()
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.playlist_items.return_value = {
+            "items": [{"track": None}],
+            "next": None,
+        }
+        client = SpotifyClient(auth_manager=mock_auth_manager)
+
+        # Act
+        tracks = client.get_playlist_contents("test_playlist_id")
+
+        # Assert
+        assert tracks == []
+
+
+def test_tracks_are_shared_between_collections():
+    """Test that the same track in several collections is a single object."""
+    # Arrange
+    item = {
+        "track": {
+            "id": "shared",
+            "name": "Naima",
+            "artists": [{"name": "John Coltrane"}],
+            "album": {"name": "Giant Steps", "release_date": "1960-01-27"},
+        }
+    }
+    with patch("spotipy.Spotify") as mock_spotify:
+        spotify = mock_spotify.return_value
+        spotify.current_user_saved_tracks.return_value = {"items": [item], "next": None}
+        spotify.playlist_items.return_value = {"items": [item], "next": None}
+        client = SpotifyClient(auth_manager=MagicMock())
+
+        # Act
+        liked_songs = client.get_liked_songs()
+        playlist_tracks = client.get_playlist_contents("p1")
+
+    # Assert
+    assert liked_songs[0] is playlist_tracks[0]
+    assert liked_songs[0].release_year == 1960
+    assert liked_songs[0].to_dict() == {
+        "name": "Naima",
+        "artist": "John Coltrane",
+        "album": "Giant Steps",
+        "track_id": "shared",
+    }
+
+
+def test_concurrent_identical_fetches_are_coalesced():
+    """Test that concurrent fetches of the same playlist make one request."""
+    # Arrange
+    started = threading.Event()
+    waiting = threading.Event()
+
+    def playlist_items(playlist_id):
+        started.set()
+        waiting.wait(timeout=5)
+        return {"items": [], "next": None}
+
+    with (
+        patch("spotipy.Spotify") as mock_spotify,
+        patch("app.single_flight.logger.info", side_effect=lambda _: waiting.set()),
+    ):
+        spotify = mock_spotify.return_value
+        spotify.me.return_value = {"id": "alice"}
+        spotify.playlist_items.side_effect = playlist_items
+
+        # Act
+        with ThreadPoolExecutor() as executor:
+            first = executor.submit(
+                SpotifyClient(auth_manager=MagicMock()).get_playlist_contents, "p1"
+            )
+            started.wait(timeout=5)
+            second = executor.submit(
+                SpotifyClient(auth_manager=MagicMock()).get_playlist_contents, "p1"
+            )
+
+    # Assert
+    assert first.result() == second.result() == []
+    spotify.playlist_items.assert_called_once()
@@ -0,0 +1,186 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.tool_registry import (
+    ToolPolicy,
+    ToolRegistry,
+    ToolTimeoutError,
+    check_deadline,
+)
+
+
+@pytest.fixture
+def registry() -> ToolRegistry:
+    return ToolRegistry()
+
+
+def test_schema_is_generated_from_signature(registry: ToolRegistry):
+    # Arrange
+    @registry.tool()
+    def add_tracks(context, playlist_id: str, uris: list[str], limit: int) -> str:
+        """Adds tracks to a playlist.
+
+        Args:
+            playlist_id: The ID of the
+                playlist.
+            uris: The track URIs.
+        """
+        return playlist_id
+
+    # Act
+    schemas = registry.schemas
+
+    # Assert
+    assert schemas == [
+        {
+            "type": "function",
+            "name": "add_tracks",
+            "description": "Adds tracks to a playlist.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "playlist_id": {
+                        "type": "string",
+                        "description": "The ID of the playlist.",
+                    },
+                    "uris": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The track URIs.",
+                    },
+                    "limit": {"type": "integer"},
+                },
+                "required": ["playlist_id", "uris", "limit"],
+                "additionalProperties": False,
+            },
+            "strict": True,
+        }
+    ]
+
+
+def test_call_passes_context_and_arguments(registry: ToolRegistry):
+    # Arrange
+    @registry.tool()
+    def echo(context, text: str) -> str:
+        """Echoes."""
+        return f"{context}:{text}"
+
+    # Act & Assert
+    assert registry.call("echo", "ctx", '{"text": "hi"}') == "ctx:hi"
+
+
+def test_results_are_cached_per_scope(registry: ToolRegistry):
+    # Arrange
+    fetch = MagicMock(side_effect=lambda: object())
+
+    @registry.tool(ToolPolicy(cache_ttl=60))
+    def read(context) -> str:
+        """Reads."""
+        return fetch()
+
+    # Act
+    first = registry.call("read", None, "{}", scope="alice")
+    second = registry.call("read", None, "{}", scope="alice")
+    other = registry.call("read", None, "{}", scope="bob")
+
+    # Assert
+    assert first is second
+    assert other is not first
+    assert fetch.call_count == 2
+
+
+def test_writes_invalidate_cached_reads(registry: ToolRegistry):
+    # Arrange
+    fetch = MagicMock(side_effect=lambda: object())
+
+    @registry.tool(ToolPolicy(cache_ttl=60))
+    def read(context) -> str:
+        """Reads."""
+        return fetch()
+
+    @registry.tool(ToolPolicy(invalidates=("read",)))
+    def write(context) -> str:
+        """Writes."""
+        return "ok"
+
+    # Act
+    registry.call("read", None, "{}", scope="alice")
+    registry.call("write", None, "{}", scope="alice")
+    registry.call("read", None, "{}", scope="alice")
+
+    # Assert
+    assert fetch.call_count == 2
+
+
+def test_timeout(registry: ToolRegistry):
+    # Arrange
+    pages = []
+
+    @registry.tool(ToolPolicy(timeout=0.05))
+    def slow(context) -> str:
+        """Is slow."""
+        while True:
+            check_deadline()
+            pages.append(threading.current_thread())
+            time.sleep(0.01)
+
+    # Act & Assert
+    start = time.monotonic()
+    with pytest.raises(ToolTimeoutError):
+        registry.call("slow", None, "{}")
+    assert time.monotonic() - start < 1
+    # Tools run on the caller's thread.
+    assert set(pages) == {threading.current_thread()}
+    # The deadline only applies within the call.
+    check_deadline()
+
+
+def test_deadline_shortens_timeout(registry: ToolRegistry):
+    # Arrange
+    @registry.tool(ToolPolicy(timeout=60.0))
+    def slow(context) -> str:
+        """Is slow."""
+        while True:
+            check_deadline()
+            time.sleep(0.01)
+
+    # Act & Assert
+    start = time.monotonic()
+    with pytest.raises(ToolTimeoutError):
+        registry.call("slow", None, "{}", deadline=start + 0.05)
+    assert time.monotonic() - start < 1
+
+
+def test_max_concurrency(registry: ToolRegistry):
+    # Arrange
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    @registry.tool(ToolPolicy(max_concurrency=2))
+    def busy(context) -> str:
+        """Is busy."""
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return "ok"
+
+    # Act
+    threads = [
+        threading.Thread(target=registry.call, args=("busy", None, "{}"))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Assert
+    assert peak == 2
@@ -0,0 +1,85 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from app import tracing
+from app.chat_client import ChatResponse
+from app.tracing import TraceStore
+
+
+@pytest.fixture
+def store(tmp_path) -> TraceStore:
+    return TraceStore(str(tmp_path / "traces.sqlite"))
+
+
+def test_spans_form_a_tree_across_threads(store: TraceStore):
+    # Arrange
+    def work() -> None:
+        with tracing.span("worker", item=1):
+            pass
+
+    # Act
+    with tracing.trace(store, "root") as root:
+        with tracing.span("child"):
+            thread = threading.Thread(target=tracing.propagate(work))
+            thread.start()
+            thread.join()
+        with pytest.raises(ValueError), tracing.span("failing"):
+            raise ValueError("boom")
+
+    # Assert
+    spans = {s["name"]: s for s in store.get(root.trace_id)}
+    assert spans["root"]["parent_id"] is None
+    assert spans["child"]["parent_id"] == spans["root"]["span_id"]
+    assert spans["worker"]["parent_id"] == spans["child"]["span_id"]
+    assert spans["worker"]["attributes"] == {"item": 1}
+    assert spans["failing"]["error"] == "ValueError: boom"
+    assert tracing.current_trace_id() is None
+
+
+def test_span_outside_trace_is_not_recorded():
+    # Act
+    with tracing.span("orphan") as span:
+        pass
+
+    # Assert
+    assert span is None
+
+
+def test_chat_trace_is_viewable(client, app: Flask):
+    # Arrange
+    with patch("app.routes.get_chat_client") as mock_get_chat_client:
+        mock_get_chat_client.return_value.get_chat_completion.return_value = [
+            ChatResponse(conversation_history=[], response="Test response")
+        ]
+        client.get("/")
+
+        # Act
+        response = client.get("/chat?query=hello")
+        first_event = response.get_data(as_text=True).split("\n\n")[0]
+        trace_id = first_event.removeprefix('data: {"trace_id": "').removesuffix('"}')
+        page = client.get(f"/debug/traces/{trace_id}")
+        spans = client.get(f"/debug/traces/{trace_id}?format=json").get_json()
+
+    # Assert
+    assert page.status_code == 200
+    assert "routes.chat" in page.get_data(as_text=True)
+    assert {"routes.chat", "db.update_conversation"} <= {s["name"] for s in spans}
+
+
+def test_debug_routes_require_token(client, app: Flask):
+    # Arrange
+    app.config.update(TESTING=False, DEBUG_ROUTES_TOKEN="secret")
+
+    # Act & Assert
+    assert client.get("/debug/traces").status_code == 404
+    assert (
+        client.get("/debug/traces", headers={"X-Debug-Token": "wrong"}).status_code
+        == 404
+    )
+    assert (
+        client.get("/debug/traces", headers={"X-Debug-Token": "secret"}).status_code
+        == 200
+    )
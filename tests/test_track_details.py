@@ -0,0 +1,144 @@
+from collections.abc import Iterator
+from unittest.mock import MagicMock, patch
+
+import pytest
+import spotipy
+
+from app import spotify_client
+from app.spotify_client import SpotifyClient
+from app.track_details import TrackDetailsCache, track_id
+
+
+def spotify_track(track_id: str) -> dict:
+    return {
+        "id": track_id,
+        "name": f"Song {track_id}",
+        "artists": [{"name": "Miles Davis"}, {"name": "Bill Evans"}],
+        "album": {"name": "Kind of Blue", "release_date": "1959-08-17"},
+        "duration_ms": 337_000,
+        "popularity": 70,
+        "explicit": False,
+    }
+
+
+def tracks(ids: list[str]) -> dict:
+    # Spotify returns null for unknown ids.
+    return {"tracks": [None if i == "unknown" else spotify_track(i) for i in ids]}
+
+
+def audio_features(ids: list[str]) -> list[dict]:
+    return [{"id": i, "tempo": 136.0, "key": 2, "energy": 0.3} for i in ids]
+
+
+@pytest.fixture(autouse=True)
+def cache() -> Iterator[TrackDetailsCache]:
+    cache = TrackDetailsCache()
+    spotify_client._audio_features_unavailable.clear()
+    with patch("app.spotify_client.track_details_cache", cache):
+        yield cache
+    spotify_client._audio_features_unavailable.clear()
+
+
+@pytest.fixture
+def spotify() -> Iterator[MagicMock]:
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify_instance = mock_spotify.return_value
+        mock_spotify_instance.tracks.side_effect = tracks
+        mock_spotify_instance.audio_features.side_effect = audio_features
+        yield mock_spotify_instance
+
+
+def test_track_id_accepts_uris():
+    assert track_id("spotify:track:abc") == "abc"
+    assert track_id("abc") == "abc"
+
+
+def test_get_track_details_batches_requests(spotify: MagicMock):
+    # Arrange
+    ids = [f"t{i}" for i in range(120)]
+
+    # Act
+    details = SpotifyClient(auth_manager=MagicMock()).get_track_details(
+        ids + ["spotify:track:t0"]
+    )
+
+    # Assert
+    assert [d["track_id"] for d in details] == ids
+    # The batches run in parallel, so in any order.
+    batches = sorted(len(call.args[0]) for call in spotify.tracks.call_args_list)
+    assert batches == [20, 50, 50]
+    batches = sorted(len(c.args[0]) for c in spotify.audio_features.call_args_list)
+    assert batches == [20, 100]
+    assert details[0] == {
+        "track_id": "t0",
+        "name": "Song t0",
+        "artist": "Miles Davis, Bill Evans",
+        "album": "Kind of Blue",
+        "release_date": "1959-08-17",
+        "duration_seconds": 337,
+        "popularity": 70,
+        "explicit": False,
+        "tempo": 136.0,
+        "key": 2,
+        "mode": None,
+        "time_signature": None,
+        "danceability": None,
+        "energy": 0.3,
+        "valence": None,
+        "acousticness": None,
+        "instrumentalness": None,
+    }
+
+
+def test_get_track_details_leaves_out_unknown_tracks(spotify: MagicMock):
+    # Act
+    details = SpotifyClient(auth_manager=MagicMock()).get_track_details(
+        ["t1", "unknown"]
+    )
+
+    # Assert
+    assert [d["track_id"] for d in details] == ["t1"]
+
+
+def test_get_track_details_are_cached_across_clients(
+    spotify: MagicMock, cache: TrackDetailsCache
+):
+    # Arrange
+    SpotifyClient(auth_manager=MagicMock()).get_track_details(["t1", "t2"])
+    spotify.tracks.reset_mock()
+
+    # Act
+    details = SpotifyClient(auth_manager=MagicMock()).get_track_details(["t2", "t3"])
+
+    # Assert
+    assert [d["track_id"] for d in details] == ["t2", "t3"]
+    spotify.tracks.assert_called_once_with(["t3"])
+    assert len(cache.get_many(["t1", "t2", "t3"])) == 3
+
+
+def test_get_track_details_without_audio_features(spotify: MagicMock):
+    # Arrange
+    spotify.audio_features.side_effect = spotipy.SpotifyException(403, -1, "Forbidden")
+
+    # Act
+    first = SpotifyClient(auth_manager=MagicMock()).get_track_details(["t1"])
+    second = SpotifyClient(auth_manager=MagicMock()).get_track_details(["t2"])
+
+    # Assert
+    assert "tempo" not in first[0]
+    assert second[0]["track_id"] == "t2"
+    # Not asked again once refused.
+    spotify.audio_features.assert_called_once()
+
+
+def test_cache_evicts_least_recently_used():
+    # Arrange
+    cache = TrackDetailsCache(max_size=2)
+    cache.put_many([{"track_id": "a"}, {"track_id": "b"}])
+    cache.get_many(["a"])
+
+    # Act
+    cache.put_many([{"track_id": "c"}])
+
+    # Assert
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.spotify_client import SpotifyClient
+from app.track_resolver import TrackResolver
+from app.tracks import Track
+
+
+@pytest.fixture
+def resolver() -> TrackResolver:
+    resolver = TrackResolver()
+    resolver.add(
+        "alice",
+        [
+            Track("t1", "Naïma - Remastered", "John Coltrane", "Giant Steps"),
+            Track("t2", "The Boxer", "Simon & Garfunkel", "Bridge"),
+            Track(
+                "t3",
+                "Under Pressure",
+                "Queen, David Bowie",
+                "Hot Space",
+                artists=("Queen", "David Bowie"),
+            ),
+            Track(
+                "t4",
+                "September",
+                "Earth, Wind & Fire",
+                "The Best of",
+                artists=("Earth, Wind & Fire",),
+            ),
+            Track("t5", "Blue in Green", "Miles Davis", "Kind of Blue"),
+            Track("t6", "Blue in Green (Live)", "Miles Davis", "Live in Europe"),
+            Track("t7", "Naima (Live)", "John Coltrane", "Live at Birdland"),
+        ],
+    )
+    return resolver
+
+
+@pytest.mark.parametrize(
+    "title, artist, track_id",
+    [
+        ("Naima", "John Coltrane", "t1"),
+        ("Naimaa", "Jon Coltrane", "t1"),
+        ("the boxer", "Simon and Garfunkel", "t2"),
+        ("Under Pressure", "David Bowie", "t3"),
+        ("September", "Earth, Wind & Fire", "t4"),
+        ("Blue in Green", "Miles Davis", "t5"),
+        ("Blue in Green (Live)", "Miles Davis", "t6"),
+        ("Naima (Live)", "John Coltrane", "t7"),
+        ("Under Pressure (Live)", "Queen", None),
+        ("Giant Steps", "John Coltrane", None),
+        ("Naima", "Miles Davis", None),
+    ],
+)
+def test_resolve(resolver: TrackResolver, title: str, artist: str, track_id):
+    # Act
+    tracks = resolver.resolve("alice", title, artist)
+
+    # Assert
+    assert [track.track_id for track in tracks] == ([track_id] if track_id else [])
+
+
+def test_resolve_keeps_the_artists_from_spotify(resolver: TrackResolver):
+    # Act & Assert
+    assert resolver.resolve("alice", "September", "Wind") == []
+
+
+def test_resolve_returns_up_to_limit_versions(resolver: TrackResolver):
+    # Act
+    first = resolver.resolve("alice", "Naima", "John Coltrane")
+    both = resolver.resolve("alice", "Naima", "John Coltrane", limit=5)
+
+    # Assert
+    assert [track.track_id for track in first] == ["t1"]
+    assert [track.track_id for track in both] == ["t1", "t7"]
+
+
+def test_resolve_is_per_user(resolver: TrackResolver):
+    # Act & Assert
+    assert resolver.resolve("bob", "Naima", "John Coltrane") == []
+
+
+def test_search_songs_uses_seen_tracks(resolver: TrackResolver):
+    # Arrange
+    with patch("spotipy.Spotify") as mock_spotify:
+        spotify = mock_spotify.return_value
+        spotify.me.return_value = {"id": "alice"}
+        client = SpotifyClient(auth_manager=MagicMock(), track_resolver=resolver)
+
+        # Act
+        local = client.search_songs("Naima", "John Coltrane")
+        spotify.search.return_value = {"tracks": {"items": []}}
+        remote = client.search_songs("So What", "Miles Davis")
+
+    # Assert
+    assert [track.track_id for track in local] == ["t1", "t7"]
+    assert remote == []
+    spotify.search.assert_called_once()
@@ -0,0 +1,84 @@
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from app.codec import HistoryCodec
+from app.conversation_store import SQLiteConversationStore
+from app.write_behind import ConversationWriter
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    path = str(tmp_path / "db.sqlite")
+    store = SQLiteConversationStore(path)
+    store.create("a", [])
+    store.create("b", [])
+    return path
+
+
+def stored(path: str, conversation_id: str) -> list:
+    with sqlite3.connect(path) as db:
+        row = db.execute(
+            "SELECT history FROM conversation WHERE id = ?", (conversation_id,)
+        ).fetchone()
+    return HistoryCodec().decode(row[0])
+
+
+def test_writes_are_visible_before_they_are_committed(path: str):
+    # Arrange
+    writer = ConversationWriter(SQLiteConversationStore(path), interval=60)
+
+    # Act
+    writer.write("a", [{"role": "user", "content": "hi"}])
+
+    # Assert
+    assert writer.pending("a") == [{"role": "user", "content": "hi"}]
+    assert stored(path, "a") == []
+    assert writer.flush(timeout=5)
+    assert stored(path, "a") == [{"role": "user", "content": "hi"}]
+    assert writer.pending("a") is None
+
+
+def test_writes_of_an_interval_are_committed_together(path: str):
+    # Arrange
+    writer = ConversationWriter(SQLiteConversationStore(path), interval=60)
+    history: list = []
+
+    # Act
+    with patch("app.write_behind.logger.debug") as mock_debug:
+        for i in range(10):
+            history.append({"role": "user", "content": str(i)})
+            writer.write("a", history)
+        writer.write("b", [{"role": "user", "content": "b"}])
+        assert writer.flush(timeout=5)
+
+    # Assert
+    mock_debug.assert_called_once_with("Committed 2 conversations")
+    assert len(stored(path, "a")) == 10
+    assert stored(path, "b") == [{"role": "user", "content": "b"}]
+
+
+def test_discarded_writes_are_not_committed(path: str):
+    # Arrange
+    writer = ConversationWriter(SQLiteConversationStore(path), interval=60)
+    writer.write("a", [{"role": "user", "content": "hi"}])
+
+    # Act
+    writer.discard("a")
+
+    # Assert
+    assert writer.flush(timeout=1)
+    assert stored(path, "a") == []
+
+
+def test_close_commits_pending_writes(path: str):
+    # Arrange
+    writer = ConversationWriter(SQLiteConversationStore(path), interval=60)
+    writer.write("a", [{"role": "user", "content": "hi"}])
+
+    # Act
+    writer.close()
+
+    # Assert
+    assert stored(path, "a") == [{"role": "user", "content": "hi"}]